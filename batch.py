@@ -0,0 +1,151 @@
+"""
+Realizes many pieces to MusicXML files without opening a viewer.
+
+Pieces are realized concurrently in long-lived worker processes, so the interpreter and music21 imports are paid
+once per worker instead of once per piece. A worker picks up (and starts parsing) the next piece as soon as it is
+done with its current one, while the other workers are still realizing.
+"""
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from pathlib import Path
+from timeit import default_timer
+
+import chunk_cache
+import config
+import realization_arrays
+import realize
+import segment_table
+
+PIECES_DIR = Path(__file__).resolve().parent / 'test_pieces'
+SCORE_SUFFIXES = {'.musicxml', '.mxl', '.xml'}
+
+
+def collect_paths(specs, all_pieces=False):
+    """
+    Resolves piece specifications to score paths. A specification is a name from config.pieces, a directory
+    (all scores in it) or a glob pattern.
+    """
+    if all_pieces:
+        specs = list(config.pieces) + list(specs)
+
+    paths = []
+    for spec in specs:
+        if spec in config.pieces:
+            paths.append(PIECES_DIR / config.pieces[spec]['path'])
+        elif Path(spec).is_dir():
+            paths.extend(sorted(p for p in Path(spec).iterdir() if p.suffix in SCORE_SUFFIXES))
+        else:
+            matches = sorted(Path(p) for p in glob(spec, recursive=True))
+            if not matches:
+                raise FileNotFoundError(f"No pieces found for '{spec}'.")
+            paths.extend(matches)
+
+    # drop duplicates, keep order
+    return list(dict.fromkeys(p.resolve() for p in paths))
+
+
+def output_paths(paths, output_dir):
+    """
+    The MusicXML file in output_dir for every path, at the path relative to the directory all paths are in, so pieces
+    with the same name in different directories do not overwrite each other.
+    """
+    paths = [Path(p) for p in paths]
+    if not paths:
+        return []
+    root = Path(os.path.commonpath([p.parent for p in paths]))
+    return [Path(output_dir) / p.relative_to(root).with_suffix('.musicxml') for p in paths]
+
+
+def realize_to_file(path, output, start_measure=None, end_measure=None, arrays=False):
+    """
+    Realizes the piece at path into the MusicXML file output, and with arrays also stores the realized part as a
+    directory of realization_arrays. Returns a summary dict; failures are reported, not raised.
+    """
+    start = default_timer()
+    summary = {'piece': Path(path).name, 'bass_notes': 0, 'error': None, 'output': None}
+    try:
+        score = realize.load_score(path, start_measure, end_measure)
+        parts = score.parts
+        summary['bass_notes'] = len(parts[-1].flatten().notes)
+
+        realized_part, chunks = realize.realize_part(
+            parts[-1], score, cache=chunk_cache.from_config(), with_chunks=True
+        )
+        segment_table.current().save()
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        realize.create_score(parts, realized_part).write('musicxml', fp=output)
+        summary['output'] = str(output)
+        if arrays:
+            metadata = {'piece': Path(path).name, 'start': start_measure, 'end': end_measure}
+            realization_arrays.from_part(realized_part, metadata, chunks).save(output.with_suffix('.arrays'))
+    except Exception as e:  # one broken piece should not stop the batch
+        logging.exception(f'Failed realizing {path}')
+        summary['error'] = f'{type(e).__name__}: {e}'
+    summary['time'] = default_timer() - start
+    return summary
+
+
+def format_summary(summary):
+    status = 'ok' if summary['error'] is None else 'FAILED'
+    line = f"{summary['piece']}\t{status}\t{summary['time']:.2f}s\t{summary['bass_notes']} bass notes"
+    if summary['error'] is not None:
+        line += f"\t{summary['error']}"
+    return line
+
+
+def realize_batch(paths, output_dir, jobs=None, start_measure=None, end_measure=None, summary_file=None, arrays=False):
+    """Realizes all paths into output_dir and yields a summary per piece as soon as it is finished."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(realize_to_file, path, output, start_measure, end_measure, arrays)
+            for path, output in zip(paths, output_paths(paths, output_dir))
+        ]
+        for future in as_completed(futures):
+            summary = future.result()
+            if summary_file is not None:
+                print(format_summary(summary), file=summary_file, flush=True)
+            yield summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Realize many pieces to MusicXML files.")
+    parser.add_argument("pieces", nargs="*", help="Names from config.pieces, directories or glob patterns.")
+    parser.add_argument("-a", "--all", action="store_true", help="Realize all pieces in config.pieces.")
+    parser.add_argument("-o", "--output", type=Path, default=Path("realizations"), help="Output directory.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of pieces to realize concurrently.")
+    parser.add_argument("-s", "--start", type=int, help="Measure to start realizing from.", default=None)
+    parser.add_argument("-e", "--end", type=int, help="Measure to end realizing.", default=None)
+    parser.add_argument("-n", "--arrays", action="store_true", help="Also store the realizations as arrays.")
+    parser.add_argument("-L", "--logging", action=argparse.BooleanOptionalAction, default=False)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO if args.logging else logging.ERROR,
+        format='[%(asctime)s] %(levelname)s: %(message)s',
+        datefmt='%H:%M:%S',
+    )
+
+    piece_paths = collect_paths(args.pieces, all_pieces=args.all)
+    if not piece_paths:
+        parser.error("No pieces given, pass piece names, directories, globs or --all.")
+
+    num_failed = 0
+    args.output.mkdir(parents=True, exist_ok=True)
+    with open(args.output / 'summary.tsv', 'w') as f:
+        summaries = realize_batch(
+            piece_paths, args.output, args.jobs, args.start, args.end, summary_file=f, arrays=args.arrays
+        )
+        for piece_summary in summaries:
+            print(format_summary(piece_summary))
+            num_failed += piece_summary['error'] is not None
+
+    sys.exit(1 if num_failed else 0)
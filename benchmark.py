@@ -0,0 +1,213 @@
+"""
+Benchmarks the realization pipeline stage by stage over the pieces in config.pieces.
+
+Results are written as JSON and can be compared against a stored baseline, e.g.
+
+    python benchmark.py -o baseline.json
+    python benchmark.py --compare baseline.json
+
+The stages are those realize_part reports to its instrumentation, plus parsing. With --beam-width every piece is also
+realized with beam search, which is timed as the beam_search stage, and with the exhaustive search of search.py. The
+costs of both realizations are reported, and the gap of the beam search realization to the optimum.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+from pathlib import Path
+from timeit import default_timer
+
+import music21
+
+import config
+import instrumentation
+import realize
+import segment_table
+
+PIECES_DIR = Path(__file__).resolve().parent / 'test_pieces'
+STAGES = (
+    'parse', 'set_key', 'decide_cadences', 'split_on_rests', 'prepare', 'generate_optimal_realization',
+    'assemble_realization',
+)
+COUNTERS = (
+    'bass_notes', 'chunks', 'segments', 'segment_options', 'possibilities', 'rule_cache_hits', 'rule_cache_misses',
+)
+
+
+def recorded_realization(path, start_measure=None, end_measure=None, beam_width=None, use_search_module=None):
+    """
+    Parses and realizes the piece with realize_part under a Recorder, overriding config.use_search_module if given.
+    Returns the realized part and the recorder.
+
+    The segment table of the process is emptied first, so every run starts cold whatever ran before it. Rule costs are
+    memoized per realize_part call, and the score is parsed without its cache.
+    """
+    segment_table.current().clear()
+    recorder = instrumentation.Recorder()
+    previous = config.use_search_module
+    if use_search_module is not None:
+        config.use_search_module = use_search_module
+    try:
+        with instrumentation.recording(recorder):
+            with recorder.stage('parse'):
+                score = realize.load_score(path, start_measure, end_measure, use_cache=False)
+            recorder.count('bass_notes', len(score.parts[-1].flatten().notes))
+            realized_part = realize.realize_part(score.parts[-1], score, beam_width=beam_width)
+    finally:
+        config.use_search_module = previous
+    return realized_part, recorder
+
+
+def stage_timings(recorder, stages=STAGES):
+    timings = dict.fromkeys(stages, 0.0)
+    for event in recorder.stages():
+        if event.name in timings:
+            timings[event.name] += event.end - event.start
+    return timings
+
+
+def counter_totals(recorder, counters=COUNTERS):
+    totals = dict.fromkeys(counters)
+    for event in recorder.counters():
+        if event.name in totals:
+            totals[event.name] = (totals[event.name] or 0) + event.value
+    return totals
+
+
+def cost_gap(beam_cost, optimal_cost):
+    """The absolute and the relative excess of the cost of a beam search realization over the optimal cost."""
+    gap = beam_cost - optimal_cost
+    if optimal_cost:
+        return gap, gap / optimal_cost
+    return gap, 0.0 if gap == 0 else float('inf')
+
+
+def benchmark_piece(path, start_measure=None, end_measure=None, beam_width=None):
+    """
+    Realizes the piece once with realize_part, summing the time of every stage it reports. With beam_width the piece
+    is realized with beam search as well, whose search is timed as the beam_search stage, and with the exhaustive
+    search of search.py, which costs the same rules. The costs of both are reported, and the gap between them.
+    """
+    start = default_timer()
+    _, recorder = recorded_realization(path, start_measure, end_measure)
+    timings = stage_timings(recorder)
+    timings['total'] = default_timer() - start
+    counts = counter_totals(recorder)
+
+    if beam_width is not None:
+        _, beam_recorder = recorded_realization(path, start_measure, end_measure, beam_width)
+        timings['beam_search'], = stage_timings(beam_recorder, ['generate_optimal_realization']).values()
+        _, optimal_recorder = recorded_realization(path, start_measure, end_measure, use_search_module=True)
+        counts['beam_cost'] = counter_totals(beam_recorder, ['search_cost'])['search_cost'] or 0.0
+        counts['optimal_cost'] = counter_totals(optimal_recorder, ['search_cost'])['search_cost'] or 0.0
+        gap, relative_gap = cost_gap(counts['beam_cost'], counts['optimal_cost'])
+        counts['beam_cost_gap'], counts['beam_cost_gap_relative'] = gap, relative_gap
+    return timings, counts
+
+
+def run_benchmarks(piece_names, measure_ranges, repeat=1, beam_width=None):
+    """
+    Benchmarks every piece over every measure range. Stage timings are the minimum over the repeats, each of which
+    starts with cold caches (see recorded_realization).
+    """
+    results = []
+    for piece_name in piece_names:
+        path = PIECES_DIR / config.pieces[piece_name]['path']
+        for start_measure, end_measure in measure_ranges:
+            result = {'piece': piece_name, 'start': start_measure, 'end': end_measure, 'error': None}
+            logging.info(f'Benchmarking {piece_name} measures {start_measure}-{end_measure}')
+            try:
+                runs = [benchmark_piece(path, start_measure, end_measure, beam_width) for _ in range(repeat)]
+            except Exception as e:  # a failing piece is reported, not fatal
+                logging.exception(f'Failed benchmarking {piece_name}')
+                result['error'] = f'{type(e).__name__}: {e}'
+            else:
+                result['timings'] = {stage: min(timings[stage] for timings, _ in runs) for stage in runs[0][0]}
+                result['counts'] = runs[0][1]
+            results.append(result)
+    return results
+
+
+def result_key(result):
+    return result['piece'], result['start'], result['end']
+
+
+def compare(baseline, results, tolerance=0.2, min_delta=0.05):
+    """
+    Returns a description of every stage that got slower than the baseline by more than the relative tolerance
+    and by at least min_delta seconds, and of every run that fails now but did not in the baseline.
+    """
+    baseline_results = {result_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = baseline_results.get(result_key(result))
+        if old is None:
+            continue
+        name = '{} [{}-{}]'.format(*result_key(result))
+        if result['error'] is not None:
+            if old['error'] is None:
+                regressions.append(f"{name}: fails with {result['error']}")
+            continue
+        if old['error'] is not None:
+            continue
+        for stage, time in result['timings'].items():
+            old_time = old['timings'].get(stage)
+            if old_time is not None and time > old_time * (1 + tolerance) and time - old_time >= min_delta:
+                regressions.append(f'{name}: {stage} took {time:.3f}s, baseline {old_time:.3f}s')
+    return regressions
+
+
+def format_result(result):
+    name = '{} [{}-{}]'.format(*result_key(result))
+    if result['error'] is not None:
+        return f"{name}: FAILED {result['error']}"
+    stages = ', '.join(f'{stage} {time:.3f}s' for stage, time in result['timings'].items())
+    counts = ', '.join(f'{count} {value}' for count, value in result['counts'].items() if value is not None)
+    return f'{name}: {stages} ({counts})'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark realization stages over config.pieces.")
+    parser.add_argument("-p", "--piece", action="append", choices=config.pieces,
+                        help="Piece to benchmark, may be repeated. Defaults to all pieces.")
+    parser.add_argument("-r", "--range", nargs=2, type=int, action="append", metavar=("START", "END"),
+                        help="Measure range to benchmark, may be repeated. Defaults to config.benchmark_ranges.")
+    parser.add_argument("--full", action="store_true", help="Also benchmark the whole pieces.")
+    parser.add_argument("-n", "--repeat", type=int, default=1, help="Runs per measurement, the fastest counts.")
+    parser.add_argument("-o", "--output", type=Path, help="Write results as JSON to this file.")
+    parser.add_argument("-c", "--compare", type=Path, help="Baseline JSON to check for regressions.")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2, help="Allowed relative slowdown per stage.")
+    parser.add_argument("-b", "--beam-width", type=realize.positive_int, help="Also realize with beam search of this width.")
+    parser.add_argument("-L", "--logging", action=argparse.BooleanOptionalAction, default=False)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO if args.logging else logging.ERROR,
+        format='[%(asctime)s] %(levelname)s: %(message)s',
+        datefmt='%H:%M:%S',
+    )
+
+    measure_ranges = [tuple(r) for r in args.range or config.benchmark_ranges]
+    if args.full:
+        measure_ranges.append((None, None))
+
+    benchmark_results = run_benchmarks(args.piece or list(config.pieces), measure_ranges, args.repeat, args.beam_width)
+    for benchmark_result in benchmark_results:
+        print(format_result(benchmark_result))
+
+    if args.output:
+        report = {
+            'music21': music21.VERSION_STR,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': benchmark_results,
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        found_regressions = compare(json.loads(args.compare.read_text()), benchmark_results, args.tolerance)
+        for regression in found_regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if found_regressions else 0)
@@ -0,0 +1,179 @@
+"""
+Decides which dominant-tonic motions of the bass end a cadence.
+
+Every step of the bass from the dominant to the tonic is a candidate cadence. The candidates of a piece are collected
+in one pass before it is split into chunks and decided together by a provider, so deciding never stalls the
+realization of a chunk, and a human reviews all of them at once. The decision is stored on the tonic note as
+ends_cadence, which realize.set_ends_cadence hands to its segment.
+
+A provider is a callable taking the list of candidates and returning whether each of them ends a cadence:
+
+- accept_all: every candidate does,
+- classify: candidates whose tonic is the tonic of the estimated key (see realize.set_key) and falls on a beat do,
+- ask: asks on stdin once for all candidates,
+- DecisionFile: reads the decisions from a JSON file mapping locations to decisions, as written by write_decisions.
+
+A location is the measure number of the tonic with its offset in the measure, so a decision file of a piece also
+applies to excerpts of it and to every chunk, whatever offsets these start from.
+
+Running this module writes the candidates of a piece with the decisions of classify to such a file for review.
+"""
+import argparse
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+from music21 import common
+from music21.note import Rest
+from music21.stream import Measure
+
+import config
+
+
+@dataclass(frozen=True)
+class Candidate:
+    dominant: object  # bass notes
+    tonic: object
+    on_beat: int
+
+    @property
+    def location(self):
+        return location(self.tonic)
+
+    def __str__(self):
+        return f'{self.dominant.nameWithOctave} -> {self.tonic.nameWithOctave} at {self.location}'
+
+
+def beat_strength(offset, time_signature):
+    """2 on the beats of time_signature, 1 on other whole quarters and 0 elsewhere."""
+    return int(offset % 1 == 0) + int(offset % time_signature.beatDivisionCount == 0)
+
+
+def is_cadence_motion(dominant, tonic):
+    return int(dominant.ps) % 12 == (tonic.ps + 7) % 12
+
+
+def offset_key(offset):
+    return str(common.opFrac(offset))
+
+
+def location(note):
+    """
+    'measure:offset' of a note, the offset being from the start of its measure. Notes outside measures are located
+    by their offset alone.
+    """
+    measure = note.getContextByClass(Measure)
+    if measure is None or measure.number is None:
+        return offset_key(note.offset)
+    return f'{measure.measureNumberWithSuffix()}:{offset_key(note.getOffsetInHierarchy(measure))}'
+
+
+def find_candidates(bass, time_signature):
+    """The candidate cadences of a bass part, in one pass. Rests separate the notes as they separate chunks."""
+    candidates = []
+    previous = None
+    for element in bass.flatten().notesAndRests:
+        if isinstance(element, Rest):
+            previous = None
+            continue
+        if previous is not None and is_cadence_motion(previous.pitch, element.pitch):
+            candidates.append(Candidate(previous, element, beat_strength(element.offset, time_signature)))
+        previous = element
+    return candidates
+
+
+def accept_all(candidates):
+    return [True] * len(candidates)
+
+
+def classify(candidates):
+    """A candidate ends a cadence if its tonic is the tonic of the estimated key and falls on a beat."""
+    return [
+        getattr(candidate.tonic, 'key_pitch_class', None) == candidate.tonic.pitch.pitchClass and candidate.on_beat > 0
+        for candidate in candidates
+    ]
+
+
+def ask(candidates, read=input):
+    """Lists all candidates and asks which of them are cadences in a single question."""
+    if not candidates:
+        return []
+    print("Candidate cadences:")
+    for i, candidate in enumerate(candidates):
+        print(f"{i}: {candidate}")
+    print("Which are cadences? (numbers separated by spaces, 'all' or 'none')")
+    while True:
+        answer = read().lower().replace(',', ' ').strip()
+        if answer == 'all':
+            return accept_all(candidates)
+        try:
+            chosen = set() if answer in ('', 'none') else {int(i) for i in answer.split()}
+        except ValueError:
+            chosen = None
+        if chosen is not None and all(0 <= i < len(candidates) for i in chosen):
+            return [i in chosen for i in range(len(candidates))]
+        print(f"Answer with numbers from 0 to {len(candidates) - 1}, 'all' or 'none'.")
+
+
+class DecisionFile:
+    """Decisions read from a JSON file mapping locations to decisions. Locations it does not list go to fallback."""
+
+    def __init__(self, path, fallback=accept_all):
+        with open(path) as f:
+            self.decisions = json.load(f)
+        self.fallback = fallback
+
+    def __call__(self, candidates):
+        decisions = [self.decisions.get(candidate.location) for candidate in candidates]
+        missing = [i for i, decision in enumerate(decisions) if decision is None]
+        for i, decision in zip(missing, self.fallback([candidates[i] for i in missing])):
+            decisions[i] = decision
+        return decisions
+
+
+def write_decisions(path, candidates, decisions):
+    with open(path, 'w') as f:
+        json.dump({c.location: bool(d) for c, d in zip(candidates, decisions)}, f, indent=2)
+
+
+PROVIDERS = {'all': accept_all, 'auto': classify, 'ask': ask}
+
+
+def from_config():
+    """The provider configured in config."""
+    provider = 'ask' if config.interactively_ask_cadence else config.cadence_provider
+    provider = PROVIDERS[provider] if isinstance(provider, str) else provider
+    if config.cadence_decisions is not None:
+        return DecisionFile(config.cadence_decisions, fallback=provider)
+    return provider
+
+
+def decide(candidates, provider=None):
+    """Decides the candidates with provider (the configured one by default) and stores the decisions."""
+    provider = provider or from_config()
+    decisions = provider(candidates) if candidates else []
+    for candidate, decision in zip(candidates, decisions):
+        candidate.tonic.ends_cadence = bool(decision)
+    return decisions
+
+
+def decide_piece(bass, time_signature, provider=None):
+    return decide(find_candidates(bass, time_signature), provider)
+
+
+if __name__ == '__main__':
+    import realize
+
+    parser = argparse.ArgumentParser(description="Write the candidate cadences of a piece with suggested decisions.")
+    parser.add_argument("-p", "--piece", choices=config.pieces, default=config.default_piece)
+    parser.add_argument("-o", "--output", type=Path, help="Decision file to write.", required=True)
+    args = parser.parse_args()
+
+    score = realize.load_score(Path.cwd() / "test_pieces" / config.pieces[args.piece]["path"])
+    basso_continuo = score.parts[-1].flatten()
+    realize.set_key(basso_continuo, score)
+    piece_candidates = find_candidates(basso_continuo, basso_continuo.timeSignature)
+    piece_decisions = classify(piece_candidates)
+    write_decisions(args.output, piece_candidates, piece_decisions)
+    for piece_candidate, piece_decision in zip(piece_candidates, piece_decisions):
+        print(f"{'cadence' if piece_decision else '-'}\t{piece_candidate}")
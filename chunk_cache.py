@@ -0,0 +1,93 @@
+"""
+On-disk cache of realized chunks.
+
+realize_part realizes the chunks between rests independently, so a chunk whose inputs did not change can reuse its
+previous realization. Chunks are keyed by a hash of everything that goes into realizing them: the bass notes with
+their figures, key estimates and cadence decisions, the melody notes and dynamics sounding over them, the dynamic
+handed in from the previous chunk, the metric position, the time and key signature, the rule set and the search
+(exhaustive or beam search of some width).
+"""
+import hashlib
+import pickle
+
+import music21
+from music21 import key
+from music21.dynamics import Dynamic
+
+import config
+import rule_cache
+from score_cache import DiskCache
+
+# bump when the realization pipeline in this repository changes what it produces
+CACHE_VERSION = 2
+
+
+def note_fingerprint(note):
+    return (
+        float(note.offset),
+        float(note.duration.quarterLength),
+        tuple(p.nameWithOctave for p in note.pitches),
+        note.tie.type if note.tie is not None else None,
+    )
+
+
+def bass_fingerprint(bass):
+    notes = bass.flatten().notes
+    first_measure = notes[0].measureNumber if len(notes) and notes[0].measureNumber is not None else 0
+    key_signature = bass.flatten()[key.KeySignature].first()
+    return (
+        key_signature.sharps if key_signature is not None else None,
+        tuple(
+            note_fingerprint(note) + (
+                tuple(lyric.text for lyric in note.lyrics),
+                getattr(note, 'notationString', None),
+                getattr(note, 'key_pitch_class', None),
+                getattr(note, 'key_name', None),
+                getattr(note, 'ends_cadence', None),
+                note.measureNumber - first_measure if note.measureNumber is not None else None,
+            )
+            for note in notes
+        ),
+    )
+
+
+def melody_fingerprint(melody, end_offset):
+    """The notes and dynamics of a melody part up to end_offset, the rest cannot influence the chunk."""
+    return (
+        tuple(note_fingerprint(note) for note in melody.flatten().notes if note.offset < end_offset),
+        tuple((float(d.offset), d.value) for d in melody.getElementsByClass(Dynamic) if d.offset <= end_offset),
+    )
+
+
+def chunk_key(bass, melodies, prev_dynamic, rule_set, start_offset, time_signature, beam_width=None):
+    """Returns the hex digest identifying a chunk's realization."""
+    bar_length = time_signature.barDuration.quarterLength
+    digest = hashlib.sha256()
+    digest.update(pickle.dumps((
+        CACHE_VERSION,
+        music21.VERSION_STR,
+        config.interactively_ask_cadence,
+        bass_fingerprint(bass),
+        tuple(melody_fingerprint(melody, bass.highestTime) for melody in melodies),
+        prev_dynamic,
+        # metric position of the chunk, the measure and beat positions of its segments depend on it
+        float(start_offset % bar_length),
+        float(start_offset % time_signature.beatDivisionCount),
+        time_signature.ratioString,
+        beam_width,
+        config.use_search_module,
+        config.vectorized_search,
+        rule_cache.rule_set_fingerprint(rule_set),
+    )))
+    return digest.hexdigest()
+
+
+class ChunkCache(DiskCache):
+    key = staticmethod(chunk_key)
+
+
+def from_config():
+    """The chunk cache configured in config, or None if disabled."""
+    if config.chunk_cache_dir is None:
+        return None
+    return ChunkCache(config.chunk_cache_dir, config.chunk_cache_max_size)
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 default_piece = "test_maat"
 
 pieces = {
@@ -16,3 +18,45 @@ pieces = {
 }
 
 interactively_ask_cadence = False
+
+# How dominant-tonic bass motions are decided to end cadences: 'all', 'auto' (by the estimated key and the beat), 'ask'
+# (all candidates of a piece at once, on stdin) or a callable, see cadences.py. interactively_ask_cadence implies
+# 'ask'. Decisions in the JSON file cadence_decisions take precedence.
+cadence_provider = 'all'
+cadence_decisions = None
+
+# Length in quarter notes of the windows the key is estimated over.
+key_window_size = 12
+
+# Width of the beam search realizing the chunks, None searches exhaustively for the optimal realization.
+beam_width = None
+
+# Search the realization of the chunks with search.py also without beam_width, instead of the fork's
+# generate_optimal_realization. Both find the optimal realization, search.py reports its cost.
+use_search_module = False
+
+# Score the transition rules voice_leading implements (parallel and hidden fifths) on all pairs of possibilities of
+# consecutive segments at once, and search exhaustively with voice_leading.optimal_path. Implies use_search_module.
+vectorized_search = False
+
+# Number of rule costs kept in the memo shared by the chunks of a piece, 0 evaluates every rule every time.
+rule_cache_size = 2 ** 18
+
+# Reuse the initialization of segments equal to one initialized before, and keep the table of them at
+# segment_table_path across runs (None keeps it in memory only).
+use_segment_table = True
+segment_table_path = None
+
+# Parsed scores are cached here by file content, within score_cache_max_size. Set to None to always parse.
+score_cache_dir = Path.home() / ".cache" / "fb-realizer" / "scores"
+score_cache_max_size = 2 * 1024 ** 3  # bytes
+
+# Seconds server.py waits for a realization before answering a request with an error, None waits indefinitely.
+server_timeout = 60
+
+# Measure ranges benchmark.py runs every piece over.
+benchmark_ranges = [(0, 4), (0, 16)]
+
+# Realized chunks are cached here so unchanged chunks are not realized again, set to a directory to enable.
+chunk_cache_dir = None
+chunk_cache_max_size = 2 * 1024 ** 3  # bytes
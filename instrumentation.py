@@ -0,0 +1,168 @@
+"""
+Instrumentation hooks for the realization pipeline.
+
+The pipeline reports stages (with start and end) and counters to the instrumentation returned by current(). By
+default that is a no-op Instrumentation, so reporting costs next to nothing. To inspect a run, record it:
+
+    recorder = Recorder()
+    with recording(recorder):
+        realize_from_path(path, None, None)
+    print(recorder.summary())
+    recorder.write_chrome_trace('trace.json')  # open in chrome://tracing or Perfetto
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from timeit import default_timer
+
+_NO_STAGE = nullcontext()
+
+
+class Instrumentation:
+    """Receives events from the realization pipeline. This base class ignores them."""
+
+    enabled = False
+
+    def stage(self, name, **args):
+        """Context manager around a stage of the pipeline, args describe it (e.g. the chunk index)."""
+        return _NO_STAGE
+
+    def count(self, name, value, **args):
+        """Reports a counter, e.g. the number of segments of a chunk."""
+
+
+@dataclass
+class Event:
+    name: str
+    start: float
+    end: float | None = None  # None for counters
+    value: float | None = None
+    args: dict = field(default_factory=dict)
+    pid: int = 0
+    tid: int = 0
+
+
+class Recorder(Instrumentation):
+    """Instrumentation that keeps all events, to be exported as a Chrome trace or summarized as text."""
+
+    enabled = True
+
+    def __init__(self):
+        self.events: list[Event] = []
+        self.origin = default_timer()
+
+    @contextmanager
+    def stage(self, name, **args):
+        event = Event(name, default_timer(), args=args, pid=os.getpid(), tid=threading.get_ident())
+        try:
+            yield event
+        finally:
+            event.end = default_timer()
+            self.events.append(event)
+
+    def count(self, name, value, **args):
+        self.events.append(Event(name, default_timer(), value=value, args=args, pid=os.getpid()))
+
+    def extend(self, events):
+        """Adds events recorded elsewhere, e.g. by a worker process."""
+        self.events.extend(events)
+
+    def stages(self):
+        return [event for event in self.events if event.end is not None]
+
+    def counters(self):
+        return [event for event in self.events if event.end is None]
+
+    def to_chrome_trace(self):
+        trace_events = []
+        for event in self.events:
+            trace_event = {
+                'name': event.name,
+                'ts': (event.start - self.origin) * 1e6,
+                'pid': event.pid,
+                'tid': event.tid,
+            }
+            if event.end is not None:
+                trace_event.update(ph='X', cat='stage', dur=(event.end - event.start) * 1e6, args=event.args)
+            else:
+                trace_event.update(ph='C', cat='counter', args={event.name: event.value})
+            trace_events.append(trace_event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+    def summary(self, slowest=5):
+        """Text summary: time per stage, counter totals and the slowest individual stages."""
+        totals = {}
+        for event in self.stages():
+            calls, total, longest = totals.get(event.name, (0, 0.0, 0.0))
+            duration = event.end - event.start
+            totals[event.name] = (calls + 1, total + duration, max(longest, duration))
+
+        lines = [f"{'stage':<32}{'calls':>8}{'total (s)':>12}{'max (s)':>12}"]
+        for name, (calls, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append(f'{name:<32}{calls:>8}{total:>12.3f}{longest:>12.3f}')
+
+        counter_totals = {}
+        for event in self.counters():
+            counter_totals[event.name] = counter_totals.get(event.name, 0) + event.value
+        if counter_totals:
+            lines.append('')
+            lines.append(f"{'counter':<32}{'total':>8}")
+            for name, total in counter_totals.items():
+                lines.append(f'{name:<32}{total:>8g}')
+
+        if slowest:
+            lines.append('')
+            lines.append('slowest stages:')
+            for event in sorted(self.stages(), key=lambda e: e.start - e.end)[:slowest]:
+                args = ', '.join(f'{key}={value}' for key, value in event.args.items())
+                lines.append(f'  {event.end - event.start:8.3f}s  {event.name}({args})')
+        return '\n'.join(lines)
+
+
+_current = Instrumentation()
+
+
+def current() -> Instrumentation:
+    return _current
+
+
+@contextmanager
+def recording(instrumentation: Instrumentation):
+    """Makes instrumentation receive the pipeline's events within the context."""
+    global _current
+    previous = _current
+    _current = instrumentation
+    try:
+        yield instrumentation
+    finally:
+        _current = previous
+
+
+def count_possibilities(segment):
+    """Number of possibilities of a segment, or None if the segment does not expose them."""
+    possibilities = getattr(segment, 'possibilities', None)
+    if possibilities is None:
+        return None
+    return len(possibilities)
+
+
+def report_segments(instrumentation: Instrumentation, segments, **args):
+    """
+    Reports the segment count and, if known, the segment options, possibilities per segment and transitions between
+    them.
+    """
+    instrumentation.count('segments', len(segments), **args)
+    if segments and all(hasattr(segment, 'segment_options') for segment in segments):
+        instrumentation.count('segment_options', sum(len(segment.segment_options) for segment in segments), **args)
+    possibilities = [count_possibilities(segment) for segment in segments]
+    if not segments or None in possibilities:
+        return
+    instrumentation.count('possibilities', sum(possibilities), per_segment=possibilities, **args)
+    transitions = sum(a * b for a, b in zip(possibilities, possibilities[1:]))
+    instrumentation.count('transitions', transitions, **args)
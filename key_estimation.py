@@ -0,0 +1,136 @@
+"""
+Sliding-window key estimation with the Krumhansl-Kessler profiles.
+
+Gives the same keys as music21's WindowedAnalysis with KrumhanslKessler over windows of whole quarter notes, without
+restructuring the score into measures and analysing every window separately. The duration of every pitch class
+sounding before each quarter is accumulated once, so the histogram of any window is a difference of two rows, and
+all windows are correlated with the 24 key profiles in one matrix product.
+"""
+import math
+from fractions import Fraction
+
+import numpy as np
+from music21.analysis.discrete import KrumhanslKessler
+from music21.pitch import Pitch
+
+MODES = ('major', 'minor')
+
+
+def key_profiles():
+    """Returns the 24 key profiles as rows, the key with tonic pitch class pc in mode m at row 2 * pc + m."""
+    analyzer = KrumhanslKessler()
+    return np.array([np.roll(analyzer.getWeights(mode), pc) for pc in range(12) for mode in MODES], dtype=float)
+
+
+def key_names():
+    """Returns the tonic names of the 24 keys, spelled as KrumhanslKessler spells them."""
+    names = []
+    for pc in range(12):
+        for valid in (KrumhanslKessler.keysValidMajor, KrumhanslKessler.keysValidMinor):
+            tonic = Pitch(pc)
+            names.append(tonic.name if tonic.name in valid else tonic.getEnharmonic().name)
+    return names
+
+
+KEY_PROFILES = key_profiles()
+KEY_NAMES = key_names()
+TIE_TOLERANCE = 1e-9
+MAX_DENOMINATOR = 2 ** 12
+
+
+def music21_duration(value):
+    """
+    Returns the duration value that music21 would have summed: differences of running sums are off by rounding,
+    while music21 adds up exact quarter lengths, floats where they are binary fractions and Fractions otherwise.
+    """
+    value = Fraction(float(value)).limit_denominator(MAX_DENOMINATOR)
+    if value == 0:
+        return 0
+    if value.denominator & (value.denominator - 1) == 0:
+        return float(value)
+    return value
+
+
+def correlation(histogram, key):
+    """
+    Correlation of the histogram with the profile of key, summed in the order KrumhanslKessler sums it. Keys that
+    are tied in exact arithmetic (symmetric histograms, such as an augmented triad) are told apart by rounding,
+    which only matches KrumhanslKessler when it is computed the same way.
+    """
+    weights = KEY_PROFILES[key % 2].tolist()  # the profiles with tonic C, in the order of getWeights
+    pc = key // 2
+    histogram = [music21_duration(h) for h in histogram]
+    profile_average = sum(weights) / len(weights)
+    histogram_average = sum(histogram) / len(histogram)
+    top = bottom_right = bottom_left = 0.0
+    for j in range(12):
+        top += (weights[(j - pc) % 12] - profile_average) * (histogram[j] - histogram_average)
+        bottom_right += (weights[(j - pc) % 12] - profile_average) ** 2
+        bottom_left += (histogram[j] - histogram_average) ** 2
+    if bottom_right == 0 or bottom_left == 0:
+        return 0.0
+    return top / ((bottom_right * bottom_left) ** 0.5)
+
+
+def break_tie(histogram, correlations):
+    """Returns the best of the keys whose correlations are within TIE_TOLERANCE of the best one."""
+    candidates = np.flatnonzero(correlations >= correlations.max() - TIE_TOLERANCE)
+    return max(candidates, key=lambda k: (correlation(histogram, k), k // 2, k % 2))
+
+
+def pitch_class_durations(score):
+    """
+    Returns an array with at row t the duration of every pitch class sounding before quarter t, for t from 0 to
+    the end of the score rounded up to a whole quarter. Chords count the full duration for each of their pitches.
+    """
+    flat = score.flatten()
+    n_quarters = math.ceil(flat.highestTime)
+    starts, ends, pitch_classes = [], [], []
+    for n in flat.notes:
+        offset = float(n.offset)
+        for p in n.pitches:
+            starts.append(offset)
+            ends.append(offset + float(n.quarterLength))
+            pitch_classes.append(p.pitchClass)
+
+    # the duration before quarter t is t * #(starts < t) - sum(starts < t) - (t * #(ends < t) - sum(ends < t))
+    totals = np.zeros((4, n_quarters + 1, 12))
+    for i, times in enumerate((np.array(starts), np.array(ends))):
+        bins = np.minimum(np.floor(times).astype(int) + 1, n_quarters)
+        np.add.at(totals[2 * i], (bins, pitch_classes), 1)
+        np.add.at(totals[2 * i + 1], (bins, pitch_classes), times)
+    totals = np.cumsum(totals, axis=1)
+    quarters = np.arange(n_quarters + 1)[:, None]
+    return quarters * (totals[0] - totals[2]) - totals[1] + totals[3]
+
+
+def estimate_keys(score, window_size):
+    """
+    Estimates the key of every window of window_size quarters, the windows starting at every quarter of the score.
+    Returns the tonic pitch classes and tonic names of the windows. A window without notes gets the key of the window
+    before it (or after it, at the start of the score).
+    """
+    durations = pitch_class_durations(score)
+    histograms = durations[window_size:] - durations[:-window_size]
+    n_windows = len(histograms)
+
+    centered = histograms - histograms.mean(axis=1, keepdims=True)
+    profiles = KEY_PROFILES - KEY_PROFILES.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centered, axis=1, keepdims=True) * np.linalg.norm(profiles, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlations = np.where(norms > 0, (centered @ profiles.T) / norms, 0.0)
+
+    # ties go to the higher tonic and to minor, as in KrumhanslKessler, so take the last maximum
+    keys = len(KEY_PROFILES) - 1 - np.argmax(correlations[:, ::-1], axis=1)
+    has_notes = ~np.isclose(histograms.sum(axis=1), 0)
+    near_ties = np.sum(correlations >= correlations.max(axis=1, keepdims=True) - TIE_TOLERANCE, axis=1) > 1
+    for i in np.flatnonzero(near_ties & has_notes):
+        keys[i] = break_tie(histograms[i], correlations[i])
+
+    if has_notes.any():
+        windows = np.arange(n_windows)
+        previous = np.maximum.accumulate(np.where(has_notes, windows, -1))
+        first = np.argmax(has_notes)
+        keys = keys[np.where(previous >= 0, previous, first)]
+
+    return keys // 2, [KEY_NAMES[k] for k in keys]
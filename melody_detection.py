@@ -1,9 +1,17 @@
 """
 Module implementing algorithm for notes detection given in "Discovering Patterns in Musical Sequences".
 """
-from collections import defaultdict
+import copy
+import heapq
+import math
+import time
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
+from itertools import accumulate
+from multiprocessing.shared_memory import SharedMemory
 
+import numpy as np
 from tqdm import tqdm
 
 from music21.note import GeneralNote
@@ -26,24 +34,128 @@ def overlap(m1: Melody, m2: Melody) -> bool:
     return m1.index + m1.length > m2.index
 
 
-def detect_melody(score: Score, min_length=1, max_length=None, max_length_difference=1) -> Melody:
+def pitch_key(note: GeneralNote):
+    """
+    Returns a hashable key that is equal for two notes exactly when their pitches compare equal,
+    i.e. same octave, step, accidental and microtone.
+    """
+    pitches = note.pitches
+    return tuple(
+        (p.octave, p.step, p.accidental.name if p.accidental is not None else None, p.microtone.cents)
+        for p in pitches
+    )
+
+
+def encode_notes(notes: list[GeneralNote]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes notes as integer pitch codes, equal codes meaning equal pitches. Returns the codes and a mask that is
+    True for rests.
+    """
+    codes = {}
+    pitch_codes = np.full(len(notes), -1, dtype=np.int64)
+    rests = np.zeros(len(notes), dtype=bool)
+    for i, note in enumerate(notes):
+        if note.isRest:
+            rests[i] = True
+        else:
+            pitch_codes[i] = codes.setdefault(pitch_key(note), len(codes))
+    return pitch_codes, rests
+
+
+def detect_melody(
+        score: Score, min_length=1, max_length=None, max_length_difference=1, streaming=False, jobs=1
+) -> Melody:
     merged_parts: list[GeneralNote] = list(score.parts[0].flatten().notesAndRests)
     for part in score.parts[1:]:
         notes_and_rests = list(part.flatten().notesAndRests)
         merged_parts += notes_and_rests
 
-    md = RepeatedPatternFinder(
-        merged_parts,
-        min_length=min_length,
-        max_length=max_length,
-        max_length_difference=max_length_difference
-    )
+    if max_length_difference == 0:
+        md = ExactRepeatFinder(merged_parts, min_length=min_length, max_length=max_length)
+    else:
+        md = RepeatedPatternFinder(
+            merged_parts,
+            min_length=min_length,
+            max_length=max_length,
+            max_length_difference=max_length_difference,
+            streaming=streaming,
+            jobs=jobs,
+        )
     return md.get_best_melody()
 
 
+class SimilarityGraph(Mapping):
+    """
+    Read-only view of the similarity DP of a RepeatedPatternFinder as graph[m1][m2] = similarity, for melodies
+    m1 = Melody(i, l1), m2 = Melody(j, l2) with i < j. The values live in one n x n array per (l1, l2) layer.
+    """
+
+    def __init__(self, layers: dict[tuple[int, int], np.ndarray], num_notes: int):
+        self.layers = layers
+        self.num_notes = num_notes
+        self.neighbor_lengths = {}
+        for length1, length2 in layers:
+            self.neighbor_lengths.setdefault(length1, []).append(length2)
+
+    def neighbor_indices(self, m1: Melody, length: int) -> range:
+        """Indices j for which Melody(j, length) is a neighbor of m1."""
+        if (m1.length, length) not in self.layers or m1.index < 0:
+            return range(0)
+        if m1.length == 0 or length == 0:
+            # base case, not bounded by the end of the notes
+            return range(m1.index + 1, self.num_notes)
+        if m1.index + m1.length > self.num_notes:
+            return range(0)
+        return range(m1.index + 1, self.num_notes - length + 1)
+
+    def __getitem__(self, m1: Melody):
+        return SimilarityRow(self, m1)
+
+    def __iter__(self):
+        for length in self.neighbor_lengths:
+            for index in range(self.num_notes):
+                if len(self[Melody(index, length)]) > 0:
+                    yield Melody(index, length)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class SimilarityRow(Mapping):
+    """The neighbors of a single melody in a SimilarityGraph."""
+
+    def __init__(self, graph: SimilarityGraph, melody: Melody):
+        self.graph = graph
+        self.melody = melody
+
+    def __getitem__(self, m2: Melody):
+        if m2 not in self:
+            raise KeyError(m2)
+        return int(self.graph.layers[self.melody.length, m2.length][self.melody.index, m2.index])
+
+    def __contains__(self, m2):
+        return isinstance(m2, Melody) and m2.index in self.graph.neighbor_indices(self.melody, m2.length)
+
+    def __iter__(self):
+        for length in self.graph.neighbor_lengths.get(self.melody.length, []):
+            for j in self.graph.neighbor_indices(self.melody, length):
+                yield Melody(j, length)
+
+    def __len__(self):
+        return sum(len(self.graph.neighbor_indices(self.melody, length))
+                   for length in self.graph.neighbor_lengths.get(self.melody.length, []))
+
+
 class RepeatedPatternFinder:
     """
     Helper class to implement the notes detection approach.
+
+    By default the whole similarity graph is kept in memory. With streaming=True only the prominences needed by
+    get_best_melody are computed, block_size rows of the DP at a time, so memory stays linear in the number of notes.
+
+    The rows of the DP do not depend on each other, so with jobs other than 1 blocks of block_size rows are filled by
+    that many worker processes (None for one per core). They write the similarity graph into shared memory, or send
+    back the prominences of their rows when streaming. The results are identical to those of a single process.
     """
 
     SIMILARITY_THRESHOLD = 1
@@ -55,9 +167,13 @@ class RepeatedPatternFinder:
             max_length=None,
             max_length_difference=1,
             min_duration=0,
-            max_duration=float('inf')
+            max_duration=float('inf'),
+            streaming=False,
+            block_size=64,
+            jobs=1,
     ):
         self.notes = list(notes)
+        self.num_notes = len(self.notes)
 
         self.min_length = min_length
         self.max_length = max_length or len(self.notes)
@@ -66,82 +182,218 @@ class RepeatedPatternFinder:
         self.min_duration = min_duration
         self.max_duration = max_duration
 
+        self.streaming = streaming
+        self.block_size = block_size
+        self.jobs = jobs
+
         self._similarity_graph = None
+        self._prominences = None
+        self.pitch_codes, self.rests = encode_notes(self.notes)
 
     def get_best_melody(self) -> Melody:
-        if self._similarity_graph is None:
+        top = self.get_top_melodies(1)
+        return top[0][0] if top else None
+
+    def get_top_melodies(self, k, deadline=None) -> list[tuple[Melody, int]]:
+        """
+        Returns the k most prominent melodies within the length and duration limits with their prominences, best
+        first. Ties go to the shorter and then the earlier melody, so the first one is the best melody.
+
+        Lengths are scored in decreasing order of an upper bound on their prominences (see prominence_bounds), and
+        only the rows whose bound reaches the k-th best prominence found so far are scored. Once time.monotonic()
+        passes deadline, the best melodies found until then are returned, scoring at least the most promising length.
+        """
+        if self.streaming and self._prominences is None:
+            self.set_prominences()
+        elif not self.streaming and self._similarity_graph is None:
             self.set_similarity_graph()
-
-        best_melody = None
-        best_prominence = -float('inf')
-
-        for length in range(self.min_length, self.max_length + 1):
-            duration = sum([self.notes[i].duration.quarterLength for i in range(length)])
-            for index in range(len(self.notes) - length + 1):
-                melody = Melody(index, length)
-                if (
-                    self.min_duration <= duration <= self.max_duration and
-                    (prominence := self.prominence(melody)) > best_prominence
-                ):
-                    best_melody = melody
-                    best_prominence = prominence
-
-                if index + length < len(self.notes):
-                    next_note_quarter_length = self.notes[index + length].duration.quarterLength
-                    duration -= self.notes[index].duration.quarterLength - next_note_quarter_length
-
-        return best_melody
+        if k <= 0:
+            return []
+
+        neighbor_lengths = {}
+        for length1, length2 in self.layer_lengths():
+            neighbor_lengths.setdefault(length1, []).append(length2)
+
+        ends = np.array(list(accumulate((note.duration.quarterLength for note in self.notes), initial=0)),
+                        dtype=object)
+        candidates = []
+        for length in range(self.min_length, min(self.max_length, self.num_notes) + 1):
+            durations = ends[length:] - ends[:len(ends) - length]
+            in_range = np.array([self.min_duration <= d <= self.max_duration for d in durations], dtype=bool)
+            if in_range.any():
+                bounds = np.where(in_range, self.prominence_bounds(length, neighbor_lengths.get(length, [])), -1)
+                candidates.append((int(bounds.max()), length, bounds))
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+        # (prominence, -length, -index), the worst of the best k on top
+        heap = []
+        for best_bound, length, bounds in candidates:
+            if heap and deadline is not None and time.monotonic() > deadline:
+                break
+            worst = heap[0][0] if len(heap) == k else 0
+            if best_bound < worst:
+                break
+
+            rows = np.flatnonzero(bounds >= worst)
+            start = int(rows[0])
+            prominences = self.prominences(length, start, int(rows[-1]) + 1)
+            for index in rows.tolist():
+                entry = (int(prominences[index - start]), -length, -index)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+
+        return [(Melody(-index, -length), prominence) for prominence, length, index in sorted(heap, reverse=True)]
+
+    def prominence_bounds(self, length, neighbor_lengths) -> np.ndarray:
+        """
+        Returns for every index i an upper bound on the prominence of Melody(i, length): for every neighbor length,
+        the number of neighbors that can follow the melody times the most notes the two can share, which is at most
+        the number of notes of either that are not rests.
+        """
+        n = self.num_notes
+        indices = np.arange(n - length + 1)
+        sounding = np.concatenate([[0], np.cumsum(~self.rests)])
+        notes = sounding[indices + length] - sounding[indices]
+        bounds = np.zeros(len(indices), dtype=np.int64)
+        for length2 in neighbor_lengths:
+            similarity = np.minimum(notes, length2)
+            neighbors = np.maximum(0, n - length2 + 1 - indices - max(1, length))
+            bounds += np.where(similarity > self.SIMILARITY_THRESHOLD, similarity * neighbors, 0)
+        return bounds
 
     def set_similarity_graph(self):
-        self._similarity_graph = defaultdict(dict)
+        """Fills the DP for all melodies and keeps it as a SimilarityGraph."""
+        if self.jobs == 1:
+            layers = dict(self.similarity_layers(0, self.num_notes))
+        else:
+            layers = self.parallel_similarity_layers()
+        self._similarity_graph = SimilarityGraph(layers, self.num_notes)
+
+    def parallel_similarity_layers(self):
+        """The layers of the DP, filled by worker processes writing their rows of every layer into shared memory."""
+        n = self.num_notes
+        lengths = self.layer_lengths()
+        dtype = self.similarity_dtype()
+        shared = SharedMemory(create=True, size=max(1, len(lengths) * n * n * dtype.itemsize))
+        try:
+            with self.worker_pool(shared.name, lengths, dtype) as pool:
+                futures = [pool.submit(_fill_rows, start, stop) for start, stop in self.row_blocks()]
+                for future in tqdm(as_completed(futures), total=len(futures), leave=False, desc="Similarity graph"):
+                    future.result()
+            shared_layers = layer_views(shared.buf, lengths, dtype, n)
+            layers = {key: layer.copy() for key, layer in shared_layers.items()}
+            del shared_layers
+        finally:
+            shared.close()
+            shared.unlink()
+        return layers
+
+    def set_prominences(self):
+        """
+        Computes the prominence of every melody without keeping the similarity graph. The DP is run for block_size
+        rows at a time and every layer is added to the prominences as soon as it is computed.
+        """
+        n = self.num_notes
+        self._prominences = np.zeros((self.num_prominence_lengths(), n + 1), dtype=np.int64)
+        if self.jobs == 1:
+            for start, stop in tqdm(self.row_blocks(), leave=False, desc="Prominences"):
+                self._prominences[:, start:stop] = self.block_prominences(start, stop)
+            return
 
-        # base case
-        for i in tqdm(range(0, len(self.notes) - 1), leave=False, desc="Base Case"):
-            for j in range(i + 1, len(self.notes)):
-                m1 = Melody(i, 0)
-                m2 = Melody(j, 0)
-                self._similarity_graph[m1][m2] = 0
+        with self.worker_pool() as pool:
+            futures = [pool.submit(_prominence_rows, start, stop) for start, stop in self.row_blocks()]
+            for future in tqdm(as_completed(futures), total=len(futures), leave=False, desc="Prominences"):
+                start, prominences = future.result()
+                self._prominences[:, start:start + prominences.shape[1]] = prominences
+
+    def num_prominence_lengths(self):
+        return max(self.max_length, self.max_length_difference) + 1
+
+    def block_prominences(self, start, stop):
+        """Returns the prominences of the melodies starting at start..stop, by length."""
+        prominences = np.zeros((self.num_prominence_lengths(), stop - start), dtype=np.int64)
+        for (length1, length2), layer in self.similarity_layers(start, stop):
+            prominences[length1] += self.layer_prominences(layer, start, length1, length2)
+        return prominences
+
+    def row_blocks(self):
+        n = self.num_notes
+        return [(start, min(start + self.block_size, n)) for start in range(0, n, self.block_size)]
+
+    def worker_pool(self, *initargs):
+        """
+        A pool of processes that fill rows of the DP. They get a copy of the finder without the notes, as the DP only
+        reads the pitch codes.
+        """
+        finder = copy.copy(self)
+        finder.notes = None
+        finder._similarity_graph = None
+        finder._prominences = None
+        return ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker, initargs=(finder, *initargs))
+
+    def similarity_dtype(self):
+        return np.min_scalar_type(self.max_length)  # similarities never exceed the melody length
+
+    def band_lengths(self, length):
+        """The (l1, l2) layers of the DP with min(l1, l2) = length, in DP order."""
+        lengths = [(length, length)]
+        ml = min(length + self.max_length_difference, self.max_length)
+        for m in range(length + 1, ml + 1):
+            lengths += [(m, length), (length, m)]
+        return lengths
+
+    def layer_lengths(self):
+        """The (l1, l2) of all layers similarity_layers yields, in the same order."""
+        lengths = [(0, 0)]
+        for m in range(1, self.max_length_difference + 1):
+            lengths += [(m, 0), (0, m)]
+        for length in range(1, self.max_length):
+            lengths += self.band_lengths(length)
+        return lengths
 
-                for m in range(1, self.max_length_difference + 1):
-                    m1e = Melody(i, m)
-                    m1p = Melody(i, m - 1)
-                    self._similarity_graph[m1e][m2] = self.contribution(i, None) + self._similarity_graph[m1p][m2]
+    def similarity_layers(self, start, stop):
+        """
+        Yields ((l1, l2), layer) in DP order, where layer[r, j] is the similarity of Melody(start + r, l1) and
+        Melody(j, l2). Only the layers that later ones depend on are kept, so at most two bands of lengths are alive.
+        """
+        n = self.num_notes
 
-                    m2e = Melody(j, m)
-                    m2p = Melody(j, m - 1)
-                    self._similarity_graph[m1][m2e] = self.contribution(None, j) + self._similarity_graph[m1][m2p]
+        # base case
+        zeros = np.zeros((stop - start, n), dtype=self.similarity_dtype())
+        layers = {(0, 0): zeros}
+        for m in range(1, self.max_length_difference + 1):
+            layers[m, 0] = zeros
+            layers[0, m] = zeros
+        yield from layers.items()
 
         # fill in rest
         for length in range(1, self.max_length):
-            for i in tqdm(range(0, len(self.notes) - 1), leave=False, desc=f"Length {length}/{self.max_length}"):
-                for j in range(i + 1, len(self.notes)):
-                    self.fill_dp(i, j, length, length)
-
-                    ml = min(length + self.max_length_difference, self.max_length)
-                    for m in range(length + 1, ml + 1):
-                        self.fill_dp(i, j, m, length)
-                        self.fill_dp(i, j, length, m)
-
-    def fill_dp(self, i, j, length1, length2):
-        m1 = Melody(i, length1)
-        m2 = Melody(j, length2)
-
-        m1l = Melody(i, length1 - 1)
-        m2l = Melody(j, length2 - 1)
-
-        i1 = m1.index + m1.length - 1
-        i2 = m2.index + m2.length - 1
-
-        if not (i1 < len(self.notes) and i2 < len(self.notes)):
-            return
-
-        res = self._similarity_graph[m1l][m2l] + self.contribution(i1, i2)
-        if abs(m1l.length - m2.length) <= self.max_length_difference:
-            res = max(res, self._similarity_graph[m1l][m2] + self.contribution(i1, None))
-        if abs(m1.length - m2l.length) <= self.max_length_difference:
-            res = max(res, self._similarity_graph[m1][m2l] + self.contribution(None, i2))
-
-        self._similarity_graph[m1][m2] = res
+            for length1, length2 in self.band_lengths(length):
+                layers[length1, length2] = self.fill_layer(layers, start, stop, length1, length2)
+                yield (length1, length2), layers[length1, length2]
+
+            for key in [key for key in layers if min(key) == length - 1]:
+                del layers[key]
+
+    def fill_layer(self, layers, start, stop, length1, length2):
+        res = layers[length1 - 1, length2 - 1] + self.contributions(start, stop, length1 - 1, length2 - 1)
+        if abs(length1 - 1 - length2) <= self.max_length_difference:
+            np.maximum(res, layers[length1 - 1, length2], out=res)
+        if abs(length1 - length2 + 1) <= self.max_length_difference:
+            np.maximum(res, layers[length1, length2 - 1], out=res)
+        return res
+
+    def layer_prominences(self, layer, start, length1, length2) -> np.ndarray:
+        """Returns for each row of a layer the similarities it adds to the prominence of Melody(start + r, l1)."""
+        n = self.num_notes
+        # neighbors start after the melody ends, so they cannot overlap
+        mask = np.triu(layer > self.SIMILARITY_THRESHOLD, start + max(1, length1))
+        if length1 > 0 and length2 > 0:
+            mask[max(0, n - length1 + 1 - start):, :] = False
+            mask[:, max(0, n - length2 + 1):] = False
+        return np.where(mask, layer, 0).sum(axis=1, dtype=np.int64)
 
     def prominence(self, m: Melody):
         assert self._similarity_graph is not None
@@ -153,11 +405,172 @@ class RepeatedPatternFinder:
 
         return prominence
 
+    def prominences(self, length: int, start=0, stop=None) -> np.ndarray:
+        """
+        Returns the prominence of Melody(i, length) for every index i from start up to stop, by default from 0 up to
+        and including n.
+        """
+        n = self.num_notes
+        stop = n + 1 if stop is None else stop
+        if self._prominences is not None:
+            return self._prominences[length, start:stop]
+        assert self._similarity_graph is not None
+
+        result = np.zeros(stop - start, dtype=np.int64)
+        rows = max(min(stop, n) - start, 0)
+        for length2 in self._similarity_graph.neighbor_lengths.get(length, []):
+            layer = self._similarity_graph.layers[length, length2]
+            result[:rows] += self.layer_prominences(layer[start:start + rows], start, length, length2)
+        return result
+
+    def contributions(self, start=0, stop=None, row_shift=0, column_shift=0) -> np.ndarray:
+        """
+        Returns the matrix of contribution(i + row_shift, j + column_shift) for rows i in start..stop and all
+        columns j. Pairs past the last note contribute 0.
+        """
+        n = self.num_notes
+        stop = n if stop is None else stop
+        codes = np.concatenate([self.pitch_codes, np.full(self.max_length, -1)])
+        rests = np.concatenate([self.rests, np.ones(self.max_length, dtype=bool)])
+
+        rows = slice(start + row_shift, stop + row_shift)
+        columns = slice(column_shift, column_shift + n)
+        same_pitch = codes[rows, None] == codes[None, columns]
+        return same_pitch & ~rests[rows, None] & ~rests[None, columns]
+
     def contribution(self, i: int | None, j: int | None):
         if i is None:
             return self.contribution(j, i)
-        elif self.notes[i].isRest:
+        elif self.rests[i]:
             return 0
-        elif j is None or self.notes[j].isRest:
+        elif j is None or self.rests[j]:
             return 0
-        return int(self.notes[i].pitch == self.notes[j].pitch)
+        return int(self.pitch_codes[i] == self.pitch_codes[j])
+
+
+def layer_views(buffer, lengths, dtype, num_notes) -> dict[tuple[int, int], np.ndarray]:
+    """The n x n layers of the DP for lengths, laid out one after the other in buffer."""
+    layers = np.ndarray((len(lengths), num_notes, num_notes), dtype=dtype, buffer=buffer)
+    return dict(zip(lengths, layers))
+
+
+# state of the worker processes of RepeatedPatternFinder.worker_pool
+_worker_finder = None
+_worker_shared = None
+_worker_layers = None
+
+
+def _init_worker(finder, shared_name=None, lengths=(), dtype=None):
+    global _worker_finder, _worker_shared, _worker_layers
+    _worker_finder = finder
+    if shared_name is not None:
+        _worker_shared = SharedMemory(shared_name)
+        _worker_layers = layer_views(_worker_shared.buf, lengths, dtype, finder.num_notes)
+
+
+def _fill_rows(start, stop):
+    for lengths, layer in _worker_finder.similarity_layers(start, stop):
+        _worker_layers[lengths][start:stop] = layer
+
+
+def _prominence_rows(start, stop):
+    return start, _worker_finder.block_prominences(start, stop)
+
+
+class ExactRepeatFinder(RepeatedPatternFinder):
+    """
+    RepeatedPatternFinder for max_length_difference=0. Then the similarity of two melodies is the number of
+    positions at which their pitches match, so only pairs of notes with equal pitches matter. These are indexed by
+    diagonal (the distance between the two notes), and pairs without a second match nearby on the same diagonal are
+    dropped. The work grows with the number of pairs of equal pitches, about n² / (number of distinct pitches), so it
+    is still quadratic, only by a smaller factor than the full DP and without its n * max_length² similarity layers.
+    """
+
+    def __init__(
+            self,
+            notes,
+            min_length=1,
+            max_length=None,
+            min_duration=0,
+            max_duration=float('inf'),
+            chunk_size=1 << 20,
+    ):
+        super().__init__(notes, min_length, max_length, 0, min_duration, max_duration, streaming=True)
+        self.chunk_size = chunk_size
+
+    def set_prominences(self):
+        n = len(self.notes)
+        self._prominences = np.zeros((self.max_length + 1, n + 1), dtype=np.int64)
+
+        # a window counts when it has more matches than the threshold, windows without matches add nothing
+        needed = max(0, math.floor(self.SIMILARITY_THRESHOLD)) + 1
+        keys = self.match_keys(needed)
+        deltas, starts = np.divmod(keys, n + 1)
+
+        # the previous match on the same diagonal bounds the windows a match is the first one of
+        same_diagonal = np.concatenate([[False], deltas[1:] == deltas[:-1]])
+        previous = np.where(same_diagonal, np.concatenate([[0], starts[:-1]]), -1)
+
+        # layer (l, l) of the DP only exists for l < max_length
+        for length in range(max(1, needed), self.max_length):
+            last = np.arange(len(keys)) + needed - 1
+            in_range = last < len(keys)
+            first = np.flatnonzero(in_range)
+            last = last[in_range]
+            first = first[(deltas[last] == deltas[first]) & (starts[last] - starts[first] < length)]
+
+            lows = np.maximum(np.maximum(previous[first] + 1, starts[first] - length + 1), 0)
+            counts = starts[first] - lows + 1
+            k = np.repeat(first, counts)
+            i = np.repeat(lows, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+            # melody and neighbor must fit in the notes and not overlap
+            valid = (i + length <= n) & (deltas[k] >= length) & (i + deltas[k] + length <= n)
+            i, k = i[valid], k[valid]
+            similarities = np.searchsorted(keys, deltas[k] * (n + 1) + i + length, side='left') - k
+
+            counted = similarities >= needed
+            self._prominences[length] += np.bincount(
+                i[counted], weights=similarities[counted], minlength=n + 1
+            ).astype(np.int64)
+
+    def match_keys(self, needed):
+        """
+        Returns the sorted keys delta * (n + 1) + i of all pairs of equal pitches at i and i + delta that can be part
+        of a window with at least `needed` matches. All pairs of equal pitches are enumerated before dropping those
+        without a second match within the window on their diagonal. Over a dozen pitches nearly every pair has one
+        (91% of the pairs of random notes at max_length=16), so generating only the pairs with such a neighbor would
+        not reduce the work.
+        """
+        n = len(self.notes)
+        radius = self.max_length - 2  # farthest two matches inside a window of the longest length can be apart
+        if needed > 1 and radius < 1:
+            return np.zeros(0, dtype=np.int64)
+
+        codes = np.where(self.rests, -1, self.pitch_codes)
+        padded = np.concatenate([np.full(max(radius, 0), -1), codes, np.full(max(radius, 0), -1)])
+        positions = np.flatnonzero(codes >= 0)
+        positions = positions[np.argsort(codes[positions], kind='stable')]
+        buckets = np.split(positions, np.flatnonzero(np.diff(codes[positions])) + 1)
+
+        keys = []
+        for bucket in buckets:
+            rows = max(1, self.chunk_size // max(len(bucket), 1))
+            for start in range(0, len(bucket) - 1, rows):
+                a = bucket[start:start + rows, None]
+                b = bucket[None, start + 1:]
+                a, b = np.broadcast_arrays(a, b)
+                mask = b > a
+                a, b = a[mask], b[mask]
+
+                if needed > 1:
+                    has_neighbor = np.zeros(len(a), dtype=bool)
+                    for gap in range(1, radius + 1):
+                        for shift in (gap, -gap):
+                            neighbor = padded[a + radius + shift]
+                            has_neighbor |= (neighbor >= 0) & (neighbor == padded[b + radius + shift])
+                    a, b = a[has_neighbor], b[has_neighbor]
+
+                keys.append((b - a) * (n + 1) + a)
+
+        return np.sort(np.concatenate(keys)) if keys else np.zeros(0, dtype=np.int64)
@@ -0,0 +1,233 @@
+"""
+Inverted index of the note sequences of a corpus, to find repeated patterns across pieces.
+
+Every part of every piece is encoded as a sequence of pitch codes, equal codes meaning equal pitches as in
+melody_detection, with codes shared by the whole corpus. The index maps every n-gram of consecutive pitches (without
+rests) to the places it occurs. A query votes with its own n-grams for the windows they align with, and only the
+windows with the most votes are scored with the similarity of RepeatedPatternFinder, so a query costs time in the
+number of shared n-grams instead of the size of the corpus.
+
+Pieces can be added to a saved index later. Parsing and encoding the pieces runs in a process pool.
+"""
+import argparse
+import heapq
+import logging
+import os
+import pickle
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from glob import glob
+from pathlib import Path
+
+import numpy as np
+from music21.note import Note
+
+import score_cache
+from melody_detection import Melody, RepeatedPatternFinder, overlap, pitch_key
+
+# bump when the encoding or the postings change
+INDEX_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Match:
+    piece: str
+    part: int
+    melody: Melody
+    similarity: int
+
+
+def similarity(a, b, max_length_difference):
+    """
+    The similarity of two sequences of pitch codes (negative for rests) as RepeatedPatternFinder computes it for
+    melodies of these notes: the most matching pitches of an alignment that never lets the lengths of the aligned
+    prefixes differ by more than max_length_difference.
+    """
+    d = max_length_difference
+    previous = {}
+    for l1 in range(len(a) + 1):
+        current = {}
+        for l2 in range(max(0, l1 - d), min(len(b), l1 + d) + 1):
+            if l1 == 0 or l2 == 0:
+                current[l2] = 0
+                continue
+            best = previous[l2 - 1] + int(a[l1 - 1] >= 0 and a[l1 - 1] == b[l2 - 1])
+            if abs(l1 - 1 - l2) <= d:
+                best = max(best, previous[l2])
+            if abs(l1 - l2 + 1) <= d:
+                best = max(best, current[l2 - 1])
+            current[l2] = best
+        previous = current
+    return previous.get(len(b), 0)
+
+
+def encode_piece(path):
+    """The pitch keys (None for rests) of the parts of the piece at path. Runs in the worker processes."""
+    score = score_cache.parse(path)
+    return [
+        [None if n.isRest else pitch_key(n) for n in part.flatten().notesAndRests]
+        for part in score.parts
+    ]
+
+
+class PatternIndex:
+    """n-grams of pitch codes to the (sequence, position) places they start at."""
+
+    def __init__(self, n=3, max_length_difference=1, candidates_per_match=20):
+        self.n = n
+        self.max_length_difference = max_length_difference
+        self.candidates_per_match = candidates_per_match
+        self.codes = {}  # pitch key -> code
+        self.sequences = []  # (piece, part, codes)
+        self.pieces = {}  # piece -> indices of its sequences
+        self.postings = defaultdict(list)
+
+    def encode(self, keys, add=False):
+        codes = np.full(len(keys), -1, dtype=np.int32)
+        for i, k in enumerate(keys):
+            if k is None:
+                continue
+            if add:
+                codes[i] = self.codes.setdefault(k, len(self.codes))
+            else:
+                codes[i] = self.codes.get(k, -1)
+        return codes
+
+    def add_piece(self, piece, parts):
+        """Indexes the parts (lists of pitch keys, see encode_piece) of a piece, unless it is indexed already."""
+        if piece in self.pieces:
+            return False
+        self.pieces[piece] = []
+        for part, keys in enumerate(parts):
+            sequence = len(self.sequences)
+            codes = self.encode(keys, add=True)
+            self.sequences.append((piece, part, codes))
+            self.pieces[piece].append(sequence)
+            if len(codes) < self.n:
+                continue
+            windows = np.lib.stride_tricks.sliding_window_view(codes, self.n)
+            for position in np.flatnonzero((windows >= 0).all(axis=1)):
+                self.postings[tuple(windows[position].tolist())].append((sequence, int(position)))
+        return True
+
+    def add_paths(self, paths, jobs=None):
+        """Indexes the pieces at paths that are not indexed yet, parsing them in a process pool."""
+        paths = [Path(p) for p in paths if str(p) not in self.pieces]
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for path, parts in zip(paths, pool.map(encode_piece, paths)):
+                self.add_piece(str(path), parts)
+                logging.info(f'Indexed {path}')
+
+    def votes(self, codes):
+        """The number of n-grams of codes every (sequence, start) window shares with codes at the same position."""
+        votes = Counter()
+        for offset in range(len(codes) - self.n + 1):
+            gram = tuple(codes[offset:offset + self.n].tolist())
+            if min(gram) < 0:
+                continue
+            for sequence, position in self.postings.get(gram, ()):
+                votes[sequence, position - offset] += 1
+        return votes
+
+    def query(self, keys, k=10, exclude=None):
+        """
+        The k windows of the corpus most similar to the pitch keys, with similarity above the threshold of
+        RepeatedPatternFinder. Windows of every length within max_length_difference of the query are considered, the
+        best of them is kept for every start, and of overlapping windows only the best. exclude(sequence, melody) can
+        rule windows out.
+        """
+        return self.query_codes(self.encode(keys), k, exclude)
+
+    def query_codes(self, codes, k=10, exclude=None):
+        d = self.max_length_difference
+        candidates = heapq.nlargest(
+            self.candidates_per_match * k, self.votes(codes).items(), key=lambda item: (item[1], item[0])
+        )
+
+        best = {}
+        for (sequence, start), _ in candidates:
+            _, _, sequence_codes = self.sequences[sequence]
+            for j in range(max(0, start - d), start + d + 1):
+                if (sequence, j) in best:
+                    continue
+                lengths = []
+                for length in range(max(1, len(codes) - d), len(codes) + d + 1):
+                    if j + length > len(sequence_codes) or (exclude and exclude(sequence, Melody(j, length))):
+                        continue
+                    score = similarity(codes, sequence_codes[j:j + length], d)
+                    lengths.append((score, -abs(length - len(codes)), -length, length))
+                if lengths:
+                    score, _, _, length = max(lengths)
+                    best[sequence, j] = (score, length)
+
+        # of overlapping windows of a sequence only the best is a match, as similar melodies must not overlap
+        ranked = sorted(
+            ((score, -abs(length - len(codes)), -sequence, -j, length)
+             for (sequence, j), (score, length) in best.items() if score > RepeatedPatternFinder.SIMILARITY_THRESHOLD),
+            reverse=True,
+        )
+        matches = []
+        for score, _, sequence, j, length in ranked:
+            piece, part, _ = self.sequences[-sequence]
+            match = Match(piece, part, Melody(-j, length), score)
+            if not any(m.piece == piece and m.part == part and overlap(m.melody, match.melody) for m in matches):
+                matches.append(match)
+                if len(matches) == k:
+                    break
+        return matches
+
+    def query_melody(self, piece, part, melody, k=10):
+        """The k windows most similar to a melody of an indexed part, other than the windows overlapping it."""
+        sequence = self.pieces[piece][part]
+        codes = self.sequences[sequence][2][melody.index:melody.index + melody.length]
+
+        def exclude(other_sequence, other):
+            return other_sequence == sequence and overlap(melody, other)
+
+        return self.query_codes(codes, k, exclude)
+
+    def query_pitches(self, pitches, k=10):
+        return self.query([pitch_key(Note(p)) for p in pitches], k)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        state = dict(vars(self), postings=dict(self.postings))
+        with open(tmp, 'wb') as f:
+            pickle.dump((INDEX_VERSION, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != INDEX_VERSION:
+            raise ValueError(f'{path} is an index of version {version}, rebuild it.')
+        index = cls()
+        vars(index).update(state, postings=defaultdict(list, state['postings']))
+        return index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Index the note sequences of pieces and query repeated patterns.")
+    parser.add_argument("index", type=Path, help="Index file, created if it does not exist.")
+    parser.add_argument("pieces", nargs="*", help="Scores or glob patterns of scores to add to the index.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of pieces to parse concurrently.")
+    parser.add_argument("-n", type=int, default=3, help="Length of the indexed n-grams of a new index.")
+    parser.add_argument("-q", "--query", nargs="+", help="Pitches to search, such as C4 D4 E-4.")
+    parser.add_argument("-k", type=int, default=10, help="Number of matches to show.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s', datefmt='%H:%M:%S')
+
+    pattern_index = PatternIndex.load(args.index) if args.index.exists() else PatternIndex(n=args.n)
+    if args.pieces:
+        piece_paths = [Path(p).resolve() for spec in args.pieces for p in sorted(glob(spec, recursive=True))]
+        pattern_index.add_paths(piece_paths, args.jobs)
+        pattern_index.save(args.index)
+    if args.query:
+        for match in pattern_index.query_pitches(args.query, args.k):
+            print(f"{match.similarity}\t{Path(match.piece).name}\tpart {match.part}\t"
+                  f"notes {match.melody.index}-{match.melody.index + match.melody.length - 1}")
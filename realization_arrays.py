@@ -0,0 +1,218 @@
+"""
+Columnar storage of realized parts.
+
+A realized part as returned by realize.realize_part is stored as arrays: the offset, duration and kind (rest, note or
+chord) of every event, and per voice (the pitches of the chords, in their order) the pitch space value, alteration and
+tie of its pitch, padded with NaN and NO_TIE where an event has fewer voices. The alteration keeps the spelling, so
+pitches are restored exactly; it is NaN for pitches without an accidental, and 0 for naturals. Whether accidentals are
+displayed is kept as well, as it was decided when the part was made. The measures, their
+time signatures with the symbol they are shown as, their key signatures, the clef, the spans of the chunks realize_part realized separately and a dict of metadata are
+stored alongside.
+
+Every array is written to an .npy file of its own in a directory, so load can memory-map them and realizations can be
+compared array by array without parsing MusicXML or reading more than the compared arrays. to_part turns them back
+into the part, and realize.create_score into the score.
+"""
+import json
+from pathlib import Path
+from dataclasses import dataclass, field, fields
+
+import numpy as np
+from music21 import clef, key, tie
+from music21.bar import Barline
+from music21.chord import Chord
+from music21.common import opFrac
+from music21.meter import TimeSignature
+from music21.note import Note, Rest
+from music21.pitch import Accidental, Pitch
+from music21.stream import Measure, Part
+
+REST, NOTE, CHORD = 0, 1, 2
+NAN_PADDED = ('pitch_space', 'alterations')
+TIE_TYPES = ('start', 'continue', 'stop', 'let-ring')
+NO_TIE = -1
+DISPLAY_STATUSES = (None, False, True)
+STRING_ARRAYS = ('time_signatures', 'time_signature_symbols')
+
+
+@dataclass
+class RealizationArrays:
+    offsets: np.ndarray  # float64, absolute offsets of the events
+    durations: np.ndarray  # float64, quarter lengths
+    kinds: np.ndarray  # int8, REST, NOTE or CHORD
+    pitch_space: np.ndarray  # float64 (events, voices), NaN where there is no pitch
+    alterations: np.ndarray  # float32 (events, voices), NaN without an accidental
+    ties: np.ndarray  # int8 (events, voices), an index into TIE_TYPES or NO_TIE
+    accidental_display: np.ndarray  # int8 (events, voices), an index into DISPLAY_STATUSES
+    measure_offsets: np.ndarray  # float64
+    measure_numbers: np.ndarray  # int32
+    time_signatures: np.ndarray  # object, ratio strings
+    time_signature_symbols: np.ndarray  # object, the symbol ('common', 'cut' or '') the time signature is shown as
+    time_signature_offsets: np.ndarray  # float64
+    key_signatures: np.ndarray  # int8, sharps
+    key_signature_offsets: np.ndarray  # float64
+    chunks: np.ndarray  # float64 (chunks, 2), start and end offsets of the chunks realized separately
+    clef: str = ''
+    metadata: dict = field(default_factory=dict)
+
+    def save(self, directory):
+        """Writes the arrays to directory, an .npy file per array and the clef and metadata to info.json."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in array_names():
+            array = getattr(self, name)
+            np.save(directory / f'{name}.npy', array.astype(str) if name in STRING_ARRAYS else array)
+        (directory / 'info.json').write_text(json.dumps({'clef': self.clef, 'metadata': self.metadata}))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Reads the arrays saved to directory, memory-mapped with mmap_mode (None reads them into memory)."""
+        directory = Path(directory)
+        arrays = {name: np.load(directory / f'{name}.npy', mmap_mode=mmap_mode) for name in array_names()}
+        for name in STRING_ARRAYS:
+            arrays[name] = arrays[name].astype(object)
+        return cls(**arrays, **json.loads((directory / 'info.json').read_text()))
+
+    def __eq__(self, other):
+        if not isinstance(other, RealizationArrays):
+            return NotImplemented
+        return all(
+            np.array_equal(getattr(self, f.name), getattr(other, f.name), equal_nan=f.name in NAN_PADDED)
+            if isinstance(getattr(self, f.name), np.ndarray) else getattr(self, f.name) == getattr(other, f.name)
+            for f in fields(self)
+        )
+
+    def differing_offsets(self, other):
+        """The offsets of the events that are not the same in both realizations, by offset."""
+        mine = event_rows(self)
+        theirs = event_rows(other)
+        return sorted(offset for offset in mine.keys() | theirs.keys() if mine.get(offset) != theirs.get(offset))
+
+
+def array_names():
+    return [f.name for f in fields(RealizationArrays) if f.name not in ('clef', 'metadata')]
+
+
+def event_rows(arrays):
+    rows = np.concatenate([
+        arrays.durations[:, None], arrays.kinds[:, None], np.nan_to_num(arrays.pitch_space, nan=-1),
+        np.nan_to_num(arrays.alterations, nan=-9), arrays.ties, arrays.accidental_display,
+    ], axis=1)
+    return {float(offset): tuple(row) for offset, row in zip(arrays.offsets, rows.tolist())}
+
+
+def tie_index(t):
+    return TIE_TYPES.index(t.type) if t is not None else NO_TIE
+
+
+def from_part(part, metadata=None, chunks=()):
+    """
+    Stores a realized part and the (start, end) offsets of its chunks, as returned by realize.realize_part with
+    with_chunks.
+    """
+    events = list(part.flatten().notesAndRests)
+    n_voices = max((len(e.pitches) for e in events), default=0)
+    pitch_space = np.full((len(events), n_voices), np.nan)
+    alterations = np.full((len(events), n_voices), np.nan, dtype=np.float32)
+    ties = np.full((len(events), n_voices), NO_TIE, dtype=np.int8)
+    accidental_display = np.zeros((len(events), n_voices), dtype=np.int8)
+    kinds = np.empty(len(events), dtype=np.int8)
+    for i, event in enumerate(events):
+        kinds[i] = CHORD if isinstance(event, Chord) else NOTE if isinstance(event, Note) else REST
+        notes = event.notes if isinstance(event, Chord) else [event] if isinstance(event, Note) else []
+        for v, note in enumerate(notes):
+            pitch_space[i, v] = note.pitch.ps
+            if note.pitch.accidental is not None:
+                alterations[i, v] = note.pitch.accidental.alter
+                accidental_display[i, v] = DISPLAY_STATUSES.index(note.pitch.accidental.displayStatus)
+            ties[i, v] = tie_index(note.tie)
+
+    offsets = np.array([float(e.getOffsetInHierarchy(part)) for e in events])
+    durations = np.array([float(e.quarterLength) for e in events])
+    measures = part.getElementsByClass(Measure)
+    time_signatures = list(part.recurse().getElementsByClass(TimeSignature))
+    key_signatures = list(part.recurse().getElementsByClass(key.KeySignature))
+    part_clef = part.recurse().getElementsByClass(clef.Clef).first()
+    return RealizationArrays(
+        offsets=offsets,
+        durations=durations,
+        kinds=kinds,
+        pitch_space=pitch_space,
+        alterations=alterations,
+        ties=ties,
+        accidental_display=accidental_display,
+        measure_offsets=np.array([float(m.offset) for m in measures]),
+        measure_numbers=np.array([m.number for m in measures], dtype=np.int32),
+        time_signatures=np.array([ts.ratioString for ts in time_signatures], dtype=object),
+        time_signature_symbols=np.array([ts.symbol for ts in time_signatures], dtype=object),
+        time_signature_offsets=np.array([float(ts.getOffsetInHierarchy(part)) for ts in time_signatures]),
+        key_signatures=np.array([ks.sharps for ks in key_signatures], dtype=np.int8),
+        key_signature_offsets=np.array([float(ks.getOffsetInHierarchy(part)) for ks in key_signatures]),
+        chunks=np.array(chunks, dtype=float).reshape(-1, 2),
+        clef=part_clef.classes[0] if part_clef is not None else '',
+        metadata=metadata or {},
+    )
+
+
+def make_pitch(ps, alter, display):
+    """The pitch with pitch space value ps, spelled with alteration alter (NaN for no accidental)."""
+    pitch = Pitch()
+    pitch.ps = ps if np.isnan(alter) else ps - alter
+    pitch.accidental = None
+    if not np.isnan(alter):
+        pitch.accidental = Accidental(alter)
+        pitch.accidental.displayStatus = DISPLAY_STATUSES[display]
+    return pitch
+
+
+def make_event(arrays, i):
+    duration = opFrac(arrays.durations[i])
+    if arrays.kinds[i] == REST:
+        return Rest(quarterLength=duration)
+    notes = []
+    voices = zip(arrays.pitch_space[i], arrays.alterations[i], arrays.ties[i], arrays.accidental_display[i])
+    for ps, alter, tie_type, display in voices:
+        if np.isnan(ps):
+            break
+        note = Note(make_pitch(float(ps), float(alter), display), quarterLength=duration)
+        if tie_type != NO_TIE:
+            note.tie = tie.Tie(TIE_TYPES[tie_type])
+        notes.append(note)
+    if arrays.kinds[i] == NOTE:
+        return notes[0]
+    return Chord(notes, quarterLength=duration)
+
+
+def to_part(arrays):
+    """The realized part the arrays were made from."""
+    part = Part(id='part0')
+    starts = [opFrac(offset) for offset in arrays.measure_offsets]
+    measures = [Measure(number=int(number)) for number in arrays.measure_numbers]
+    for start, measure in zip(starts, measures):
+        part.coreInsert(start, measure)
+    part.coreElementsChanged()
+
+    def measure_at(offset):
+        i = max(int(np.searchsorted(arrays.measure_offsets, offset, side='right')) - 1, 0)
+        return measures[i], opFrac(offset - starts[i])
+
+    if arrays.clef:
+        measures[0].insert(0, getattr(clef, arrays.clef)())
+    for ratio, symbol, offset in zip(
+        arrays.time_signatures, arrays.time_signature_symbols, arrays.time_signature_offsets
+    ):
+        measure, measure_offset = measure_at(offset)
+        time_signature = TimeSignature(ratio)
+        time_signature.symbol = symbol
+        measure.insert(measure_offset, time_signature)
+    for sharps, offset in zip(arrays.key_signatures, arrays.key_signature_offsets):
+        measure, measure_offset = measure_at(offset)
+        measure.insert(measure_offset, key.KeySignature(int(sharps)))
+    for i, offset in enumerate(arrays.offsets):
+        measure, measure_offset = measure_at(offset)
+        measure.coreInsert(measure_offset, make_event(arrays, i))
+    for measure in measures:
+        measure.coreElementsChanged()
+    if measures:
+        measures[-1].rightBarline = Barline('final')
+    return part
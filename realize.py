@@ -1,10 +1,16 @@
 import argparse
+import bisect
 import copy
+import functools
 import logging
 import sys
+from dataclasses import dataclass
 from pathlib import Path
 
-from music21 import converter, analysis, key
+import numpy as np
+from joblib import Parallel, delayed
+from music21 import clef, converter, key
+from music21.common import opFrac
 from music21.chord import Chord
 from music21.dynamics import Dynamic
 from music21.improvedFiguredBass import realizer
@@ -14,134 +20,187 @@ from music21.improvedFiguredBass.rules import RuleSet
 from music21.improvedFiguredBass.segment import Segment
 from music21.meter import TimeSignature
 from music21.pitch import Accidental, Pitch
-from music21.stream import Stream, Score, Part
+from music21.stream import Measure, Score, Part
 
+import cadences
+import chunk_cache
 import config
+import instrumentation
+import key_estimation
+import rule_cache
+import score_cache
+import search
+import segment_table
 
 
-def set_melody_pitches_at_strike(segments, melody_parts):
-    """Fills in the segments melody_pitches attribute with pitches being played at time of strike."""
-    idxs = [0] * len(melody_parts)
-    for segment in segments:
-        start_offset = segment.play_offsets[0]
-        for i, part in enumerate(melody_parts):
-            elts = part.flat.notes
-            while idxs[i] < len(elts) and elts[idxs[i]].offset < start_offset:
-                idxs[i] += 1
-            if not (idxs[i] < len(elts) and elts[idxs[i]].offset == start_offset):
-                if idxs[i] == 0:
-                    continue
-                idxs[i] -= 1
-
-            elt = elts[idxs[i]]
-            if isinstance(elt, Chord):
-                chord_pitches = elt.pitches
-                segment.melody_pitches_at_strike.update(chord_pitches)
-            else:
-                melody_pitch = elt.pitch
-                segment.melody_pitches_at_strike.add(melody_pitch)
-
-
-def set_melody_pitches(segments, melody_parts):
+@dataclass(frozen=True)
+class OffsetIndex:
     """
-    Fills in the segments melody_pitches attribute with pitches being played at time of strike and duration of strike.
+    Sorted offsets of the notes and dynamics of a melody part, built once so segments can be aligned with
+    binary search instead of rescanning the part.
     """
-    for melody_part in melody_parts:
-        extend_melody_pitches(segments, melody_part)
-
-
-def extend_melody_pitches(segments, melody_part):
-    i = 0
-    for segment in segments:
-        start_offset = segment.play_offsets[0]
-        end_offset = segment.play_offsets[1]
-        notes = melody_part.flat.notes
-
-        while i < len(notes) and notes[i].offset + notes[i].duration.quarterLength <= start_offset:
-            i += 1
-        while i < len(notes) and notes[i].offset < end_offset:
-            if isinstance(notes[i], Chord):
-                chord_pitches = notes[i].pitches
-                segment.melody_pitches.update(chord_pitches)
-            else:
-                melody_pitch = notes[i].pitch
-                segment.melody_pitches.add(melody_pitch)
-            i += 1
-        i = max(0, i-1)  # note overlaps multiple segments
+    offsets: np.ndarray
+    end_offsets: np.ndarray  # running maximum of the note end offsets, so it is sorted as well
+    pitches: list[tuple[Pitch, ...]]
+    note_end_offsets: np.ndarray
+    dynamic_offsets: np.ndarray
+    dynamics: list[str]
+
+    @classmethod
+    def from_part(cls, part):
+        notes = part.flatten().notes
+        offsets = np.array([float(n.offset) for n in notes], dtype=float)
+        note_end_offsets = np.array([float(n.offset + n.duration.quarterLength) for n in notes], dtype=float)
+        dynamics = part.getElementsByClass(Dynamic)
+        return cls(
+            offsets=offsets,
+            end_offsets=np.maximum.accumulate(note_end_offsets) if len(notes) else note_end_offsets,
+            pitches=[tuple(n.pitches) if isinstance(n, Chord) else (n.pitch,) for n in notes],
+            note_end_offsets=note_end_offsets,
+            dynamic_offsets=np.array([float(d.offset) for d in dynamics], dtype=float),
+            dynamics=[d.value for d in dynamics],
+        )
+
+
+def strike_indices(offsets, starts):
+    """
+    Returns for every start the index of the element struck at that time: the first one starting exactly there,
+    otherwise the last one starting before it. -1 if there is none.
+    """
+    if len(offsets) == 0:
+        return np.full(len(starts), -1)
+    idx = np.searchsorted(offsets, starts, side='left')
+    exact = (idx < len(offsets)) & (offsets[np.minimum(idx, len(offsets) - 1)] == starts)
+    return np.where(exact, idx, idx - 1)
 
 
-def set_dynamic_markings(segments, melody_parts, prev_dynamic=None):
-    """Fills in the segments dynamic attribute."""
+def align_melody_parts(segments, melody_parts, prev_dynamic=None):
+    """
+    Fills in the segments melody_pitches (pitches sounding during the segment), melody_pitches_at_strike
+    (pitches sounding when the segment is struck) and dynamic attributes in one sweep over the segments.
+    Returns the dynamic marking in effect at the end, to be handed to the next chunk.
+    """
     if prev_dynamic is None:
         prev_dynamic = 'mf'
 
-    parts = [part.getElementsByClass(Dynamic) for part in melody_parts]
-    idxs = [0] * len(melody_parts)
-    for segment in segments:
-        start_offset = segment.play_offsets[0]
-        for i, elts in enumerate(parts):
-            while idxs[i] < len(elts) and elts[idxs[i]].offset < start_offset:
-                idxs[i] += 1
-            if not (idxs[i] < len(elts) and elts[idxs[i]].offset == start_offset):
-                if idxs[i] == 0:
-                    continue
-                idxs[i] -= 1
-            prev_dynamic = elts[idxs[i]].value
+    indices = [OffsetIndex.from_part(part) for part in melody_parts]
+    starts = np.array([float(segment.play_offsets[0]) for segment in segments], dtype=float)
+    ends = np.array([float(segment.play_offsets[1]) for segment in segments], dtype=float)
+
+    strikes = [strike_indices(index.offsets, starts) for index in indices]
+    dynamic_strikes = [strike_indices(index.dynamic_offsets, starts) for index in indices]
+    sounding_from = [np.searchsorted(index.end_offsets, starts, side='right') for index in indices]
+    sounding_to = [np.searchsorted(index.offsets, ends, side='left') for index in indices]
+
+    for k, segment in enumerate(segments):
+        for i, index in enumerate(indices):
+            for j in range(sounding_from[i][k], sounding_to[i][k]):
+                if index.note_end_offsets[j] > starts[k]:
+                    segment.melody_pitches.update(index.pitches[j])
+            if strikes[i][k] >= 0:
+                segment.melody_pitches_at_strike.update(index.pitches[strikes[i][k]])
+            if dynamic_strikes[i][k] >= 0:
+                prev_dynamic = index.dynamics[dynamic_strikes[i][k]]
         segment.dynamic = prev_dynamic
 
-    last_dynamic = prev_dynamic
-    last_offset = segments[-1].play_offsets[0]
-    for i, elts in enumerate(parts):
-        if len(elts) == 0:
+    return latest_dynamic_marking(indices, starts[-1], prev_dynamic)
+
+
+def latest_dynamic_marking(indices, last_offset, last_dynamic):
+    """Returns the dynamic in effect after last_offset, given the dynamic of the segment starting there."""
+    for index in indices:
+        if len(index.dynamics) == 0:
             continue
-        if elts[-1].offset > last_offset:
-            last_dynamic = elts[-1].value
-            last_offset = elts[-1].offset
+        if index.dynamic_offsets[-1] > last_offset:
+            last_dynamic = index.dynamics[-1]
+            last_offset = index.dynamic_offsets[-1]
     return last_dynamic
 
 
-def split_on_rests(bc, melodies):
-    result = []
-    sf = bc.flatten()
-    key_sig = sf[key.KeySignature].first()
-
-    current_melodies = melodies
-    current = bc
-    rests = []
-    start_offset = 0
-    while current:
-        rest = None
-        for i, note in enumerate(current.notesAndRests):
-            if note.isRest:
-                rest = current.notesAndRests[i]
-                break
-        if rest:
-            rests.append(rest)
-            rest_start = rest.offset
-            rest_length = rest.quarterLength
-            rest_end = rest_start + rest_length
-            prev_start_offset = start_offset
-            start_offset = rest_end
-            prev, current = current.splitAtQuarterLength(rest_start)
-            _, current = current.splitAtQuarterLength(rest_length)
-            current.insert(0, copy.deepcopy(key_sig))
-            prev_mels = []
-            new_mels = []
-            for mel in current_melodies:
-                prev_mel, curr_mel = mel.splitAtQuarterLength(rest_end)
-                dynamics = prev_mel.getElementsByClass(Dynamic)
-                if len(dynamics) > 0 and dynamics[-1].offset == rest_end:
-                    curr_mel.insert(0, dynamics[-1])
-                prev_mels.append(prev_mel)
-                new_mels.append(curr_mel)
-            current_melodies = new_mels
-
-            result.append((prev, prev_mels, prev_start_offset))
+def last_dynamic_marking(bass, melody_parts, prev_dynamic=None):
+    """
+    Returns the dynamic marking that align_melody_parts would hand on to the next chunk, without building segments.
+    """
+    if prev_dynamic is None:
+        prev_dynamic = 'mf'
+
+    last_offset = float(bass.flatten().notes[-1].offset)
+    indices = [OffsetIndex.from_part(part) for part in melody_parts]
+    for index in indices:
+        idx = strike_indices(index.dynamic_offsets, np.array([last_offset]))[0]
+        if idx >= 0:
+            prev_dynamic = index.dynamics[idx]
+    return latest_dynamic_marking(indices, last_offset, prev_dynamic)
+
+
+def partition_at(stream, cuts):
+    """
+    Splits a flat stream at the non-decreasing offsets in cuts in one pass, with the semantics of repeatedly calling
+    splitAtQuarterLength: zero-length elements at a cut stay before it (unless the cut is at the end of the stream)
+    and elements sounding across a cut are split into tied parts. Returns len(cuts) + 1 streams with offsets relative
+    to their start. Elements that are split are copied first, so the stream itself is left as it was.
+    """
+    highest_time = stream.highestTime
+    starts = [0.0, *cuts]
+    pieces = [type(stream)() for _ in starts]
+    for element in stream:
+        offset = element.offset
+        length = element.quarterLength
+        end = offset + length
+        if length > 0 or offset == highest_time:
+            i = bisect.bisect_right(cuts, offset)
         else:
-            result.append((current, current_melodies, start_offset))
-            current = None
+            i = bisect.bisect_left(cuts, offset)
+        if i < len(cuts) and end > cuts[i]:
+            element = copy.deepcopy(element)
+        pieces[i].coreInsert(offset - starts[i], element, ignoreSort=True)
+        while i < len(cuts) and end > cuts[i]:
+            _, element = element.splitAtQuarterLength(
+                cuts[i] - max(offset, starts[i]), retainOrigin=True, addTies=True
+            )
+            i = bisect.bisect_right(cuts, cuts[i])
+            pieces[i].coreInsert(0, element, ignoreSort=True)
+    for piece in pieces:
+        piece.coreElementsChanged()
+    return pieces
 
-    return result, rests
+
+def split_on_rests(bc, melodies):
+    """
+    Splits the flat basso continuo and melody parts into the chunks between rests. Returns (bass, melodies,
+    start_offset) tuples and the rests. The bass is cut at both ends of every rest and the melodies at the rest ends,
+    so each stream is partitioned once.
+    """
+    if not bc:
+        return [], []
+    rests = [n for n in bc.notesAndRests if n.isRest]
+    if not rests:
+        return [(bc, melodies, 0)], rests
+
+    key_sig = bc[key.KeySignature].first()
+    rest_ends = [rest.offset + rest.quarterLength for rest in rests]
+    bass_cuts = [offset for rest, rest_end in zip(rests, rest_ends) for offset in (rest.offset, rest_end)]
+    chunks = partition_at(bc, bass_cuts)[::2]
+    for chunk in chunks[1:]:
+        chunk.insert(0, copy.deepcopy(key_sig))
+
+    melody_chunks = []
+    for mel in melodies:
+        pieces = partition_at(mel, rest_ends)
+        for i, rest_end in enumerate(rest_ends):
+            # a dynamic marking at the end of a rest also applies to the next chunk
+            dynamics = pieces[i].getElementsByClass(Dynamic)
+            chunk_start = rest_ends[i - 1] if i > 0 else 0
+            if len(dynamics) > 0 and dynamics[-1].offset == rest_end - chunk_start:
+                pieces[i + 1].insert(0, copy.deepcopy(dynamics[-1]))
+        melody_chunks.append(pieces)
+
+    # the start offset of a chunk is relative to the start of the chunk before it
+    chunk_starts = [0, 0, *rest_ends]
+    return [
+        (chunk, [pieces[i] for pieces in melody_chunks], chunk_starts[i + 1] - chunk_starts[i])
+        for i, chunk in enumerate(chunks)
+    ], rests
 
 
 def set_neighboring_segments(segment_list: list[Segment]):
@@ -155,51 +214,68 @@ def set_neighboring_segments(segment_list: list[Segment]):
 def set_on_beat(segment_list, time_signature, start_offset: int):
     for i, segment in enumerate(segment_list):
         offset = segment.play_offsets[0] + start_offset
-        segment.on_beat = 0
-        segment.on_beat += offset % 1 == 0
-        segment.on_beat += offset % time_signature.beatDivisionCount == 0
+        segment.on_beat = cadences.beat_strength(offset, time_signature)
+
+
+STEPS = 'CDEFGAB'
+MODIFIER_NAMES = ('natural', 'sharp', 'flat')  # by the sign of the alteration, -1 indexing flat
+MINOR_INTERVALS = {1, 3, 8, 10}
+MAJOR_INTERVALS = {2, 4, 9, 11}
+
 
+@functools.lru_cache(maxsize=None)
+def name_pitch_space(name):
+    """The pitch space value of a pitch name, in octave 4 if it has none."""
+    return Pitch(name).ps
 
-def handle_accidentals(segment_list):
-    MINOR_INTERVALS = {1, 3, 8, 10}
-    MAJOR_INTERVALS = {2, 4, 9, 11}
 
+def alteration_sign(pitch):
+    return (pitch.alter > 0) - (pitch.alter < 0)
+
+
+def handle_accidentals(segment_list, rule_set=None):
+    """
+    Applies the accidentals of the melody and of the figures to the chords of the segments. An accidental holds until
+    the end of its measure: past_measure maps a note name to the modifier in effect and the measure it was set in.
+    The melody accidentals of the current measure are tracked per step, so a repeated accidental reuses its entry.
+    The segments are then initialized through the segment table, as segments realized with rule_set.
+    """
     past_measure = {}
-    for i, segment in enumerate(segment_list):
+    current_measure = None
+    melody_entries = [None] * 7
+    for segment in segment_list:
         segment_measure = segment.bassNote.measureNumber
+        if segment_measure != current_measure:
+            # the same dict is handed to every segment, so it is pruned in place
+            for name in [name for name, entry in past_measure.items() if entry[1] < segment_measure]:
+                del past_measure[name]
+            current_measure = segment_measure
+            melody_entries = [None] * 7
         segment.set_pitch_names_in_chord()
         for note in segment.melody_pitches:
-            note_name = note.fullName[:1]
-            if 'sharp' in note.fullName:
-                past_measure[note_name] = (Modifier('sharp'), segment_measure)
-            elif 'flat' in note.fullName:
-                past_measure[note_name] = (Modifier('flat'), segment_measure)
-            else:
-                past_measure[note_name] = (Modifier('natural'), segment_measure)
-        for note in list(past_measure.keys()):
-            if past_measure[note][1] < segment_measure:
-                del past_measure[note]
-
+            step = STEPS.index(note.step)
+            sign = alteration_sign(note)
+            entry = melody_entries[step]
+            if entry is None or entry[0] != sign or past_measure.get(note.step) is not entry[1]:
+                entry = melody_entries[step] = (sign, (Modifier(MODIFIER_NAMES[sign]), segment_measure))
+            past_measure[note.step] = entry[1]
+
+        bass_ps = segment.bassNote.pitch.ps
         for key, modifier in segment.fbScale.modify.items():
-            if (
-                    key in past_measure and
-                    (
-                            (past_measure[key][0].accidental.name == 'flat' and modifier.accidental.name == 'sharp') or
-                            (past_measure[key][0].accidental.name == 'sharp' and modifier.accidental.name == 'flat')
-                    )
-            ):
+            past_accidental = past_measure[key][0].accidental.name if key in past_measure else None
+            accidental = modifier.accidental.name if modifier.accidental is not None else None
+            if (past_accidental, accidental) in (('flat', 'sharp'), ('sharp', 'flat')):
                 past_measure[key] = (Modifier('natural'), segment_measure)
-            elif modifier.accidental is not None:
-                if modifier.accidental.name == 'sharp' and Pitch(key).ps - segment.bassNote.pitch.ps in MAJOR_INTERVALS:
+            elif accidental is not None:
+                if accidental == 'sharp' and name_pitch_space(key) - bass_ps in MAJOR_INTERVALS:
                     modifier.accidental = Accidental('natural')
-                elif modifier.accidental.name == 'flat' and Pitch(
-                        key).ps - segment.bassNote.pitch.ps in MINOR_INTERVALS:
+                elif accidental == 'flat' and name_pitch_space(key) - bass_ps in MINOR_INTERVALS:
                     modifier.accidental = Accidental('natural')
                 past_measure[key] = (modifier, segment_measure)
         segment.update_pitch_names_in_chord(past_measure)
 
     for segment in segment_list:
-        segment.finish_initialization()
+        segment_table.finish_initialization(segment, rule_set)
 
 
 def prepare(
@@ -210,30 +286,51 @@ def prepare(
         start_offset=0,
         time_signature=TimeSignature()
 ):
+    inst = instrumentation.current()
+
     logging.log(logging.INFO, 'Parse stream to figured bass.')
-    fb_line = realizer.figured_bass_from_stream(bass)
-    fb_realization = fb_line.realize(rule_set=rule_set, start_offset=start_offset)
+    with inst.stage('figured_bass_from_stream'):
+        fb_line = realizer.figured_bass_from_stream(bass)
+        fb_realization = fb_line.realize(rule_set=rule_set, start_offset=start_offset)
 
     set_neighboring_segments(fb_realization.segment_list)
-    set_melody_pitches(fb_realization.segment_list, melody_parts)
-    set_melody_pitches_at_strike(fb_realization.segment_list, melody_parts)
-    last_dynamic = set_dynamic_markings(fb_realization.segment_list, melody_parts, previous_dynamic_marking)
-    handle_accidentals(fb_realization.segment_list)
+    with inst.stage('align_melody_parts'):
+        last_dynamic = align_melody_parts(fb_realization.segment_list, melody_parts, previous_dynamic_marking)
+    with inst.stage('handle_accidentals'):
+        handle_accidentals(fb_realization.segment_list, rule_set)
     set_on_beat(fb_realization.segment_list, time_signature, start_offset)
     set_ends_cadence(fb_realization.segment_list)
 
     return fb_realization, last_dynamic
 
 
-def realize_from_path(path, start_measure, end_measure):
+def select_measures(score, start_measure=None, end_measure=None):
+    """Cuts score to the given range of measures, if any."""
     if start_measure and not end_measure:
         raise FiguredBassLineException("Cannot only input starting measure.")
-    logging.log(logging.INFO, f'Started realizing {path}')
 
-    score = converter.parse(path)
     if end_measure:
         start_measure = start_measure or 0
         score = score.measures(start_measure, end_measure)
+    return score
+
+
+def load_score(path, start_measure=None, end_measure=None, use_cache=True):
+    """Parses the score at path, optionally cut to the given range of measures."""
+    if start_measure and not end_measure:
+        raise FiguredBassLineException("Cannot only input starting measure.")
+
+    score = score_cache.parse(path) if use_cache else converter.parse(path, forceSource=True, storePickle=False)
+    return select_measures(score, start_measure, end_measure)
+
+
+def realize_from_path(path, start_measure, end_measure, n_jobs=None, cache=None, beam_width=None):
+    if start_measure and not end_measure:
+        raise FiguredBassLineException("Cannot only input starting measure.")
+    logging.log(logging.INFO, f'Started realizing {path}')
+
+    with instrumentation.current().stage('parse', path=str(path)):
+        score = load_score(path, start_measure, end_measure)
 
     parts = score.parts
     basso_continuo_stream = parts[-1]
@@ -241,85 +338,362 @@ def realize_from_path(path, start_measure, end_measure):
     num_bass_notes = len(basso_continuo_stream.flatten().notes)
     num_total_notes = len(parts.flatten().notes)
 
-    realized_part = realize_part(basso_continuo_stream, score)
+    realized_part = realize_part(
+        basso_continuo_stream, score, n_jobs=n_jobs, cache=cache or chunk_cache.from_config(), beam_width=beam_width
+    )
+    segment_table.current().save()
     return create_score(parts, realized_part) #, num_bass_notes, num_total_notes
 
 
-def set_key(bass_part, score):
-    wa = analysis.windowed.WindowedAnalysis(score, analysis.discrete.KrumhanslKessler())
-    window_size = 12
-    a, b = wa.analyze(windowSize=min(window_size, int(bass_part.highestTime)))
+def set_key(bass_part, score, window_size=None):
+    if window_size is None:
+        window_size = config.key_window_size
+    tonics, names = key_estimation.estimate_keys(score, min(window_size, int(bass_part.highestTime)))
     for note in bass_part.flatten().notes:
-        window_left = min(max(0, int(note.offset) - window_size + min(int(note.duration.quarterLength), 4)), len(a)-1)
-        note.key_pitch_class = a[window_left][0].ps % 12
-        note.key_name = a[window_left][0].name
+        window_left = min(max(0, int(note.offset) - window_size + min(int(note.duration.quarterLength), 4)), len(names)-1)
+        note.key_pitch_class = float(tonics[window_left])
+        note.key_name = names[window_left]
 
 
-def set_ends_cadence(segment_list: list[Segment]):
+def set_ends_cadence(segment_list: list[Segment], provider=None):
+    """
+    Marks the segments ending a cadence, as decided for their bass notes by cadences.decide_piece. Candidates that
+    were not decided up front are decided together by provider.
+    """
+    candidates = {}
     for i, segment in enumerate(segment_list[1:]):
-        if int(segment.prev_segment.bassNote.pitch.ps) % 12 == (segment.bassNote.pitch.ps + 7) % 12:
-            if config.interactively_ask_cadence:
-                print(f"Is this a cadence? {segment.prev_segment} -> {segment} (y/n)")
-                if input().lower().strip() != 'y':
-                    continue
+        if cadences.is_cadence_motion(segment.prev_segment.bassNote.pitch, segment.bassNote.pitch):
+            candidates[i] = cadences.Candidate(segment.prev_segment.bassNote, segment.bassNote, segment.on_beat)
+
+    cadences.decide([c for c in candidates.values() if getattr(c.tonic, 'ends_cadence', None) is None], provider)
+    for i, candidate in candidates.items():
+        if candidate.tonic.ends_cadence:
             logging.info(f"Cadence found at segment {i}")
-            segment.ends_cadence = True
+            segment_list[i + 1].ends_cadence = True
 
 
-def realize_part(basso_continuo_part, score):
-    basso_continuo = basso_continuo_part.flatten()
-    time_signature = basso_continuo.timeSignature
+def generate_realization(fbRealization, beam_width=None, rule_set=None, chunk=None):
+    """
+    Searches the realization of the prepared chunk. Without beam_width every transition between the possibilities of
+    consecutive segments is searched and the result is optimal. With beam_width only the beam_width cheapest partial
+    realizations are extended at every segment, which bounds the time per segment at the risk of a costlier result.
+
+    The fork's generate_optimal_realization searches exhaustively; beam search, and exhaustive search with
+    config.use_search_module or config.vectorized_search, run in search.py, which reports the cost of the realization
+    as the search_cost counter. config.vectorized_search scores the rules voice_leading implements on all transitions
+    at once and searches exhaustively with voice_leading.optimal_path.
+    """
+    if beam_width is None and not (config.use_search_module or config.vectorized_search):
+        return fbRealization.generate_optimal_realization()
+    costs = search.ChunkCosts(
+        fbRealization.segment_list, rule_set if rule_set is not None else RuleSet(), config.vectorized_search
+    )
+    if beam_width is None and config.vectorized_search:
+        result = search.optimal_search(costs)
+    else:
+        result = search.beam_search(costs, beam_width)
+    instrumentation.current().count('search_cost', result.cost, chunk=chunk)
+    return search.render(costs, result.path)
 
-    set_key(basso_continuo, score)
 
-    # split fbLine on rests
-    melody_parts = [p.flatten() for p in score.parts[:-1]]
-    tups, rests = split_on_rests(basso_continuo, melody_parts)
+def realize_chunk(bass, melodies, prev_dynamic, rule_set, start_offset, time_signature, chunk=None, beam_width=None):
+    """Prepares and realizes a single chunk. Used as the unit of work for parallel realization."""
+    inst = instrumentation.current()
+    with inst.stage('prepare', chunk=chunk):
+        fbRealization, _ = prepare(bass, melodies, prev_dynamic, rule_set, start_offset, time_signature)
+    if inst.enabled:
+        instrumentation.report_segments(inst, fbRealization.segment_list, chunk=chunk)
 
-    rule_set = RuleSet()
+    logging.log(logging.INFO, "Generating Optimal Realization.\n\n")
+    with inst.stage('generate_optimal_realization', chunk=chunk):
+        return generate_realization(fbRealization, beam_width, rule_set, chunk)
+
+
+def realize_chunk_recorded(*args, **kwargs):
+    """realize_chunk in a worker process, returning the realization and the events recorded while realizing it."""
+    with instrumentation.recording(instrumentation.Recorder()) as recorder:
+        realization = realize_chunk(*args, **kwargs)
+    return realization, recorder.events
+
+
+def realize_chunks_parallel(tups, rule_set, time_signature, n_jobs, prev_dynamic=None, cache=None, beam_width=None):
+    """
+    Realizes the chunks from split_on_rests on a worker pool.
+    The dynamic marking handed from one chunk to the next is computed up front, so chunks are independent.
+    With a ChunkCache, only chunks that are not in the cache are realized.
+    """
+    inst = instrumentation.current()
+
+    prev_dynamics = []
+    for bass, melodies, _ in tups:
+        prev_dynamics.append(prev_dynamic)
+        if bass.quarterLength == 0:
+            continue
+        prev_dynamic = last_dynamic_marking(bass, melodies, prev_dynamic)
+
+    realizations = [None] * len(tups)
+    keys = [None] * len(tups)
+    todo = []
+    for i, (bass, melodies, start_offset) in enumerate(tups):
+        if bass.quarterLength == 0:
+            continue
+        if cache is not None:
+            keys[i] = cache.key(bass, melodies, prev_dynamics[i], rule_set, start_offset, time_signature, beam_width)
+            realizations[i] = cache.load(keys[i])
+        if realizations[i] is None:
+            todo.append(i)
+    if cache is not None:
+        inst.count('cached_chunks', len(tups) - len(todo))
+
+    worker = realize_chunk_recorded if inst.enabled else realize_chunk
+    jobs = [
+        delayed(worker)(
+            tups[i][0], tups[i][1], prev_dynamics[i], rule_set, tups[i][2], time_signature, chunk=i, beam_width=beam_width
+        )
+        for i in todo
+    ]
+    results = Parallel(n_jobs=n_jobs)(jobs)
+    if inst.enabled:
+        for _, events in results:
+            inst.extend(events)
+        results = [realization for realization, _ in results]
+
+    for i, realization in zip(todo, results):
+        realizations[i] = realization
+        if cache is not None:
+            cache.store(keys[i], realization)
+
+    return realizations, prev_dynamic
+
+
+def realize_chunks(tups, rule_set, time_signature, n_jobs=None, prev_dynamic=None, cache=None, beam_width=None):
+    """
+    Realizes the chunks from split_on_rests, in parallel if n_jobs is other than None or 1.
+    Chunks found in the ChunkCache cache are not realized again. See generate_realization for beam_width.
+    Returns the realizations (None for empty chunks) and the dynamic marking in effect after the last chunk.
+    """
+    if (n_jobs is not None and n_jobs != 1) or cache is not None:
+        return realize_chunks_parallel(tups, rule_set, time_signature, n_jobs or 1, prev_dynamic, cache, beam_width)
+
+    inst = instrumentation.current()
 
-    full_harmonies = Stream()
-    prev_dynamic = None
     fbRealizations = []
     for i, (bass, melodies, start_offset) in enumerate(tups):
         if bass.quarterLength == 0:
             fbRealizations.append(None)
             continue
-        fbRealization, prev_dynamic = prepare(bass, melodies, prev_dynamic, rule_set, start_offset, time_signature)
+        with inst.stage('prepare', chunk=i):
+            fbRealization, prev_dynamic = prepare(bass, melodies, prev_dynamic, rule_set, start_offset, time_signature)
+        if inst.enabled:
+            instrumentation.report_segments(inst, fbRealization.segment_list, chunk=i)
         fbRealizations.append(fbRealization)
 
     realizations = []
-    for fbRealization in fbRealizations:
+    for i, fbRealization in enumerate(fbRealizations):
         if fbRealization is None:
             realizations.append(None)
             continue
         logging.log(logging.INFO, "Generating Optimal Realization.\n\n")
-        realizations.append(fbRealization.generate_optimal_realization())
+        with inst.stage('generate_optimal_realization', chunk=i):
+            realizations.append(generate_realization(fbRealization, beam_width, rule_set, i))
 
-    for i, (bass, _, _) in enumerate(tups):
-        realization = realizations[i]
-        if realization is None:
-            continue
-        if i > 0:
-            full_harmonies.append(rests[i - 1])
-        new_harmonies, new_bass = (p.flatten() for p in realization.parts)
-        for note in new_harmonies.notes:
-            full_harmonies.append(note)
+    return realizations, prev_dynamic
 
-    # reconstruct proper formatting
-    time_signatures = basso_continuo_part.recurse().getElementsByClass(TimeSignature)
-    for time_signature in time_signatures:
-        time_signature.offset = time_signature.getOffsetBySite(basso_continuo_part.recurse())
-        full_harmonies.insert(time_signature)
 
-    if basso_continuo.keySignature:
-        full_harmonies.insert(basso_continuo.keySignature)
+def memoized_rule_set():
+    """A RuleSet whose rule costs are memoized across the chunks realized with it, unless disabled in config."""
+    rule_set = RuleSet()
+    if config.rule_cache_size:
+        rule_cache.memoize_rules(rule_set, rule_cache.RuleCostCache(config.rule_cache_size))
+    return rule_set
 
-    harmonies = Part(id='part0')
-    for measure in full_harmonies.makeMeasures(refStreamOrTimeRange=score.parts[0]):
-        harmonies.append(measure)
 
-    return harmonies
+def report_rule_cache(rule_set):
+    cost_cache = getattr(rule_set, 'cost_cache', None)
+    if cost_cache is not None:
+        inst = instrumentation.current()
+        inst.count('rule_cache_hits', cost_cache.hits)
+        inst.count('rule_cache_misses', cost_cache.misses)
+
+
+def realize_part(basso_continuo_part, score, n_jobs=None, cache=None, beam_width=None, with_chunks=False):
+    """
+    Realizes the basso continuo part. With n_jobs other than None or 1, the chunks between rests
+    are realized in parallel (joblib semantics, -1 uses all cores). With a ChunkCache, chunks that
+    were realized before are taken from the cache. With beam_width, chunks are realized with beam
+    search instead of the exhaustive search. With with_chunks, the (start, end) offsets of the
+    realized chunks (see chunk_spans) are returned with the part.
+    """
+    inst = instrumentation.current()
+
+    basso_continuo = basso_continuo_part.flatten()
+    time_signature = basso_continuo.timeSignature
+
+    with inst.stage('set_key'):
+        set_key(basso_continuo, score)
+    with inst.stage('decide_cadences'):
+        cadences.decide_piece(basso_continuo, time_signature)
+
+    # split fbLine on rests
+    melody_parts = [p.flatten() for p in score.parts[:-1]]
+    with inst.stage('split_on_rests'):
+        tups, rests = split_on_rests(basso_continuo, melody_parts)
+    inst.count('chunks', len(tups))
+
+    rule_set = memoized_rule_set()
+    realizations, _ = realize_chunks(tups, rule_set, time_signature, n_jobs, cache=cache, beam_width=beam_width)
+    report_rule_cache(rule_set)
+
+    with inst.stage('assemble_realization'):
+        part = assemble_realization(basso_continuo_part, rests, realizations)
+    if with_chunks:
+        return part, chunk_spans(tups)
+    return part
+
+
+def chunk_spans(tups):
+    """The (start, end) offsets in the part of the chunks of split_on_rests that have notes to realize."""
+    spans = []
+    start = 0
+    for bass, _, start_offset in tups:
+        start += start_offset
+        if bass.quarterLength > 0:
+            spans.append((float(start), float(start + bass.highestTime)))
+    return spans
+
+
+def realize_windows(score, window_size=8, overlap=1, n_jobs=None, cache=None, beam_width=None):
+    """
+    Realizes the score window_size measures at a time and yields the realized measures as soon as their window is
+    done, so memory stays bounded by the window instead of the piece. The dynamic marking is carried across window
+    boundaries. Every window also realizes the `overlap` measures before it, so the search starts from the voice
+    leading that precedes the window; the measures realized for that context are discarded.
+
+    Keys and cadences are decided on the whole piece, as realize_part does, so a window is realized with the keys the
+    whole piece would be.
+    """
+    inst = instrumentation.current()
+
+    measure_numbers = [m.number for m in score.parts[-1].getElementsByClass(Measure)]
+    # windows share the notes of the score, so the keys and cadences of the piece are decided once, up front
+    basso_continuo = score.parts[-1].flatten()
+    with inst.stage('set_key'):
+        set_key(basso_continuo, score)
+    with inst.stage('decide_cadences'):
+        cadences.decide_piece(basso_continuo, basso_continuo.timeSignature)
+    rule_set = memoized_rule_set()
+    prev_dynamic = None
+    for window_start in range(0, len(measure_numbers), window_size):
+        window_end = min(window_start + window_size, len(measure_numbers))
+        context_start = max(0, window_start - overlap)
+
+        with inst.stage('realize_window', start=measure_numbers[window_start]):
+            excerpt = score.measures(measure_numbers[context_start], measure_numbers[window_end - 1])
+            basso_continuo_part = excerpt.parts[-1]
+            basso_continuo = basso_continuo_part.flatten()
+            melody_parts = [p.flatten() for p in excerpt.parts[:-1]]
+            tups, rests = split_on_rests(basso_continuo, melody_parts)
+            realizations, last_dynamic = realize_chunks(
+                tups, rule_set, basso_continuo.timeSignature, n_jobs, prev_dynamic, cache, beam_width
+            )
+            # only the first window starts the part, the windows after it continue its clef and signatures
+            assembler = MeasureAssembler(basso_continuo_part, part_signatures=window_start == 0)
+            assembler.add_chunks(rests, realizations)
+            if window_start == 0:
+                assembler.add_clef()
+            measures = assembler.measures[window_start - context_start:]
+            if window_end == len(measure_numbers):
+                measures[-1].rightBarline = 'final'
+
+        # dynamics inside the overlap of the next window are read again from its melody parts
+        prev_dynamic = last_dynamic
+        for number, measure in zip(measure_numbers[window_start:window_end], measures):
+            measure.number = number
+            yield measure
+
+    report_rule_cache(rule_set)
+
+
+class MeasureAssembler:
+    """
+    Builds the realized part in the measures of the bass part. Realized notes are appended one after the other, chunk
+    by chunk as they are realized, straight into the measure they fall in, and notes crossing a barline are split and
+    tied.
+    """
+
+    def __init__(self, basso_continuo_part, part_signatures=True):
+        self.part = Part(id='part0')
+        self.measures = []
+        self.starts = []
+        self.offset = 0.0
+        for measure in basso_continuo_part.getElementsByClass(Measure):
+            realized_measure = Measure(number=measure.number)
+            self.part.coreInsert(measure.offset, realized_measure)
+            self.measures.append(realized_measure)
+            self.starts.append(opFrac(measure.offset))
+        self.part.coreElementsChanged()
+        self.ends = self.starts[1:] + [opFrac(self.starts[-1] + measures_length(basso_continuo_part))]
+
+        # excerpts made with Score.measures keep the signatures of their first measure outside of the measures, these
+        # are left out without part_signatures, for an excerpt continuing a part that has them already
+        outside = {id(s) for s in basso_continuo_part.getElementsByClass([TimeSignature, key.KeySignature])}
+        for signature in basso_continuo_part.recurse().getElementsByClass([TimeSignature, key.KeySignature]):
+            if not part_signatures and id(signature) in outside:
+                continue
+            offset = opFrac(signature.getOffsetInHierarchy(basso_continuo_part))
+            i = max(bisect.bisect_right(self.starts, offset) - 1, 0)
+            self.measures[i].insert(opFrac(offset - self.starts[i]), copy.deepcopy(signature))
+
+    def append(self, element):
+        """Appends element after the elements appended before, splitting it at the barlines it crosses."""
+        while True:
+            i = max(bisect.bisect_right(self.starts, self.offset) - 1, 0)
+            end = opFrac(self.offset + element.quarterLength)
+            if end > self.ends[i] and i < len(self.measures) - 1:
+                element, remainder = element.splitAtQuarterLength(self.ends[i] - self.offset)
+            else:
+                remainder = None
+            self.measures[i].insert(opFrac(self.offset - self.starts[i]), element)
+            self.offset = opFrac(self.offset + element.quarterLength)
+            if remainder is None:
+                return
+            element = remainder
+
+    def add_chunk(self, realization, rest=None):
+        """Appends the realized notes of a chunk, after the rest separating it from the chunk before."""
+        if rest is not None:
+            self.append(copy.deepcopy(rest))
+        for note in realization.parts[0].flatten().notes:
+            self.append(note)
+
+    def add_chunks(self, rests, realizations):
+        """Appends the realized chunks, with the rests between them. Chunks without notes are None."""
+        for i, realization in enumerate(realizations):
+            if realization is None:
+                continue
+            self.add_chunk(realization, rests[i - 1] if i > 0 else None)
+
+    def add_clef(self, i=0):
+        """Inserts the clef fitting the realized notes at the start of the i-th measure."""
+        self.measures[i].insert(0, clef.bestClef(self.part, recurse=True))
+
+    def finish(self):
+        """Returns the realized part, with a clef fitting its notes and a final barline."""
+        self.add_clef()
+        self.measures[-1].rightBarline = 'final'
+        return self.part
+
+
+def measures_length(part):
+    last = part.getElementsByClass(Measure).last()
+    return max(last.quarterLength, last.barDuration.quarterLength)
+
+
+def assemble_realization(basso_continuo_part, rests, realizations):
+    """Joins the realized chunks, with the rests between them, into a part with the measures of the bass part."""
+    assembler = MeasureAssembler(basso_continuo_part)
+    assembler.add_chunks(rests, realizations)
+    return assembler.finish()
 
 
 def create_score(parts, harmonies):
@@ -331,12 +705,25 @@ def create_score(parts, harmonies):
     return s
 
 
+def positive_int(text):
+    """argparse type of options that must be positive integers."""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f'{text} is not a positive integer')
+    return value
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-s", "--start", type=int, help="Measure to start realizing from.", default=None)
     parser.add_argument("-e", "--end", type=int, help="Measure to end realizing.", default=None)
     parser.add_argument("-p", "--piece", choices=config.pieces, default=config.default_piece)
+    parser.add_argument("-j", "--jobs", type=int, help="Realize chunks between rests in parallel.", default=None)
     parser.add_argument("-L", "--logging", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("-w", "--window", type=int, help="Realize this many measures at a time.", default=None)
+    parser.add_argument("-t", "--trace", type=Path, help="Write a Chrome trace of the run to this file.")
+    parser.add_argument("-b", "--beam-width", type=positive_int, help="Realize with beam search of this width.",
+                        default=config.beam_width)
     args = parser.parse_args()
 
     logging.basicConfig(
@@ -350,4 +737,25 @@ if __name__ == '__main__':
     piece_file_name = config.pieces[piece_name]["path"]
 
     file_path = Path.cwd() / "test_pieces" / piece_file_name
-    realize_from_path(file_path, start_measure=args.start, end_measure=args.end).show()
+    recorder = instrumentation.Recorder() if args.trace else instrumentation.Instrumentation()
+    with instrumentation.recording(recorder):
+        if args.window:
+            score = load_score(file_path, args.start, args.end)
+            harmonies = Part(id='part0')
+            windows = realize_windows(
+                score, window_size=args.window, n_jobs=args.jobs, cache=chunk_cache.from_config(),
+                beam_width=args.beam_width,
+            )
+            for realized_measure in windows:
+                logging.log(logging.INFO, f'Realized measure {realized_measure.number}.')
+                harmonies.append(realized_measure)
+            realized_score = create_score(score.parts, harmonies)
+        else:
+            realized_score = realize_from_path(
+                file_path, start_measure=args.start, end_measure=args.end, n_jobs=args.jobs,
+                beam_width=args.beam_width,
+            )
+    if args.trace:
+        recorder.write_chrome_trace(args.trace)
+        print(recorder.summary())
+    realized_score.show()
@@ -0,0 +1,130 @@
+"""
+Memoized rule costs.
+
+Rules are evaluated for every possibility of every segment and for every pair of possibilities of consecutive
+segments, while the same voicings over the same bass notes and figures recur all through a piece. RuleCostCache keeps
+the costs in a bounded LRU cache keyed on the spelled pitches of the possibilities and on the segment attributes the
+rule depends on. memoize_rules installs it on the rules of a RuleSet, so every chunk realized with that rule set
+shares it.
+"""
+import hashlib
+import pickle
+from collections import OrderedDict
+
+import config
+
+# Whether the cost of a rule depends on the segments it is evaluated for. Rules not listed here are not memoized.
+SEGMENT_DEPENDENCIES = {
+    'ParallelFifths': False,
+    'HiddenFifth': False,
+    'AvoidDoubling': True,
+}
+
+
+class RuleCostCache:
+    """LRU cache of rule costs with hit and miss counters."""
+
+    def __init__(self, max_size=None):
+        self.max_size = config.rule_cache_size if max_size is None else max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """Returns the cost stored under key, computing and storing it with compute() if there is none."""
+        try:
+            cost = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            cost = self.entries[key] = compute()
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return cost
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        # copies sent to worker processes (and rule sets hashed for the chunk cache) start out empty
+        return {'max_size': self.max_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_size'])
+
+
+def possibility_key(possibility):
+    return tuple(p.nameWithOctave for p in getattr(possibility, 'pitches', possibility))
+
+
+def segment_key(segment):
+    """The attributes of a segment set by realize.prepare that rules can depend on, independent of its position."""
+    bass = segment.bassNote
+    return (
+        bass.pitch.nameWithOctave,
+        tuple(lyric.text for lyric in bass.lyrics),
+        getattr(bass, 'key_pitch_class', None),
+        getattr(bass, 'key_name', None),
+        tuple(tuple(sorted(option.pitch_names_in_chord)) for option in segment.segment_options),
+        tuple(sorted(p.nameWithOctave for p in segment.melody_pitches)),
+        tuple(sorted(p.nameWithOctave for p in segment.melody_pitches_at_strike)),
+        segment.dynamic,
+        segment.on_beat,
+        getattr(segment, 'ends_cadence', False),
+    )
+
+
+class MemoizedCost:
+    """Replaces the get_cost method of a rule, looking its costs up in a RuleCostCache."""
+
+    def __init__(self, rule, name, cache, uses_segments):
+        self.rule = rule
+        self.name = name
+        self.cache = cache
+        self.uses_segments = uses_segments
+
+    def argument_key(self, argument):
+        if argument is None:
+            return None
+        if hasattr(argument, 'bassNote'):
+            return segment_key(argument) if self.uses_segments else None
+        return possibility_key(argument)
+
+    def __call__(self, *args):
+        key = (self.name, *(self.argument_key(argument) for argument in args))
+        return self.cache.get(key, lambda: type(self.rule).get_cost(self.rule, *args))
+
+
+def rule_set_fingerprint(rule_set):
+    """A hex digest of the rules and their settings in rule_set, without the costs memoized for them."""
+    return hashlib.sha256(pickle.dumps(rule_set)).hexdigest()
+
+
+def find_rules(rule_set):
+    """The rules held by rule_set, directly or in lists, tuples or dicts, in a stable order."""
+    rules = []
+    for value in vars(rule_set).values():
+        values = value.values() if isinstance(value, dict) else value if isinstance(value, (list, tuple)) else [value]
+        rules.extend(v for v in values if callable(getattr(v, 'get_cost', None)))
+    return rules
+
+
+def memoize_rules(rule_set, cache=None, dependencies=SEGMENT_DEPENDENCIES):
+    """
+    Memoizes the costs of the rules in rule_set listed in dependencies in cache, a new RuleCostCache by default.
+    Returns the cache, which is also available as rule_set.cost_cache.
+    """
+    cache = cache if cache is not None else RuleCostCache()
+    for i, rule in enumerate(find_rules(rule_set)):
+        name = type(rule).__name__
+        if name in dependencies and not isinstance(rule.get_cost, MemoizedCost):
+            rule.get_cost = MemoizedCost(rule, (i, name), cache, dependencies[name])
+    rule_set.cost_cache = cache
+    return cache
@@ -0,0 +1,118 @@
+"""
+On-disk cache of parsed scores.
+
+Parsing large MusicXML files takes seconds, so parsed scores are stored as frozen music21 streams. Entries are keyed by
+the SHA-256 of the file content and the music21 version, so an edited file or a music21 upgrade never returns a stale
+score, whatever the modification time of the file, and copies of a file share their entry. The cache is capped in size
+and evicts the least recently used entries.
+
+music21's own pickle cache is bypassed: it is keyed on the path, trusts modification times and lives in the scratch
+directory of music21, which is global to the process.
+"""
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import music21
+from music21 import converter
+
+import config
+
+
+class DiskCache:
+    """
+    Directory of frozen music21 streams keyed by hex digests, capped in size (None for no cap) with LRU eviction.
+    """
+
+    def __init__(self, directory, max_size=None):
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+    def load(self, key):
+        """Returns the stream stored under key, or None."""
+        entry = self.directory / f'{key}.p'
+        if not entry.exists():
+            return None
+        try:
+            stream = converter.thaw(entry)
+        except Exception as e:  # a corrupt or incompatible entry is a miss
+            logging.warning(f'Discarding unreadable cache entry {entry}: {e}')
+            entry.unlink(missing_ok=True)
+            return None
+        os.utime(entry)  # mark as recently used
+        return stream
+
+    def store(self, key, stream):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = self.directory / f'{key}.p'
+        tmp = entry.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            converter.freeze(stream, fmt='pickle', fp=tmp)
+            os.replace(tmp, entry)
+        except Exception as e:  # caching is best effort
+            logging.warning(f'Could not cache {entry}: {e}')
+            tmp.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def remove(self, key):
+        (self.directory / f'{key}.p').unlink(missing_ok=True)
+
+    def entries(self):
+        if not self.directory.exists():
+            return []
+        return list(self.directory.glob('*.p'))
+
+    def size(self):
+        return sum(entry.stat().st_size for entry in self.entries())
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_size."""
+        if self.max_size is None:
+            return
+        entries = sorted(self.entries(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_size:
+                break
+            total -= entry.stat().st_size
+            entry.unlink(missing_ok=True)
+
+    def clear(self):
+        for entry in self.entries():
+            entry.unlink(missing_ok=True)
+
+
+def score_key(path):
+    """The hex digest of the content of the file at path and the music21 version."""
+    digest = hashlib.sha256()
+    digest.update(music21.VERSION_STR.encode())
+    digest.update(b'\0')
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ScoreCache(DiskCache):
+    def parse(self, path):
+        """Returns the parsed score at path, from the cache if possible."""
+        key = score_key(path)
+        score = self.load(key)
+        if score is None:
+            score = converter.parse(path, forceSource=True, storePickle=False)
+            self.store(key, score)
+        return score
+
+
+def parse(path, directory=None, max_size=None):
+    """
+    Drop-in replacement for converter.parse on score files, cached in directory within max_size bytes. Both default to
+    config, and with config.score_cache_dir None the file is always parsed.
+    """
+    directory = config.score_cache_dir if directory is None else directory
+    max_size = config.score_cache_max_size if max_size is None else max_size
+    if directory is None:
+        return converter.parse(path, forceSource=True, storePickle=False)
+    return ScoreCache(directory, max_size).parse(path)
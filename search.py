@@ -0,0 +1,155 @@
+"""
+Search of the realization of a prepared chunk, for searches the fork's generate_optimal_realization does not offer.
+
+The costs are those of the rules of the rule set (see rule_cache.find_rules), as in music21.improvedFiguredBass.rules:
+a rule whose get_cost takes a possibility and its segment is a local rule, one taking two possibilities and their two
+segments a transition rule. The possibilities of a segment are segment.possibilities.
+
+beam_search extends, at every segment, only the beam_width cheapest partial realizations (at most one ending in every
+possibility), so transitions are only scored from beam_width possibilities. Without beam_width it extends the
+cheapest partial realization ending in every possibility, which finds the optimal realization under the same costs,
+the reference the cost of a beam search is compared with.
+
+With vectorized, the transition rules voice_leading implements are scored on the possibility matrices of the segments,
+all pairs of possibilities of consecutive segments at once, and optimal_search finds the optimal realization with
+voice_leading.optimal_path.
+"""
+import inspect
+from dataclasses import dataclass
+
+import numpy as np
+from music21.chord import Chord
+from music21.stream import Part, Score
+
+import rule_cache
+import voice_leading
+
+LOCAL_ARGUMENTS = 2  # possibility, segment
+TRANSITION_ARGUMENTS = 4  # previous possibility, possibility, previous segment, segment
+
+# transition rules of music21.improvedFiguredBass.rules to the voice_leading functions scoring them
+VECTORIZED_RULES = {
+    'ParallelFifths': voice_leading.parallel_fifths,
+    'HiddenFifth': voice_leading.hidden_fifths,
+}
+
+
+@dataclass
+class SearchResult:
+    path: list  # the index of the chosen possibility of every segment
+    cost: float
+
+
+def split_rules(rule_set):
+    """The local and the transition rules of rule_set, told apart by the arguments of their get_cost."""
+    local_rules, transition_rules = [], []
+    for rule in rule_cache.find_rules(rule_set):
+        arguments = len(inspect.signature(type(rule).get_cost).parameters) - 1
+        if arguments == LOCAL_ARGUMENTS:
+            local_rules.append(rule)
+        elif arguments == TRANSITION_ARGUMENTS:
+            transition_rules.append(rule)
+        else:
+            raise ValueError(f'Cannot tell whether {type(rule).__name__} is a local or a transition rule.')
+    return local_rules, transition_rules
+
+
+def segment_possibilities(segment):
+    possibilities = getattr(segment, 'possibilities', None)
+    if possibilities is None:
+        raise ValueError('The segments do not expose their possibilities.')
+    return list(possibilities)
+
+
+class ChunkCosts:
+    """The local and transition costs of the possibilities of the segments of a chunk."""
+
+    def __init__(self, segments, rule_set, vectorized=False):
+        self.segments = segments
+        self.possibilities = [segment_possibilities(segment) for segment in segments]
+        self.local_rules, self.transition_rules = split_rules(rule_set)
+        self.matrices = None
+        self.vectorized_rules = {}
+        if vectorized and len({len(getattr(p, 'pitches', p)) for ps in self.possibilities for p in ps}) == 1:
+            # rows of a matrix need the same number of voices, else every rule is scored pair by pair
+            self.matrices = [voice_leading.possibility_matrix(possibilities) for possibilities in self.possibilities]
+            self.vectorized_rules = {
+                rule: VECTORIZED_RULES[type(rule).__name__]
+                for rule in self.transition_rules if type(rule).__name__ in VECTORIZED_RULES
+            }
+
+    def local_costs(self, i):
+        segment = self.segments[i]
+        return np.array([
+            sum(rule.get_cost(possibility, segment) for rule in self.local_rules)
+            for possibility in self.possibilities[i]
+        ], dtype=float)
+
+    def transition_costs(self, i, rows):
+        """The (rows, possibilities) costs from the possibilities rows of segment i to those of segment i + 1."""
+        previous_segment, segment = self.segments[i], self.segments[i + 1]
+        costs = np.zeros((len(rows), len(self.possibilities[i + 1])))
+        for rule, function in self.vectorized_rules.items():
+            costs += rule.cost * function(self.matrices[i][rows], self.matrices[i + 1])
+        rules = [rule for rule in self.transition_rules if rule not in self.vectorized_rules]
+        if not rules:
+            return costs
+        for r, row in enumerate(rows):
+            previous = self.possibilities[i][row]
+            for j, possibility in enumerate(self.possibilities[i + 1]):
+                costs[r, j] += sum(rule.get_cost(previous, possibility, previous_segment, segment) for rule in rules)
+        return costs
+
+
+def beam_search(costs, beam_width=None):
+    """
+    Returns the SearchResult of the cheapest realization found keeping at most beam_width partial realizations per
+    segment, the optimal realization without beam_width.
+    """
+    if beam_width is not None and beam_width < 1:
+        raise ValueError(f'The beam width must be positive, not {beam_width}.')
+    totals = costs.local_costs(0)
+    rows = np.arange(len(totals))
+    back_pointers = []
+    for i in range(len(costs.segments) - 1):
+        if beam_width is not None and len(rows) > beam_width:
+            rows = rows[np.argpartition(totals[rows], beam_width - 1)[:beam_width]]
+        candidates = totals[rows, None] + costs.transition_costs(i, rows)
+        best = np.argmin(candidates, axis=0)
+        back_pointers.append(rows[best])
+        totals = candidates[best, np.arange(candidates.shape[1])] + costs.local_costs(i + 1)
+        rows = np.arange(len(totals))
+
+    path = [int(np.argmin(totals))]
+    for best in reversed(back_pointers):
+        path.append(int(best[path[-1]]))
+    return SearchResult(path[::-1], float(totals.min()))
+
+
+def optimal_search(costs):
+    """The SearchResult of the optimal realization, searched with voice_leading.optimal_path."""
+    path, cost = voice_leading.optimal_path(
+        [costs.local_costs(i) for i in range(len(costs.segments))],
+        [costs.transition_costs(i, np.arange(len(costs.possibilities[i]))) for i in range(len(costs.segments) - 1)],
+    )
+    return SearchResult(path, cost)
+
+
+def upper_pitches(possibility, segment):
+    """The pitches of a possibility without the bass note, which the bass part already plays."""
+    pitches = list(getattr(possibility, 'pitches', possibility))
+    bass = [p for p in pitches if p.ps == segment.bassNote.pitch.ps]
+    if bass:
+        pitches.remove(min(bass, key=lambda p: p.ps))
+    return pitches
+
+
+def render(costs, path):
+    """The realization as generate_optimal_realization returns it: a score whose first part holds the chords."""
+    harmonies = Part()
+    for segment, possibilities, p in zip(costs.segments, costs.possibilities, path):
+        start, end = segment.play_offsets[0], segment.play_offsets[1]
+        harmonies.insert(start, Chord(upper_pitches(possibilities[p], segment), quarterLength=end - start))
+    realization = Score()
+    realization.insert(0, harmonies)
+    return realization
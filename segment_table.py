@@ -0,0 +1,180 @@
+"""
+Process-wide table of initialized segments.
+
+Segment.finish_initialization enumerates the options and possibilities of a segment from scratch, while the same
+bass note with the same figures in the same key and under the same accidentals recurs hundreds of times in a piece and
+across pieces. The table stores the state of a segment after finish_initialization, keyed by everything it reads, so a
+recurring segment only copies it. The table can be saved to and loaded from disk, so it survives across runs.
+
+The stored state is everything but the attributes describing where the segment is (CONTEXT_ATTRIBUTES), deep-copied
+both when it is stored and for every segment it is copied to, so segments never share mutable state. References to
+the segment itself, its context and the rule set are stored as References and resolved for the segment copied to.
+"""
+import copy
+import logging
+import os
+import pickle
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+
+import config
+import rule_cache
+
+# bump when the keys or the stored attributes change
+TABLE_VERSION = 2
+
+# attributes that belong to the position of a segment in its chunk, set before finish_initialization
+CONTEXT_ATTRIBUTES = (
+    'bassNote', 'prev_segment', 'next_segment', 'play_offsets', 'melody_pitches', 'melody_pitches_at_strike',
+    'dynamic', 'on_beat', 'ends_cadence', 'past_measure',
+)
+ATOMIC_TYPES = (type(None), bool, int, float, str)
+
+
+@dataclass(frozen=True)
+class Reference:
+    """Stands in for the segment ('segment'), one of its context attributes or its rule set ('rule_set')."""
+    name: str
+
+
+def segment_signature(segment, rule_key=None):
+    """
+    The inputs of finish_initialization: the bass note with its figures and key, and the pitch names of the chord
+    options, which already include the accidentals of the measure (see realize.handle_accidentals), the melody and
+    the rule set, by its rule_cache.rule_set_fingerprint.
+    """
+    bass = segment.bassNote
+    return (
+        rule_key,
+        bass.pitch.nameWithOctave,
+        float(bass.duration.quarterLength),
+        tuple(lyric.text for lyric in bass.lyrics),
+        getattr(bass, 'notationString', None),
+        getattr(bass, 'key_name', None),
+        tuple(tuple(sorted(option.pitch_names_in_chord)) for option in segment.segment_options),
+        tuple(sorted(p.nameWithOctave for p in segment.melody_pitches)),
+        tuple(sorted(p.nameWithOctave for p in segment.melody_pitches_at_strike)),
+        segment.dynamic,
+    )
+
+
+def context(segment, rule_set=None):
+    """The objects references to which are stored as References, by name."""
+    objects = {'segment': segment, 'rule_set': rule_set}
+    objects.update((name, value) for name, value in vars(segment).items() if name in CONTEXT_ATTRIBUTES)
+    return {name: value for name, value in objects.items() if not isinstance(value, ATOMIC_TYPES)}
+
+
+def snapshot(segment, rule_set=None):
+    """
+    The state of segment apart from its context attributes, deep-copied with References to its context, and the
+    References by name.
+    """
+    objects = context(segment, rule_set)
+    references = {name: Reference(name) for name in objects}
+    memo = {id(value): references[name] for name, value in objects.items()}
+    state = {name: value for name, value in vars(segment).items() if name not in CONTEXT_ATTRIBUTES}
+    return references, copy.deepcopy(state, memo)
+
+
+def restore(segment, entry, rule_set=None):
+    """Sets a copy of the state of a snapshot on segment, resolving its References to the context of segment."""
+    references, state = entry
+    objects = context(segment, rule_set)
+    memo = {id(reference): objects.get(name) for name, reference in references.items()}
+    vars(segment).update(copy.deepcopy(state, memo))
+
+
+class SegmentTable:
+    """Snapshots of initialized segments by segment signature, with hit and miss counters."""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.unsaved = 0  # entries added since the table was loaded or saved
+        # rule set -> fingerprint, not keeping the rule sets (and their cost caches) alive
+        self.rule_keys = weakref.WeakKeyDictionary()
+        if self.path is not None:
+            self.load()
+
+    def rule_key(self, rule_set):
+        if rule_set is None:
+            return None
+        if rule_set not in self.rule_keys:
+            self.rule_keys[rule_set] = rule_cache.rule_set_fingerprint(rule_set)
+        return self.rule_keys[rule_set]
+
+    def finish_initialization(self, segment, rule_set=None):
+        """
+        Initializes segment, realized with rule_set, copying the state of an equal segment initialized before if there
+        is one.
+        """
+        signature = segment_signature(segment, self.rule_key(rule_set))
+        entry = self.entries.get(signature)
+        if entry is not None:
+            self.hits += 1
+            restore(segment, entry, rule_set)
+            return
+
+        self.misses += 1
+        segment.finish_initialization()
+        self.entries[signature] = snapshot(segment, rule_set)
+        self.unsaved += 1
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                version, entries = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:  # an unreadable table is rebuilt
+            logging.warning(f'Discarding unreadable segment table {self.path}: {e}')
+            return
+        if version == TABLE_VERSION:
+            self.entries.update(entries)
+
+    def save(self):
+        """Writes the table to its path, if it has one and new entries. Best effort, like the disk caches."""
+        if self.path is None or not self.unsaved:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump((TABLE_VERSION, self.entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+            self.unsaved = 0
+        except Exception as e:
+            logging.warning(f'Could not save segment table {self.path}: {e}')
+            tmp.unlink(missing_ok=True)
+
+    def clear(self):
+        self.entries.clear()
+        self.rule_keys.clear()
+        self.unsaved = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_table = None
+
+
+def current():
+    """The table of this process, loaded from config.segment_table_path on first use."""
+    global _table
+    if _table is None:
+        _table = SegmentTable(config.segment_table_path)
+    return _table
+
+
+def finish_initialization(segment, rule_set=None):
+    if config.use_segment_table:
+        current().finish_initialization(segment, rule_set)
+    else:
+        segment.finish_initialization()
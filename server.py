@@ -0,0 +1,282 @@
+"""
+Resident realization server.
+
+Every run of realize.py pays for the interpreter, the music21 imports and cold caches before the first segment is
+realized. The server pays for them once: it starts a pool of worker processes that import everything up front and
+keep their caches (parsed scores, initialized segments) warm between requests.
+
+Requests and responses are JSON objects, one per line, read from stdin or from connections to a Unix socket:
+
+    {"id": 1, "path": "test_pieces/test_maat.musicxml", "start": 1, "end": 4}
+    {"id": 2, "musicxml": "<?xml ...", "beam_width": 50, "timeout": 5}
+
+A request gives either the path of a score or the score itself as MusicXML, and optionally a measure range (start and
+end, as for realize.py), a beam width and a timeout in seconds overriding the server's. The response carries the id
+of its request and either the realized score as MusicXML or an error:
+
+    {"id": 1, "musicxml": "<?xml ..."}
+    {"id": 2, "error": "TimeoutError: No realization within 5 seconds."}
+
+Requests are realized concurrently and answered as soon as they are done, so responses can come out of order. A
+realization that times out is stopped by killing its worker, which is replaced by a new one warming up.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socketserver
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from timeit import default_timer
+
+from music21 import converter
+from music21.musicxml.m21ToXml import GeneralObjectExporter
+
+import chunk_cache
+import config
+import realize
+import segment_table
+
+
+class RequestError(ValueError):
+    pass
+
+
+def parse_request(line):
+    """Decodes a request line, raising RequestError if it is not a valid request."""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise RequestError(f'Invalid JSON: {e}') from e
+    if not isinstance(request, dict):
+        raise RequestError('A request is a JSON object.')
+    if ('path' in request) == ('musicxml' in request):
+        raise RequestError('A request has either a path or musicxml.')
+    beam_width = request.get('beam_width')
+    if beam_width is not None and (not isinstance(beam_width, int) or isinstance(beam_width, bool) or beam_width < 1):
+        raise RequestError('The beam width of a request is a positive integer.')
+    return request
+
+
+def load_request_score(request):
+    start_measure, end_measure = request.get('start'), request.get('end')
+    if 'path' in request:
+        return realize.load_score(Path(request['path']), start_measure, end_measure)
+    score = converter.parseData(request['musicxml'], format='musicxml')
+    return realize.select_measures(score, start_measure, end_measure)
+
+
+def realize_request(request):
+    """Realizes the score of a request and returns it as MusicXML. Runs in the worker processes."""
+    score = load_request_score(request)
+    parts = score.parts
+    realized_part = realize.realize_part(
+        parts[-1], score, cache=chunk_cache.from_config(), beam_width=request.get('beam_width', config.beam_width)
+    )
+    segment_table.current().save()
+    realized_score = realize.create_score(parts, realized_part)
+    return GeneralObjectExporter(realized_score).parse().decode('utf-8')
+
+
+def warm_up():
+    """Initializes a worker process, so the first request it gets does not load the segment table."""
+    segment_table.current()
+
+
+def serve_worker(connection, log_level=logging.WARNING):
+    """Realizes the requests received on connection until it is closed. Runs in the worker processes."""
+    logging.basicConfig(
+        stream=sys.stderr, level=log_level, format='[%(asctime)s] %(levelname)s: %(message)s', datefmt='%H:%M:%S'
+    )
+    warm_up()
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        try:
+            connection.send((True, realize_request(request)))
+        except Exception as e:  # answered by the server
+            connection.send((False, f'{type(e).__name__}: {e}'))
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+# Workers are spawned rather than forked: replacements are started while the threads answering requests run, and a
+# forked child would inherit the locks those threads hold (logging, music21's environment, ...) locked.
+WORKER_CONTEXT = multiprocessing.get_context('spawn')
+
+
+class Worker:
+    """A warm worker process realizing one request at a time, which can be killed in the middle of one."""
+
+    def __init__(self):
+        self.connection, worker_connection = WORKER_CONTEXT.Pipe()
+        self.process = WORKER_CONTEXT.Process(
+            target=serve_worker, args=(worker_connection, logging.getLogger().getEffectiveLevel())
+        )
+        self.process.start()
+        worker_connection.close()
+
+    def realize(self, request, timeout=None):
+        """
+        Returns the MusicXML of the realized request, raising TimeoutError if it takes longer than timeout seconds, in
+        which case the worker is still busy with it, and WorkerError if the realization fails.
+        """
+        self.connection.send(request)
+        if not self.connection.poll(timeout):
+            raise TimeoutError(f'No realization within {timeout} seconds.')
+        try:
+            succeeded, result = self.connection.recv()
+        except EOFError:
+            self.process.join()
+            raise WorkerError(f'The worker exited with code {self.process.exitcode}.') from None
+        if not succeeded:
+            raise WorkerError(result)
+        return result
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class RealizationServer:
+    """Answers request lines by realizing them in a pool of warm worker processes."""
+
+    def __init__(self, jobs=None, timeout=config.server_timeout):
+        self.timeout = timeout
+        self.workers = [Worker() for _ in range(jobs or os.cpu_count() or 1)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+        self.lock = threading.Lock()
+
+    def replace(self, worker):
+        """Kills a worker that is stuck or broken and makes a new one available in its place."""
+        worker.kill()
+        new_worker = Worker()
+        with self.lock:
+            self.workers[self.workers.index(worker)] = new_worker
+        self.idle.put(new_worker)
+
+    def realize(self, request, timeout):
+        """Realizes the request in the next idle worker. timeout also covers waiting for the worker."""
+        deadline = None if timeout is None else default_timer() + timeout
+        try:
+            worker = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f'No realization within {timeout} seconds.') from None
+        try:
+            result = worker.realize(request, None if deadline is None else max(0.0, deadline - default_timer()))
+        except WorkerError:
+            if not worker.process.is_alive():
+                self.replace(worker)
+            else:
+                self.idle.put(worker)
+            raise
+        except TimeoutError:
+            self.replace(worker)
+            raise TimeoutError(f'No realization within {timeout} seconds.') from None
+        except BaseException:
+            # the pipe of the worker is in an unknown state
+            self.replace(worker)
+            raise
+        self.idle.put(worker)
+        return result
+
+    def respond(self, line):
+        """Returns the response to a request line. Failures are answered, not raised."""
+        request_id = None
+        try:
+            request = parse_request(line)
+            request_id = request.get('id')
+            return {'id': request_id, 'musicxml': self.realize(request, request.get('timeout', self.timeout))}
+        except WorkerError as e:
+            logging.error(f'Failed answering request {request_id}: {e}')
+            return {'id': request_id, 'error': str(e)}
+        except (RequestError, TimeoutError) as e:
+            logging.error(f'Failed answering request {request_id}: {e}')
+            return {'id': request_id, 'error': f'{type(e).__name__}: {e}'}
+        except Exception as e:  # one broken request should not stop the server
+            logging.exception(f'Failed answering request {request_id}')
+            return {'id': request_id, 'error': f'{type(e).__name__}: {e}'}
+
+    def serve_lines(self, lines, write):
+        """Answers every request in lines concurrently, passing each response line to write as soon as it is done."""
+        lock = threading.Lock()
+
+        def answer(line):
+            response = json.dumps(self.respond(line)) + '\n'
+            with lock:
+                write(response)
+
+        with ThreadPoolExecutor() as threads:
+            for line in lines:
+                if line.strip():
+                    threads.submit(answer, line)
+
+    def serve_socket(self, socket_path):
+        """Answers the request lines of every connection to a Unix socket at socket_path, until interrupted."""
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                def write(response):
+                    self.wfile.write(response.encode('utf-8'))
+                    self.wfile.flush()
+
+                server.serve_lines(self.rfile, write)
+
+        socket_path = Path(socket_path)
+        socket_path.unlink(missing_ok=True)
+        with socketserver.ThreadingUnixStreamServer(str(socket_path), Handler) as unix_server:
+            try:
+                unix_server.serve_forever()
+            finally:
+                socket_path.unlink(missing_ok=True)
+
+    def close(self):
+        with self.lock:
+            for worker in self.workers:
+                worker.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_stdout(response):
+    sys.stdout.write(response)
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Answer realization requests, one JSON object per line.")
+    parser.add_argument("-u", "--socket", type=Path, help="Listen on this Unix socket instead of stdin.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of requests to realize concurrently.")
+    parser.add_argument("-t", "--timeout", type=float, default=config.server_timeout,
+                        help="Seconds to wait for a realization.")
+    parser.add_argument("-L", "--logging", action=argparse.BooleanOptionalAction, default=False)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO if args.logging else logging.ERROR,
+        format='[%(asctime)s] %(levelname)s: %(message)s',
+        datefmt='%H:%M:%S',
+    )
+
+    with RealizationServer(args.jobs, args.timeout) as realization_server:
+        if args.socket:
+            realization_server.serve_socket(args.socket)
+        else:
+            realization_server.serve_lines(sys.stdin, write_stdout)
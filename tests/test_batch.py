@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import pytest
+
+from batch import collect_paths, output_paths, realize_batch
+from config import pieces
+from realization_arrays import RealizationArrays
+
+PIECES_DIR = Path(__file__).resolve().parent.parent / 'test_pieces'
+
+
+def test_collect_paths():
+    assert collect_paths(['test_maat']) == [(PIECES_DIR / pieces['test_maat']['path']).resolve()]
+    assert len(collect_paths([], all_pieces=True)) == len(pieces)
+    assert len(collect_paths([str(PIECES_DIR / 'test_*.musicxml')])) > 1
+    with pytest.raises(FileNotFoundError):
+        collect_paths(['does_not_exist_*.musicxml'])
+
+
+def test_output_paths(tmp_path):
+    paths = [Path('/scores/bach/aria.mxl'), Path('/scores/handel/aria.musicxml'), Path('/scores/bach/b/c.xml')]
+    assert output_paths(paths, tmp_path) == [
+        tmp_path / 'bach' / 'aria.musicxml',
+        tmp_path / 'handel' / 'aria.musicxml',
+        tmp_path / 'bach' / 'b' / 'c.musicxml',
+    ]
+    assert output_paths([Path('/scores/bach/aria.mxl')], tmp_path) == [tmp_path / 'aria.musicxml']
+
+
+def test_realize_batch(tmp_path):
+    paths = collect_paths(['test_maat', 'test_inversions'])
+    summaries = list(realize_batch(paths, tmp_path, jobs=2, start_measure=0, end_measure=2))
+
+    assert len(summaries) == 2
+    for summary in summaries:
+        assert summary['error'] is None
+        assert summary['bass_notes'] > 0
+        assert Path(summary['output']).exists()
+
+
+def test_realize_batch_arrays(tmp_path):
+    paths = collect_paths(['test_maat'])
+    summary, = realize_batch(paths, tmp_path, jobs=1, start_measure=0, end_measure=2, arrays=True)
+
+    arrays = RealizationArrays.load(Path(summary['output']).with_suffix('.arrays'))
+    assert arrays.metadata['piece'] == paths[0].name
+    assert len(arrays.offsets) > 0
+    assert len(arrays.chunks) > 0
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import segment_table
+from benchmark import STAGES, benchmark_piece, compare, cost_gap, run_benchmarks
+from config import pieces
+
+
+def result(piece, timings, error=None):
+    return {'piece': piece, 'start': 0, 'end': 4, 'timings': timings, 'counts': {}, 'error': error}
+
+
+def test_benchmark_piece():
+    file_path = Path(__file__).resolve().parent.parent / 'test_pieces' / pieces['test_maat']['path']
+    timings, counts = benchmark_piece(file_path, 0, 2)
+    assert set(STAGES) <= set(timings)
+    assert timings['total'] >= timings['prepare'] > 0
+    assert timings['decide_cadences'] > 0 and timings['assemble_realization'] > 0
+    assert counts['segments'] > 0 and counts['bass_notes'] > 0
+
+
+def test_benchmark_runs_are_cold():
+    file_path = Path(__file__).resolve().parent.parent / 'test_pieces' / pieces['test_maat']['path']
+    benchmark_piece(file_path, 0, 2)
+    benchmark_piece(file_path, 0, 2)
+    # the second run initialized its segments again instead of copying them from the first run
+    assert segment_table.current().misses > 0
+
+
+def test_benchmark_piece_beam_search():
+    file_path = Path(__file__).resolve().parent.parent / 'test_pieces' / pieces['test_maat']['path']
+    timings, counts = benchmark_piece(file_path, 0, 2, beam_width=4)
+    assert timings['beam_search'] > 0
+    assert counts['beam_cost'] >= counts['optimal_cost'] >= 0
+    assert counts['beam_cost_gap'] == counts['beam_cost'] - counts['optimal_cost']
+
+
+def test_cost_gap():
+    assert cost_gap(12, 10) == (2, 0.2)
+    assert cost_gap(10, 10) == (0, 0)
+    assert cost_gap(0, 0) == (0, 0)
+    assert cost_gap(1, 0) == (1, float('inf'))
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(['test_maat'], [(0, 2)], repeat=2)
+    assert len(results) == 1
+    assert results[0]['error'] is None
+
+
+def test_compare():
+    baseline = {'results': [result('a', {'prepare': 1.0, 'parse': 0.01}), result('b', {'prepare': 1.0})]}
+    results = [result('a', {'prepare': 1.1, 'parse': 0.03}), result('b', {'prepare': 2.0})]
+
+    regressions = compare(baseline, results, tolerance=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith('b [0-4]: prepare')
+
+    assert len(compare(baseline, [result('a', None, error='ValueError: x')])) == 1
@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+from music21 import converter, meter, note, stream
+
+import cadences
+
+PIECE = Path(__file__).resolve().parent.parent / 'test_pieces' / 'test_maat.musicxml'
+
+
+def bass(*names):
+    s = stream.Stream()
+    for name in names:
+        s.append(note.Rest() if name == 'r' else note.Note(name))
+    return s
+
+
+def test_find_candidates():
+    candidates = cadences.find_candidates(bass('C3', 'G2', 'C3', 'r', 'F3', 'G2', 'C3'), meter.TimeSignature('4/4'))
+
+    assert [(str(c.dominant.pitch), str(c.tonic.pitch), c.location) for c in candidates] == [
+        ('G2', 'C3', '2.0'), ('G2', 'C3', '6.0'),
+    ]
+    assert [c.on_beat for c in candidates] == [2, 2]
+
+
+def test_classify():
+    candidates = cadences.find_candidates(bass('G2', 'C3', 'D3', 'G2'), meter.TimeSignature('4/4'))
+    for candidate in candidates:
+        candidate.tonic.key_pitch_class = 0.0
+
+    assert cadences.classify(candidates) == [True, False]
+
+
+def test_ask_once_for_all_candidates(capsys):
+    candidates = cadences.find_candidates(bass('G2', 'C3', 'G2', 'C3', 'G2', 'C3'), meter.TimeSignature('4/4'))
+    questions = []
+
+    decisions = cadences.ask(candidates, read=lambda: questions.append(1) or '0, 2')
+
+    assert decisions == [True, False, True]
+    assert len(questions) == 1
+
+
+def test_ask_again_on_invalid_answers(capsys):
+    candidates = cadences.find_candidates(bass('G2', 'C3', 'G2', 'C3'), meter.TimeSignature('4/4'))
+    answers = iter(['yes', '0 5', '1'])
+
+    assert cadences.ask(candidates, read=lambda: next(answers)) == [False, True]
+
+
+def test_decision_file(tmp_path):
+    candidates = cadences.find_candidates(bass('G2', 'C3', 'G2', 'C3', 'G2', 'C3'), meter.TimeSignature('4/4'))
+    path = tmp_path / 'cadences.json'
+    cadences.write_decisions(path, candidates[:2], [False, True])
+    assert json.loads(path.read_text()) == {'1.0': False, '3.0': True}
+
+    decisions = cadences.decide(candidates, cadences.DecisionFile(path, fallback=cadences.accept_all))
+
+    assert decisions == [False, True, True]
+    assert [c.tonic.ends_cadence for c in candidates] == [False, True, True]
+
+
+def test_decision_file_applies_to_excerpts(tmp_path):
+    score = converter.parse(PIECE)
+    bass_part = score.parts[-1].flatten()
+    path = tmp_path / 'cadences.json'
+    candidates = cadences.find_candidates(bass_part, bass_part.timeSignature)
+    cadences.write_decisions(path, candidates, [False] * len(candidates))
+    assert list(json.loads(path.read_text())) == ['3:2.0']
+
+    excerpt = score.measures(3, 5).parts[-1].flatten()
+    excerpt_candidates = cadences.find_candidates(excerpt, excerpt.timeSignature)
+    decisions = cadences.DecisionFile(path, fallback=cadences.accept_all)(excerpt_candidates)
+
+    assert [c.location for c in excerpt_candidates] == ['3:2.0']
+    assert decisions == [False]
@@ -0,0 +1,70 @@
+import pytest
+
+from music21.dynamics import Dynamic
+from music21.meter import TimeSignature
+from music21.note import Note
+from music21.stream import Stream
+
+from chunk_cache import ChunkCache, chunk_key
+
+
+def make_chunk(bass_pitches=('C3', 'G2'), melody_pitches=('E4', 'D4'), figure='6'):
+    bass = Stream()
+    for pitch in bass_pitches:
+        note = Note(pitch)
+        note.addLyric(figure)
+        bass.append(note)
+    melody = Stream()
+    melody.insert(0, Dynamic('p'))
+    for pitch in melody_pitches:
+        melody.append(Note(pitch))
+    return bass, [melody]
+
+
+@pytest.fixture
+def time_signature():
+    return TimeSignature('4/4')
+
+
+def test_chunk_key_is_stable(time_signature):
+    bass, melodies = make_chunk()
+    other_bass, other_melodies = make_chunk()
+    assert chunk_key(bass, melodies, 'mf', None, 0, time_signature) == \
+        chunk_key(other_bass, other_melodies, 'mf', None, 0, time_signature)
+    # same metric position one bar later
+    assert chunk_key(bass, melodies, 'mf', None, 0, time_signature) == \
+        chunk_key(bass, melodies, 'mf', None, 4, time_signature)
+
+
+@pytest.mark.parametrize("changed", [
+    dict(bass_pitches=('C3', 'A2')),
+    dict(melody_pitches=('E4', 'F4')),
+    dict(figure='6,4'),
+])
+def test_chunk_key_changes_with_inputs(time_signature, changed):
+    bass, melodies = make_chunk()
+    other_bass, other_melodies = make_chunk(**changed)
+    assert chunk_key(bass, melodies, 'mf', None, 0, time_signature) != \
+        chunk_key(other_bass, other_melodies, 'mf', None, 0, time_signature)
+
+
+def test_chunk_key_changes_with_context(time_signature):
+    bass, melodies = make_chunk()
+    key = chunk_key(bass, melodies, 'mf', None, 0, time_signature)
+    assert key != chunk_key(bass, melodies, 'f', None, 0, time_signature)
+    assert key != chunk_key(bass, melodies, 'mf', None, 1, time_signature)
+    assert key != chunk_key(bass, melodies, 'mf', None, 0, TimeSignature('3/4'))
+    assert key != chunk_key(bass, melodies, 'mf', None, 0, time_signature, beam_width=8)
+    assert chunk_key(bass, melodies, 'mf', None, 0, time_signature, beam_width=8) != \
+        chunk_key(bass, melodies, 'mf', None, 0, time_signature, beam_width=16)
+
+
+def test_chunk_cache_round_trip(tmp_path, time_signature):
+    cache = ChunkCache(tmp_path)
+    bass, melodies = make_chunk()
+    key = cache.key(bass, melodies, 'mf', None, 0, time_signature)
+    assert cache.load(key) is None
+
+    cache.store(key, bass)
+    cached = cache.load(key)
+    assert [n.pitch for n in cached.notes] == [n.pitch for n in bass.notes]
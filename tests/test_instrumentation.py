@@ -0,0 +1,65 @@
+import json
+
+from instrumentation import Instrumentation, Recorder, current, recording, report_segments
+
+
+class FakeSegment:
+    def __init__(self, num_possibilities):
+        self.possibilities = [None] * num_possibilities
+
+
+def test_disabled_by_default():
+    inst = current()
+    assert not inst.enabled
+    with inst.stage('prepare', chunk=0):
+        inst.count('segments', 3)
+
+
+def test_recording():
+    recorder = Recorder()
+    with recording(recorder):
+        with current().stage('prepare', chunk=0):
+            current().count('segments', 3, chunk=0)
+    assert current() is not recorder
+
+    stage, = recorder.stages()
+    assert stage.name == 'prepare'
+    assert stage.args == {'chunk': 0}
+    assert stage.end >= stage.start
+    counter, = recorder.counters()
+    assert counter.value == 3
+
+
+def test_report_segments():
+    recorder = Recorder()
+    report_segments(recorder, [FakeSegment(2), FakeSegment(3), FakeSegment(4)], chunk=1)
+    counters = {event.name: event.value for event in recorder.counters()}
+    assert counters == {'segments': 3, 'possibilities': 9, 'transitions': 2 * 3 + 3 * 4}
+
+    recorder = Recorder()
+    report_segments(recorder, [object()])
+    assert [event.name for event in recorder.counters()] == ['segments']
+
+
+def test_chrome_trace_and_summary(tmp_path):
+    recorder = Recorder()
+    with recorder.stage('generate_optimal_realization', chunk=2):
+        recorder.count('transitions', 10)
+    path = tmp_path / 'trace.json'
+    recorder.write_chrome_trace(path)
+
+    trace = json.loads(path.read_text())
+    phases = sorted(event['ph'] for event in trace['traceEvents'])
+    assert phases == ['C', 'X']
+
+    summary = recorder.summary()
+    assert 'generate_optimal_realization' in summary
+    assert 'transitions' in summary
+    assert 'chunk=2' in summary
+
+
+def test_base_instrumentation_ignores_events():
+    inst = Instrumentation()
+    with inst.stage('x'):
+        pass
+    inst.count('y', 1)
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+from music21 import analysis, chord, note, stream
+
+import key_estimation
+from score_cache import parse
+
+PIECES = Path(__file__).resolve().parent.parent / 'test_pieces'
+
+
+@pytest.mark.parametrize('file_name', ['test_maat.musicxml', 'Erhore_mich_wenn_ich_rufe_Schutz.musicxml'])
+@pytest.mark.parametrize('window_size', [1, 4, 12])
+def test_matches_windowed_analysis(file_name, window_size):
+    score = parse(PIECES / file_name)
+    windowed_analysis = analysis.windowed.WindowedAnalysis(score, analysis.discrete.KrumhanslKessler())
+    solutions, _ = windowed_analysis.analyze(window_size)
+
+    tonics, names = key_estimation.estimate_keys(score, window_size)
+
+    assert len(names) == len(solutions)
+    for tonic, name, (pitch, _, _) in zip(tonics, names, solutions):
+        if pitch is None:  # window without notes
+            continue
+        assert (tonic, name) == (pitch.ps % 12, pitch.name)
+
+
+def test_symmetric_histogram():
+    # an augmented triad correlates equally with three major keys
+    s = stream.Stream()
+    s.append(chord.Chord(['C4', 'E4', 'G#4']))
+
+    _, names = key_estimation.estimate_keys(s, 1)
+
+    assert names == [analysis.discrete.KrumhanslKessler().getSolution(s).tonic.name]
+
+
+def test_window_without_notes():
+    s = stream.Stream()
+    s.append(chord.Chord(['D4', 'F#4', 'A4'], quarterLength=2))
+    s.append(note.Rest())
+    s.append(chord.Chord(['G4', 'B-4', 'D5']))
+
+    _, names = key_estimation.estimate_keys(s, 1)
+
+    assert len(names) == 4
+    assert names[2] == names[1]
@@ -1,10 +1,11 @@
 from pathlib import Path
 
+import numpy as np
 import pytest
 
-from music21 import converter
-from music21.note import Note
-from melody_detection import RepeatedPatternFinder, Melody, detect_melody
+import score_cache
+from music21.note import Note, Rest
+from melody_detection import RepeatedPatternFinder, ExactRepeatFinder, Melody, detect_melody
 
 
 @pytest.fixture
@@ -25,6 +26,19 @@ def test_contribution_detection(rpf):
     assert rpf.contribution(0, 1) == 0
 
 
+def test_contributions_follow_pitch_equality():
+    notes = [Note('C#4'), Note('D-4'), Note('C#4'), Rest(), Note('C#5')]
+    rpf = RepeatedPatternFinder(notes)
+    contributions = rpf.contributions()
+    for i in range(len(notes)):
+        for j in range(len(notes)):
+            assert contributions[i, j] == rpf.contribution(i, j)
+    assert rpf.contribution(0, 2) == 1
+    assert rpf.contribution(0, 1) == 0
+    assert rpf.contribution(3, 3) == 0
+    assert rpf.contribution(0, 4) == 0
+
+
 def test_similarity(rpf):
     rpf.set_similarity_graph()
     m1 = Melody(1, 2)
@@ -71,11 +85,75 @@ def test_get_best_melody_lengths(notes):
     assert best_melody.index == 2
 
 
+@pytest.mark.parametrize("block_size", [1, 3, 64])
+def test_streaming_prominences(notes, rpf, block_size):
+    streaming = RepeatedPatternFinder(notes, max_length_difference=2, max_length=8, streaming=True,
+                                      block_size=block_size)
+    assert streaming.get_best_melody() == rpf.get_best_melody()
+    for length in range(1, 9):
+        assert list(streaming.prominences(length)) == list(rpf.prominences(length))
+    assert streaming._similarity_graph is None
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_get_top_melodies(notes, streaming):
+    rpf = RepeatedPatternFinder(notes, max_length_difference=2, max_length=8, streaming=streaming)
+    top = rpf.get_top_melodies(5)
+    assert top[0][0] == rpf.get_best_melody()
+
+    ranked = sorted(
+        (-int(rpf.prominences(length)[index]), length, index)
+        for length in range(1, 9) for index in range(len(notes) - length + 1)
+    )
+    assert top == [(Melody(index, length), -prominence) for prominence, length, index in ranked[:5]]
+
+
+def test_prominence_bounds(notes, rpf):
+    rpf.set_similarity_graph()
+    for length in range(1, 9):
+        bounds = rpf.prominence_bounds(length, rpf._similarity_graph.neighbor_lengths[length])
+        assert all(bounds >= rpf.prominences(length)[:len(bounds)])
+
+
+def test_get_top_melodies_deadline(rpf):
+    top = rpf.get_top_melodies(3, deadline=0)
+    assert 0 < len(top) <= 3
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_max_length_above_num_notes(notes, streaming):
+    rpf = RepeatedPatternFinder(notes[:5], max_length_difference=2, max_length=8, streaming=streaming)
+    top = rpf.get_top_melodies(20)
+    assert top and all(melody.index + melody.length <= 5 for melody, _ in top)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_parallel_dp(notes, rpf, streaming):
+    parallel = RepeatedPatternFinder(notes, max_length_difference=2, max_length=8, streaming=streaming,
+                                     block_size=3, jobs=2)
+    assert parallel.get_best_melody() == rpf.get_best_melody()
+    for length in range(1, 9):
+        assert list(parallel.prominences(length)) == list(rpf.prominences(length))
+    if not streaming:
+        assert parallel._similarity_graph.layers.keys() == rpf._similarity_graph.layers.keys()
+        for lengths, layer in rpf._similarity_graph.layers.items():
+            assert np.array_equal(parallel._similarity_graph.layers[lengths], layer)
+
+
+@pytest.mark.parametrize("max_length", [2, 4, 8])
+def test_exact_repeat_finder(notes, max_length):
+    rpf = RepeatedPatternFinder(notes, max_length_difference=0, max_length=max_length)
+    exact = ExactRepeatFinder(notes, max_length=max_length)
+    assert exact.get_best_melody() == rpf.get_best_melody()
+    for length in range(1, max_length + 1):
+        assert list(exact.prominences(length)) == list(rpf.prominences(length))
+
+
 def test_melody_score():
     current_file_dir = Path(__file__).resolve().parent
     file_path = current_file_dir.parent / 'test_pieces' / 'SWV_378.musicxml'
 
-    score = converter.parse(file_path)
+    score = score_cache.parse(file_path)
 
     melody = detect_melody(score, max_length_difference=0, max_length=8)
     assert melody.length > 0
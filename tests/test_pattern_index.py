@@ -0,0 +1,57 @@
+import pytest
+from music21.note import Note, Rest
+
+from melody_detection import Melody, RepeatedPatternFinder, pitch_key
+from pattern_index import Match, PatternIndex, similarity
+
+
+@pytest.fixture
+def notes():
+    return [Note('C4'), Note('D4', quarterLength=4), Note('E4'), Note('C4'), Note('F5'),
+            Note('C4', quarterLength=4), Note('D4'), Note('E4'), Note('C4'), Note('G4'),
+            Note('C3'), Rest(), Note('E3'), Note('C3')]
+
+
+def keys(notes):
+    return [None if n.isRest else pitch_key(n) for n in notes]
+
+
+def test_similarity_matches_repeated_pattern_finder(notes):
+    rpf = RepeatedPatternFinder(notes, max_length_difference=2, max_length=6)
+    rpf.set_similarity_graph()
+    index = PatternIndex(max_length_difference=2)
+    codes = index.encode(keys(notes), add=True)
+    for m1 in [Melody(0, 4), Melody(1, 3), Melody(2, 5), Melody(9, 4)]:
+        for m2, expected in rpf._similarity_graph[m1].items():
+            if m2.index + m2.length > len(notes):
+                continue
+            a = codes[m1.index:m1.index + m1.length]
+            b = codes[m2.index:m2.index + m2.length]
+            assert similarity(a, b, 2) == expected
+
+
+def test_query_across_pieces(notes):
+    index = PatternIndex(n=2)
+    assert index.add_piece('a', [keys(notes)])
+    assert index.add_piece('b', [keys([Note('G4'), Note('C4'), Note('D4'), Note('E4'), Note('C4')]), []])
+    assert not index.add_piece('a', [])
+
+    matches = index.query_pitches(['C4', 'D4', 'E4', 'C4'], k=3)
+    assert matches == [Match('a', 0, Melody(0, 4), 4), Match('a', 0, Melody(5, 4), 4), Match('b', 0, Melody(1, 4), 4)]
+    assert all(match.similarity > RepeatedPatternFinder.SIMILARITY_THRESHOLD for match in matches)
+
+    matches = index.query_melody('a', 0, Melody(5, 4), k=10)
+    assert all(not (m.piece == 'a' and m.melody.index + m.melody.length > 5 and m.melody.index < 9) for m in matches)
+    assert matches[0].similarity == 4
+    assert index.query_pitches(['B7', 'B7', 'B7']) == []
+
+
+def test_save_and_load(notes, tmp_path):
+    index = PatternIndex(n=2)
+    index.add_piece('a', [keys(notes)])
+    index.save(tmp_path / 'index.p')
+
+    loaded = PatternIndex.load(tmp_path / 'index.p')
+    assert loaded.query_pitches(['C4', 'D4', 'E4']) == index.query_pitches(['C4', 'D4', 'E4'])
+    loaded.add_piece('b', [keys(notes[:5])])
+    assert {match.piece for match in loaded.query_pitches(['C4', 'D4', 'E4'])} == {'a', 'b'}
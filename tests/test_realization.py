@@ -1,15 +1,22 @@
 from pathlib import Path
-import random
-from timeit import default_timer
+from types import SimpleNamespace
 
 import pytest
-from matplotlib import pyplot as plt, rc
 
+import chunk_cache
+import config
+import instrumentation
 import realize
-from music21 import converter
+import score_cache
+import segment_table
+from music21.chord import Chord
+from music21.meter import TimeSignature
+from music21.note import Note
 from music21.pitch import Pitch
+from music21.stream import Measure, Part, Score
 from realize import realize_from_path
 from config import pieces, default_piece
+from music21.improvedFiguredBass.notation import Modifier
 from music21.improvedFiguredBass.segment import Segment, SegmentOption
 from music21.improvedFiguredBass.possibility import Possibility
 
@@ -18,7 +25,7 @@ def get_realization(file_name):
     current_file_dir = Path(__file__).resolve().parent
     file_path = current_file_dir.parent / 'test_pieces' / file_name
 
-    score = converter.parse(file_path)
+    score = score_cache.parse(file_path)
     bc_part = score.parts[-1]
     melody_parts = score.parts[:-1]
 
@@ -112,36 +119,197 @@ def test_realizations(piece_name, args):
     realize_from_path(file_path, start_measure=0, end_measure=2)
 
 
-@pytest.mark.skip("Visual test")
-def test_realization_speed():
-    plt.rcdefaults()
-    plt.rcParams.update({
-        "text.usetex": True,
-        "font.family": "serif",
-        "font.serif": ["Computer Modern Roman"],
-        "font.size": 14,
-    })
+def test_parallel_realization_matches_serial():
+    current_file_dir = Path(__file__).resolve().parent
+    file_path = current_file_dir.parent / 'test_pieces' / pieces['test_mis']['path']
+
+    serial = realize_from_path(file_path, start_measure=None, end_measure=None)
+    parallel = realize_from_path(file_path, start_measure=None, end_measure=None, n_jobs=2)
+
+    serial_notes = [(n.offset, n.pitches) for n in serial.parts[-2].flatten().notes]
+    parallel_notes = [(n.offset, n.pitches) for n in parallel.parts[-2].flatten().notes]
+    assert serial_notes == parallel_notes
+
+
+@pytest.mark.parametrize("piece_name", ['test_mis', 'test_accidentals'])
+def test_segment_table_does_not_change_realizations(piece_name, monkeypatch):
+    current_file_dir = Path(__file__).resolve().parent
+    file_path = current_file_dir.parent / 'test_pieces' / pieces[piece_name]['path']
+
+    monkeypatch.setattr(config, 'use_segment_table', False)
+    without_table = realize_from_path(file_path, start_measure=None, end_measure=None)
+    monkeypatch.setattr(config, 'use_segment_table', True)
+    segment_table.current().clear()
+    realize_from_path(file_path, start_measure=None, end_measure=None)  # fills the table
+    with_table = realize_from_path(file_path, start_measure=None, end_measure=None)
+
+    assert segment_table.current().hits > 0
+    assert [(n.offset, n.pitches) for n in with_table.parts[-2].flatten().notes] == \
+        [(n.offset, n.pitches) for n in without_table.parts[-2].flatten().notes]
+
+
+@pytest.mark.parametrize("piece_name", ['test_maat', 'test_mis'])
+def test_vectorized_search_matches_optimal_realization(piece_name, monkeypatch):
+    current_file_dir = Path(__file__).resolve().parent
+    file_path = current_file_dir.parent / 'test_pieces' / pieces[piece_name]['path']
+
+    def chords(score):
+        return {n.offset: tuple(sorted(p.ps for p in n.pitches)) for n in score.parts[-2].flatten().notes}
+
+    optimal = chords(realize_from_path(file_path, start_measure=None, end_measure=None))
+    monkeypatch.setattr(config, 'vectorized_search', True)
+    vectorized = chords(realize_from_path(file_path, start_measure=None, end_measure=None))
+
+    assert vectorized
+    assert {offset: optimal.get(offset) for offset in vectorized} == vectorized
+
+
+def test_instrumented_realization():
+    current_file_dir = Path(__file__).resolve().parent
+    file_path = current_file_dir.parent / 'test_pieces' / pieces['test_maat']['path']
+
+    recorder = instrumentation.Recorder()
+    with instrumentation.recording(recorder):
+        realize_from_path(file_path, start_measure=0, end_measure=2)
+
+    stage_names = {event.name for event in recorder.stages()}
+    assert {'parse', 'set_key', 'split_on_rests', 'prepare', 'generate_optimal_realization'} <= stage_names
+    assert any(event.name == 'segments' and event.value > 0 for event in recorder.counters())
+
+
+@pytest.mark.parametrize("window_size, overlap", [(2, 0), (2, 1), (100, 1)])
+def test_realize_windows(window_size, overlap):
+    current_file_dir = Path(__file__).resolve().parent
+    file_path = current_file_dir.parent / 'test_pieces' / pieces['test_maat']['path']
+    score = realize.load_score(file_path)
+
+    measures = list(realize.realize_windows(score, window_size=window_size, overlap=overlap))
+    bass_measures = list(score.parts[-1].getElementsByClass('Measure'))
+
+    assert [m.number for m in measures] == [m.number for m in bass_measures]
+    assert all(len(m.notes) > 0 for m in measures)
+
+    # the clef and signatures are not repeated at window starts, and only the last measure ends the piece
+    harmonies = Part(measures)
+    assert len(harmonies.recurse().getElementsByClass('Clef')) == 1
+    for signature_class in ('TimeSignature', 'KeySignature'):
+        assert len(harmonies.recurse().getElementsByClass(signature_class)) == \
+            len(score.parts[-1].recurse().getElementsByClass(signature_class))
+    assert [m.rightBarline.type for m in measures if m.rightBarline is not None] == ['final']
+    assert measures[-1].rightBarline.type == 'final'
+
+
+def test_windows_use_the_keys_of_the_piece():
+    current_file_dir = Path(__file__).resolve().parent
+    file_path = current_file_dir.parent / 'test_pieces' / pieces['test_mis']['path']
+
+    def realized_notes(measures):
+        return [(m.number, [(n.offset, n.pitches) for n in m.notes]) for m in measures]
+
+    def keys(score):
+        return [(n.key_pitch_class, n.key_name) for n in score.parts[-1].flatten().notes]
+
+    score = realize.load_score(file_path)
+    whole = realize.realize_part(score.parts[-1], score)
+    window_score = realize.load_score(file_path)
+    window = list(realize.realize_windows(window_score, window_size=1000))
+    assert realized_notes(window) == realized_notes(whole.getElementsByClass(Measure))
+
+    small_window_score = realize.load_score(file_path)
+    list(realize.realize_windows(small_window_score, window_size=2))
+    assert keys(small_window_score) == keys(score)
+
+
+def test_chunk_cache_reuses_realizations(tmp_path):
+    current_file_dir = Path(__file__).resolve().parent
+    file_path = current_file_dir.parent / 'test_pieces' / pieces['test_mis']['path']
+    cache = chunk_cache.ChunkCache(tmp_path)
+
+    first = realize_from_path(file_path, start_measure=None, end_measure=None, cache=cache)
+    assert len(cache.entries()) > 0
+
+    recorder = instrumentation.Recorder()
+    with instrumentation.recording(recorder):
+        second = realize_from_path(file_path, start_measure=None, end_measure=None, cache=cache)
+    assert not any(event.name == 'generate_optimal_realization' for event in recorder.stages())
+
+    first_notes = [(n.offset, n.pitches) for n in first.parts[-2].flatten().notes]
+    second_notes = [(n.offset, n.pitches) for n in second.parts[-2].flatten().notes]
+    assert first_notes == second_notes
+
 
+def test_split_on_rests():
     current_file_dir = Path(__file__).resolve().parent
-    file_path = current_file_dir.parent / 'test_pieces' / 'Erhore_mich_wenn_ich_rufe_Schutz.musicxml'
-
-    x = []
-    y = []
-    for i in range(20):
-        random_num_measures = random.randint(15, 40)
-        random_start_measure = random.randint(0, 60-random_num_measures)
-        end_measure = random_start_measure + random_num_measures
-
-        start = default_timer()
-        _, num_b, num_m = realize_from_path(file_path, start_measure=random_start_measure, end_measure=end_measure)
-        # num_b = random.randint(5, 10)
-        end = default_timer()
-
-        x.append(num_b)
-        y.append(end - start)
-    plt.scatter(x, y)
-    plt.xlabel("Number of bass notes")
-    plt.ylabel("Execution time (s)")
-    plt.savefig("bass_notes_execution_time.eps", format="eps", dpi=1200, bbox_inches="tight", transparent=True)
-    plt.show()
-    print("done")
+    file_path = current_file_dir.parent / 'test_pieces' / pieces['test_mis']['path']
+    score = score_cache.parse(file_path)
+    basso_continuo = score.parts[-1].flatten()
+    melody_parts = [p.flatten() for p in score.parts[:-1]]
+    melody_notes = [[(n.offset, n.quarterLength) for n in part.notes] for part in melody_parts]
+
+    tups, rests = realize.split_on_rests(basso_continuo, melody_parts)
+
+    assert len(rests) > 0
+    assert len(tups) == len(rests) + 1
+    bass_notes = sum(len(bass.notes) for bass, _, _ in tups)
+    assert bass_notes == len(basso_continuo.notes)
+    for i, part in enumerate(melody_parts):
+        chunk_length = sum(melodies[i].highestTime for _, melodies, _ in tups)
+        assert chunk_length == part.highestTime
+    # the melody parts of the score are not touched by splitting
+    assert [[(n.offset, n.quarterLength) for n in part.notes] for part in melody_parts] == melody_notes
+
+
+class AccidentalSegment:
+    """The parts of a segment handle_accidentals uses, recording the accidentals it is handed."""
+
+    def __init__(self, measure, bass, melody, modify):
+        self.bassNote = SimpleNamespace(measureNumber=measure, pitch=Pitch(bass))
+        self.melody_pitches = [Pitch(name) for name in melody]
+        self.fbScale = SimpleNamespace(modify={name: Modifier(accidental) for name, accidental in modify.items()})
+
+    def set_pitch_names_in_chord(self):
+        pass
+
+    def update_pitch_names_in_chord(self, past_measure):
+        self.past_measure = {name: (m.accidental.name, measure) for name, (m, measure) in past_measure.items()}
+
+    def finish_initialization(self):
+        pass
+
+
+def test_handle_accidentals(monkeypatch):
+    monkeypatch.setattr(config, 'use_segment_table', False)  # the stubs only have what handle_accidentals uses
+    segments = [
+        AccidentalSegment(1, 'C3', ['F#5'], {}),
+        AccidentalSegment(1, 'C3', ['F#5', 'A4'], {'F': 'flat'}),
+        AccidentalSegment(2, 'C4', ['B-4'], {'E': 'sharp'}),
+    ]
+    realize.handle_accidentals(segments)
+
+    assert segments[0].past_measure == {'F': ('sharp', 1)}
+    # a flat against a sharp earlier in the measure cancels it
+    assert segments[1].past_measure == {'F': ('natural', 1), 'A': ('natural', 1)}
+    # accidentals end with their measure, a sharp a major third above the bass is natural
+    assert segments[2].past_measure == {'B': ('flat', 2), 'E': ('natural', 2)}
+    assert segments[2].fbScale.modify['E'].accidental.name == 'natural'
+
+
+def test_measure_assembler_ties_across_barlines():
+    bass = Part()
+    for number in (1, 2):
+        measure = Measure(number=number)
+        if number == 1:
+            measure.append(TimeSignature('4/4'))
+        measure.append(Note('C3', quarterLength=4))
+        bass.append(measure)
+    harmonies = Part([Chord(['E4', 'G4'], quarterLength=3), Chord(['F4', 'A4'], quarterLength=3), Chord(['E4', 'G4'])])
+
+    assembler = realize.MeasureAssembler(bass)
+    assembler.add_chunk(Score([harmonies, Part()]))
+    first, second = assembler.finish().getElementsByClass(Measure)
+
+    assert [c.quarterLength for c in first.notes] == [3, 1]
+    assert [c.quarterLength for c in second.notes] == [2, 1]
+    assert (first.notes[1].tie.type, second.notes[0].tie.type) == ('start', 'stop')
+    assert first.timeSignature.ratioString == '4/4'
+    assert second.rightBarline.type == 'final'
@@ -0,0 +1,76 @@
+from pathlib import Path
+
+import numpy as np
+from music21 import clef, key, tie
+from music21.chord import Chord
+from music21.meter import TimeSignature
+from music21.note import Rest
+from music21.pitch import Accidental, Pitch
+from music21.stream import Measure, Part
+
+import realization_arrays
+import score_cache
+from config import pieces
+
+
+def realized_part():
+    part = Part(id='part0')
+    first, second = Measure(number=1), Measure(number=2)
+    first.append([clef.TrebleClef(), key.KeySignature(-1), TimeSignature('3/4')])
+    natural = Pitch('A4')
+    natural.accidental = Accidental('natural')
+    held = Chord(['F3', 'B-3', 'D4'], quarterLength=1)
+    held.tie = tie.Tie('start')
+    first.append([Chord(['E#3', natural, 'C#4'], quarterLength=1 / 3), Rest(quarterLength=5 / 3), held])
+    tied = Chord(['F3', 'B-3', 'D4'], quarterLength=1)
+    tied.tie = tie.Tie('stop')
+    second.append([tied, Chord(['G3', 'B-3'], quarterLength=2)])
+    part.append([first, second])
+    return part
+
+
+def describe(part):
+    return [
+        (
+            m.number, float(m.offset), e.classes[0], float(e.offset), float(e.quarterLength),
+            [(p.nameWithOctave, p.accidental.name if p.accidental else None) for p in getattr(e, 'pitches', ())],
+            e.tie.type if getattr(e, 'tie', None) else None,
+        )
+        for m in part.getElementsByClass(Measure) for e in m
+    ]
+
+
+def test_round_trip(tmp_path):
+    part = realized_part()
+    arrays = realization_arrays.from_part(part, metadata={'piece': 'test'}, chunks=[(0, 1 / 3), (2, 6)])
+    arrays.save(tmp_path / 'realization')
+    loaded = realization_arrays.RealizationArrays.load(tmp_path / 'realization')
+
+    assert loaded == arrays
+    assert isinstance(loaded.pitch_space, np.memmap)
+    assert loaded.metadata == {'piece': 'test'}
+    assert loaded.chunks.tolist() == [[0, 1 / 3], [2, 6]]
+    assert describe(realization_arrays.to_part(loaded))[:-1] == describe(part)
+
+
+def test_differing_offsets():
+    arrays = realization_arrays.from_part(realized_part())
+    other = realization_arrays.from_part(realized_part())
+    other.pitch_space[-1, 0] += 2
+
+    assert arrays.differing_offsets(other) == [4.0]
+    assert arrays != other
+    assert np.isnan(arrays.pitch_space[-1, 2])
+
+
+def test_time_signature_symbols_round_trip(tmp_path):
+    path = Path(__file__).resolve().parent.parent / 'test_pieces' / pieces['TrioCouperin']['path']
+    part = score_cache.parse(path).parts[-1]
+    realization_arrays.from_part(part).save(tmp_path / 'realization')
+    loaded = realization_arrays.RealizationArrays.load(tmp_path / 'realization')
+
+    def time_signatures(p):
+        return [(ts.ratioString, ts.symbol) for ts in p.recurse().getElementsByClass(TimeSignature)]
+
+    assert ('4/4', 'common') in time_signatures(part)
+    assert time_signatures(realization_arrays.to_part(loaded)) == time_signatures(part)
@@ -0,0 +1,111 @@
+import pickle
+from collections import Counter
+from types import SimpleNamespace
+
+from music21.note import Note
+from music21.pitch import Pitch
+
+import config
+from rule_cache import RuleCostCache, memoize_rules
+
+
+calls = Counter()
+
+
+class ParallelOctaves:
+    def get_cost(self, possibility_a, possibility_b, segment_a, segment_b):
+        calls[type(self).__name__] += 1
+        return int(possibility_a[0].ps - possibility_a[1].ps == possibility_b[0].ps - possibility_b[1].ps == 12)
+
+
+class DoubledBass:
+    def get_cost(self, possibility, segment):
+        calls[type(self).__name__] += 1
+        return sum(p.pitchClass == segment.bassNote.pitch.pitchClass for p in possibility)
+
+
+class Unlisted(DoubledBass):
+    pass
+
+
+DEPENDENCIES = {'ParallelOctaves': False, 'DoubledBass': True}
+
+
+def possibility(*names):
+    return tuple(Pitch(name) for name in names)
+
+
+def segment(bass):
+    return SimpleNamespace(
+        bassNote=Note(bass), segment_options=[], melody_pitches=set(), melody_pitches_at_strike=set(),
+        dynamic='mf', on_beat=2,
+    )
+
+
+def rule_set():
+    calls.clear()
+    return SimpleNamespace(rules=[ParallelOctaves(), DoubledBass(), Unlisted()])
+
+
+def test_lru_eviction():
+    cache = RuleCostCache(max_size=2)
+    assert cache.get('a', lambda: 1) == 1
+    assert cache.get('b', lambda: 2) == 2
+    assert cache.get('a', lambda: None) == 1
+    cache.get('c', lambda: 3)
+    assert len(cache) == 2
+    assert cache.get('b', lambda: 4) == 4  # least recently used, evicted
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_default_size_is_read_when_created(monkeypatch):
+    monkeypatch.setattr(config, 'rule_cache_size', 3)
+    assert RuleCostCache().max_size == 3
+
+
+def test_memoized_transition_costs():
+    rules = rule_set()
+    cache = memoize_rules(rules, dependencies=DEPENDENCIES)
+    parallel_octaves = rules.rules[0]
+
+    assert parallel_octaves.get_cost(possibility('C5', 'C4'), possibility('D5', 'D4'), None, None) == 1
+    # equal pitches in other objects and segments hit the cache
+    assert parallel_octaves.get_cost(possibility('C5', 'C4'), possibility('D5', 'D4'), segment('C3'), None) == 1
+    assert parallel_octaves.get_cost(possibility('C5', 'C4'), possibility('D5', 'F4'), None, None) == 0
+    assert calls['ParallelOctaves'] == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_memoized_segment_costs():
+    rules = rule_set()
+    cache = memoize_rules(rules, dependencies=DEPENDENCIES)
+    doubled_bass, unlisted = rules.rules[1:]
+
+    assert doubled_bass.get_cost(possibility('C3', 'C4', 'E4'), segment('C3')) == 2
+    assert doubled_bass.get_cost(possibility('C3', 'C4', 'E4'), segment('C3')) == 2
+    assert doubled_bass.get_cost(possibility('C3', 'C4', 'E4'), segment('E3')) == 1
+    assert calls['DoubledBass'] == 2
+    # enharmonic spellings are told apart, as in the segment table
+    doubled_bass.get_cost(possibility('C3', 'F#4', 'A4'), segment('C3'))
+    doubled_bass.get_cost(possibility('C3', 'G-4', 'A4'), segment('C3'))
+    doubled_bass.get_cost(possibility('C3', 'C4', 'E4'), segment('B#2'))
+    assert calls['DoubledBass'] == 5
+
+    unlisted.get_cost(possibility('C3', 'C4', 'E4'), segment('C3'))
+    unlisted.get_cost(possibility('C3', 'C4', 'E4'), segment('C3'))
+    assert calls['Unlisted'] == 2
+    assert rules.cost_cache is cache
+
+
+def test_pickled_rule_set_starts_empty():
+    rules = rule_set()
+    memoize_rules(rules, dependencies=DEPENDENCIES)
+    pickled = pickle.dumps(rules)
+    rules.rules[0].get_cost(possibility('C5', 'C4'), possibility('D5', 'D4'), None, None)
+    # the chunk cache hashes the pickled rule set, which must not change as costs are memoized
+    assert pickle.dumps(rules) == pickled
+
+    copied = pickle.loads(pickle.dumps(rules))
+    assert len(copied.cost_cache) == 0
+    assert copied.rules[0].get_cost.cache is copied.cost_cache
+    assert copied.rules[0].get_cost(possibility('C5', 'C4'), possibility('D5', 'D4'), None, None) == 1
@@ -0,0 +1,56 @@
+import os
+import shutil
+from pathlib import Path
+
+from music21 import environment
+
+import score_cache
+
+PIECE = Path(__file__).resolve().parent.parent / 'test_pieces' / 'test_maat.musicxml'
+
+
+def test_cache_hit(tmp_path):
+    directory = tmp_path / 'cache'
+    score = score_cache.parse(PIECE, directory)
+    cache = score_cache.ScoreCache(directory)
+    assert cache.entries() == [directory / f'{score_cache.score_key(PIECE)}.p']
+
+    cached_score = score_cache.parse(PIECE, directory)
+    assert len(cache.entries()) == 1
+    assert [n.pitches for n in cached_score.flatten().notes] == [n.pitches for n in score.flatten().notes]
+
+
+def test_copies_share_an_entry(tmp_path):
+    directory = tmp_path / 'cache'
+    copy = tmp_path / 'copy' / PIECE.name
+    copy.parent.mkdir()
+    shutil.copy(PIECE, copy)
+    score_cache.parse(PIECE, directory)
+    score_cache.parse(copy, directory)
+    assert len(score_cache.ScoreCache(directory).entries()) == 1
+
+
+def test_changed_file_is_reparsed(tmp_path):
+    directory = tmp_path / 'cache'
+    path = tmp_path / PIECE.name
+    shutil.copy(PIECE, path)
+    first_note = score_cache.parse(path, directory).flatten().notes[0]
+
+    # a changed file restored with an older modification time
+    modified = path.stat().st_mtime
+    path.write_text(path.read_text().replace('<step>A</step>', '<step>B</step>', 1))
+    os.utime(path, (modified - 60,) * 2)
+    changed_note = score_cache.parse(path, directory).flatten().notes[0]
+    assert first_note.pitch.step == 'A' and changed_note.pitch.step == 'B'
+
+
+def test_eviction(tmp_path):
+    directory = tmp_path / 'cache'
+    score_cache.parse(PIECE, directory, max_size=0)
+    assert score_cache.ScoreCache(directory).entries() == []
+
+
+def test_music21_environment_is_untouched(tmp_path):
+    scratch = environment.Environment()['directoryScratch']
+    score_cache.parse(PIECE, tmp_path / 'cache')
+    assert environment.Environment()['directoryScratch'] == scratch
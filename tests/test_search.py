@@ -0,0 +1,119 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from music21.note import Note
+from music21.pitch import Pitch
+
+from search import ChunkCosts, beam_search, optimal_search, render, split_rules
+
+
+class HighVoices:
+    def get_cost(self, possibility, segment):
+        return int(possibility[0].ps) % 5
+
+
+class LargeLeaps:
+    def get_cost(self, possibility_a, possibility_b, segment_a, segment_b):
+        return max(abs(a.ps - b.ps) for a, b in zip(possibility_a, possibility_b)) // 3
+
+
+class ParallelFifths:
+    def __init__(self, cost=1):
+        self.cost = cost
+
+    def get_cost(self, possibility_a, possibility_b, segment_a, segment_b):
+        for i, j in itertools.combinations(range(len(possibility_a)), 2):
+            before, after = possibility_a[i].ps - possibility_a[j].ps, possibility_b[i].ps - possibility_b[j].ps
+            fifths = abs(before) % 12 == abs(after) % 12 == 7 and before * after > 0
+            moved = all(possibility_a[k].pitchClass != possibility_b[k].pitchClass for k in (i, j))
+            if fifths and moved:
+                return self.cost
+        return 0
+
+
+class RuleSet:
+    def __init__(self, *rules):
+        self.rules = list(rules)
+
+
+def segment(bass, start, *voicings):
+    return SimpleNamespace(
+        bassNote=Note(bass),
+        play_offsets=(start, start + 1),
+        possibilities=[tuple(Pitch(name) for name in voicing.split()) + (Pitch(bass),) for voicing in voicings],
+    )
+
+
+SEGMENTS = [
+    segment('C3', 0, 'E5 G4', 'C5 E4', 'G4 C4', 'E4 G3'),
+    segment('F3', 1, 'A4 C4', 'F4 A3', 'C5 F4', 'A5 C5'),
+    segment('G3', 2, 'B4 D4', 'D5 G4', 'G4 B3', 'B5 D5'),
+    segment('C3', 3, 'C5 E4', 'E5 G4', 'G4 C4', 'C6 E5'),
+]
+
+
+def path_cost(costs, path):
+    cost = sum(float(costs.local_costs(i)[p]) for i, p in enumerate(path))
+    for i, (p, q) in enumerate(zip(path, path[1:])):
+        cost += float(costs.transition_costs(i, [p])[0, q])
+    return cost
+
+
+def brute_force(costs):
+    return min(path_cost(costs, list(path)) for path in itertools.product(*(range(4) for _ in costs.segments)))
+
+
+def test_split_rules():
+    local_rules, transition_rules = split_rules(RuleSet(HighVoices(), LargeLeaps()))
+    assert [type(rule) for rule in local_rules] == [HighVoices]
+    assert [type(rule) for rule in transition_rules] == [LargeLeaps]
+
+
+def test_exhaustive_search_is_optimal():
+    costs = ChunkCosts(SEGMENTS, RuleSet(HighVoices(), LargeLeaps()))
+    result = beam_search(costs)
+    assert result.cost == brute_force(costs)
+    assert path_cost(costs, result.path) == result.cost
+
+
+@pytest.mark.parametrize('beam_width', [1, 2, 3, 4, 10])
+def test_beam_search(beam_width):
+    costs = ChunkCosts(SEGMENTS, RuleSet(HighVoices(), LargeLeaps()))
+    result = beam_search(costs, beam_width)
+    assert path_cost(costs, result.path) == result.cost >= beam_search(costs).cost
+    if beam_width >= 4:
+        assert result.cost == beam_search(costs).cost
+
+
+@pytest.mark.parametrize('beam_width', [0, -1])
+def test_beam_width_must_be_positive(beam_width):
+    with pytest.raises(ValueError):
+        beam_search(ChunkCosts(SEGMENTS, RuleSet(HighVoices())), beam_width)
+
+
+def test_vectorized_costs():
+    rule_set = RuleSet(HighVoices(), ParallelFifths(cost=3), LargeLeaps())
+    costs = ChunkCosts(SEGMENTS, rule_set)
+    vectorized = ChunkCosts(SEGMENTS, rule_set, vectorized=True)
+    assert [type(rule) for rule in vectorized.vectorized_rules] == [ParallelFifths]
+
+    for i in range(len(SEGMENTS) - 1):
+        assert vectorized.transition_costs(i, range(4)).tolist() == costs.transition_costs(i, range(4)).tolist()
+    assert costs.transition_costs(0, [2])[0, 2] >= 3  # G4 C4 C3 to C5 F4 F3 has parallel fifths
+    assert optimal_search(vectorized) == beam_search(costs)
+
+
+def test_missing_possibilities():
+    with pytest.raises(ValueError):
+        ChunkCosts([SimpleNamespace(bassNote=Note('C3'))], RuleSet(HighVoices()))
+
+
+def test_render():
+    costs = ChunkCosts(SEGMENTS, RuleSet(HighVoices(), LargeLeaps()))
+    chords = list(render(costs, [0, 1, 2, 3]).parts[0].flatten().notes)
+    assert [float(c.offset) for c in chords] == [0, 1, 2, 3]
+    assert [c.quarterLength for c in chords] == [1, 1, 1, 1]
+    assert [tuple(p.nameWithOctave for p in c.pitches) for c in chords] == [
+        ('E5', 'G4'), ('F4', 'A3'), ('G4', 'B3'), ('C6', 'E5'),
+    ]
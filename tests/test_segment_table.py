@@ -0,0 +1,124 @@
+import gc
+from collections import Counter
+from types import SimpleNamespace
+
+from music21.note import Note
+from music21.pitch import Pitch
+
+from segment_table import SegmentTable
+
+
+class FakeRuleSet:
+    def __init__(self, cost):
+        self.cost = cost
+
+
+initializations = Counter()
+
+
+class FakeSegment:
+    def __init__(self, bass, pitch_names, neighbour=None):
+        self.bassNote = Note(bass)
+        self.segment_options = [SimpleNamespace(pitch_names_in_chord=pitch_names)]
+        self.melody_pitches = {Pitch('E5')}
+        self.melody_pitches_at_strike = set()
+        self.dynamic = 'mf'
+        self.prev_segment = neighbour
+
+    def finish_initialization(self):
+        initializations[self.bassNote.nameWithOctave] += 1
+        pitch_names = self.segment_options[0].pitch_names_in_chord
+        self.possibilities = [(self.bassNote.pitch, Pitch(name + '4')) for name in pitch_names]
+        self.segment_options[0].num_possibilities = len(self.possibilities)
+        self.segment_options[0].segment = self
+        self.prev_segment = None
+
+
+def test_recurring_segments_are_looked_up():
+    initializations.clear()
+    table = SegmentTable()
+    first = FakeSegment('C3', ['C', 'E', 'G'])
+    table.finish_initialization(first)
+    neighbour = FakeSegment('G2', ['G', 'B', 'D'])
+    again = FakeSegment('C3', ['C', 'E', 'G'], neighbour=neighbour)
+    table.finish_initialization(again)
+
+    assert initializations['C3'] == 1
+    assert again.possibilities == first.possibilities
+    assert again.prev_segment is neighbour  # neighbours are not taken from the table
+    assert (table.hits, table.misses) == (1, 1)
+
+
+def test_accidentals_are_part_of_the_key():
+    initializations.clear()
+    table = SegmentTable()
+    table.finish_initialization(FakeSegment('C3', ['C', 'E', 'G']))
+    sharpened = FakeSegment('C3', ['C', 'E', 'G#'])
+    table.finish_initialization(sharpened)
+
+    assert initializations['C3'] == 2
+    assert sharpened.possibilities[-1][1].name == 'G#'
+
+
+def test_saved_table_is_loaded(tmp_path):
+    path = tmp_path / 'segments.p'
+    table = SegmentTable(path)
+    table.finish_initialization(FakeSegment('D3', ['D', 'F#', 'A']))
+    table.save()
+
+    initializations.clear()
+    loaded = SegmentTable(path)
+    segment = FakeSegment('D3', ['D', 'F#', 'A'])
+    loaded.finish_initialization(segment)
+
+    assert len(loaded) == 1
+    assert initializations['D3'] == 0
+    assert segment.possibilities[1][1].name == 'F#'
+
+
+def test_segments_do_not_share_state():
+    table = SegmentTable()
+    first = FakeSegment('C3', ['C', 'E', 'G'])
+    table.finish_initialization(first)
+    again = FakeSegment('C3', ['C', 'E', 'G'])
+    table.finish_initialization(again)
+    third = FakeSegment('C3', ['C', 'E', 'G'])
+    table.finish_initialization(third)
+
+    assert again.possibilities == first.possibilities
+    assert again.possibilities is not first.possibilities
+    again.possibilities.clear()
+    assert third.possibilities == first.possibilities
+    # not even the pitches are shared
+    assert third.possibilities[0][0] is not first.bassNote.pitch
+
+
+def test_in_place_initialization_is_copied():
+    table = SegmentTable()
+    table.finish_initialization(FakeSegment('C3', ['C', 'E', 'G']))
+    again = FakeSegment('C3', ['C', 'E', 'G'])
+    table.finish_initialization(again)
+
+    assert again.segment_options[0].num_possibilities == 3
+    assert again.segment_options[0].segment is again
+
+
+def test_rule_set_is_part_of_the_key():
+    initializations.clear()
+    table = SegmentTable()
+    table.finish_initialization(FakeSegment('C3', ['C', 'E', 'G']), FakeRuleSet(1))
+    table.finish_initialization(FakeSegment('C3', ['C', 'E', 'G']), FakeRuleSet(1))
+    table.finish_initialization(FakeSegment('C3', ['C', 'E', 'G']), FakeRuleSet(2))
+
+    assert initializations['C3'] == 2
+
+
+def test_rule_sets_are_not_kept_alive():
+    table = SegmentTable()
+    rule_set = FakeRuleSet(1)
+    table.finish_initialization(FakeSegment('C3', ['C', 'E', 'G']), rule_set)
+    assert len(table.rule_keys) == 1
+
+    del rule_set
+    gc.collect()
+    assert len(table.rule_keys) == 0
@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from config import pieces
+from server import RealizationServer, RequestError, parse_request
+
+PIECES_DIR = Path(__file__).resolve().parent.parent / 'test_pieces'
+
+
+def test_parse_request():
+    assert parse_request('{"id": 1, "path": "a.musicxml"}') == {'id': 1, 'path': 'a.musicxml'}
+    assert parse_request('{"path": "a.musicxml", "beam_width": 4}')['beam_width'] == 4
+    for line in ['not json', '[1]', '{"id": 1}', '{"path": "a.musicxml", "musicxml": "<score/>"}',
+                 '{"path": "a.musicxml", "beam_width": 0}', '{"path": "a.musicxml", "beam_width": "4"}']:
+        with pytest.raises(RequestError):
+            parse_request(line)
+
+
+def test_serve_lines():
+    path = PIECES_DIR / pieces['test_maat']['path']
+    lines = [
+        json.dumps({'id': 1, 'path': str(path), 'start': 0, 'end': 2}),
+        json.dumps({'id': 2, 'musicxml': path.read_text(), 'start': 0, 'end': 2}),
+        json.dumps({'id': 3}),
+    ]
+    responses = []
+    with RealizationServer(jobs=2) as server:
+        server.serve_lines(lines, responses.append)
+
+    responses = {response['id']: response for response in map(json.loads, responses)}
+    assert responses[1]['musicxml'] == responses[2]['musicxml']
+    assert responses[1]['musicxml'].startswith('<?xml')
+    assert responses[3]['error'].startswith('RequestError')
+
+
+def test_timed_out_realization_frees_its_worker():
+    path = PIECES_DIR / pieces['test_maat']['path']
+    with RealizationServer(jobs=1) as server:
+        worker = server.workers[0]
+        response = server.respond(json.dumps({'id': 1, 'path': str(path), 'timeout': 0}))
+        assert response['error'].startswith('TimeoutError')
+        assert not worker.process.is_alive()
+
+        response = server.respond(json.dumps({'id': 2, 'path': str(path), 'start': 0, 'end': 2, 'timeout': 60}))
+        assert response['musicxml'].startswith('<?xml')
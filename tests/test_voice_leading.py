@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from music21.pitch import Pitch
+
+import voice_leading
+
+
+def matrix(*possibilities):
+    return voice_leading.possibility_matrix([[Pitch(name) for name in names] for names in possibilities])
+
+
+@pytest.mark.parametrize('previous, following, expected', [
+    (('G4', 'C4'), ('A4', 'D4'), True),
+    (('G4', 'C4'), ('A5', 'D4'), True),
+    (('G4', 'C4'), ('A4', 'D3'), True),
+    (('G4', 'C#4'), ('A4', 'D4'), False),
+    (('G4', 'C4'), ('Ab4', 'D4'), False),
+    (('G4', 'C4'), ('F3', 'C4'), False),  # oblique motion, the upper voice crossing the lower
+    (('G4', 'C4'), ('F3', 'C5'), False),  # the lower voice leaps an octave
+    (('G4', 'C4'), ('D4', 'A4'), False),  # the voices cross, the fifth becomes a fourth
+])
+def test_parallel_fifths(previous, following, expected):
+    assert voice_leading.parallel_fifths(matrix(previous), matrix(following))[0, 0] == expected
+
+
+@pytest.mark.parametrize('previous, following, expected', [
+    (('F4', 'C4'), ('A4', 'D4'), True),
+    (('F4', 'C4'), ('A5', 'D4'), True),
+    (('F4', 'C4'), ('A4', 'D3'), False),
+    (('F4', 'C4'), ('Ab4', 'D4'), False),
+])
+def test_hidden_fifths(previous, following, expected):
+    assert voice_leading.hidden_fifths(matrix(previous), matrix(following))[0, 0] == expected
+
+
+def test_transition_matrix():
+    previous = matrix(('G4', 'C4'), ('F4', 'C4'), ('E4', 'C4'))
+    following = matrix(('A4', 'D4'), ('D4', 'A4'), ('F4', 'D4'))
+
+    costs = voice_leading.transition_costs(previous, following, {
+        voice_leading.parallel_fifths: 1,
+        voice_leading.hidden_fifths: 10,
+        voice_leading.voice_crossing: 100,
+    })
+
+    assert previous.dtype == np.int16
+    assert costs.tolist() == [
+        [1, 100, 0],  # crossing voices do not form parallel fifths
+        [10, 100, 0],
+        [10, 100, 0],
+    ]
+    assert voice_leading.leap_size(previous, following)[0].tolist() == [2, 9, 2]
+
+
+def test_optimal_path():
+    local_costs = [np.array([0, 1]), np.array([5, 0, 0]), np.array([0, 0])]
+    transitions = [np.array([[0, 9, 1], [0, 0, 9]]), np.array([[0, 3], [9, 9], [2, 9]])]
+
+    path, cost = voice_leading.optimal_path(local_costs, transitions)
+
+    assert (path, cost) == ([0, 2, 0], 3.0)
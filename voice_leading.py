@@ -0,0 +1,145 @@
+"""
+Voice-leading costs of all transitions between the possibilities of consecutive segments at once.
+
+The possibilities of a segment are stacked into an int16 matrix of pitch space values, one row per possibility and
+one column per voice. A rule then compares every possibility of one segment with every possibility of the next by
+broadcasting the two matrices to (previous, next, voice) arrays, instead of comparing one pair of Possibility objects
+at a time. The resulting (previous, next) cost matrices are the transitions of optimal_path, which finds the cheapest
+realization with one min-plus product per segment.
+
+Voices are compared pairwise without assuming an order of the voices in a possibility, like the rules in
+music21.improvedFiguredBass.rules.
+"""
+from itertools import combinations
+
+import numpy as np
+
+PERFECT_FIFTH = 7
+OCTAVE = 0
+
+
+def possibility_matrix(possibilities):
+    """The pitch space values (middle C is 60) of the possibilities as an int16 matrix, a row per possibility."""
+    rows = [[p.ps for p in getattr(possibility, 'pitches', possibility)] for possibility in possibilities]
+    return np.array(rows, dtype=np.int16).reshape(len(rows), -1)
+
+
+def voice_pairs(n_voices):
+    """Index arrays of the two voices of every pair of voices."""
+    pairs = np.array(list(combinations(range(n_voices), 2)), dtype=np.intp).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def transitions(previous, following):
+    """Broadcasts the matrices to (previous, next, voice) arrays."""
+    return previous[:, None, :].astype(np.int32), following[None, :, :].astype(np.int32)
+
+
+def intervals(possibilities):
+    """The interval in semitones between the voices of every pair, (..., pair) shaped."""
+    first, second = voice_pairs(possibilities.shape[-1])
+    return np.abs(possibilities[..., first] - possibilities[..., second])
+
+
+def motion(previous, following):
+    """The motion of the voices, (previous, next, voice) shaped."""
+    return following - previous
+
+
+def consecutive(previous, following, interval_class):
+    """
+    Whether some pair of voices forms interval_class (modulo octaves) in both possibilities while both voices move to
+    other pitch classes without crossing each other. A pair that stays on the same pitch classes repeats the interval,
+    and a pair that crosses inverts it.
+    """
+    previous, following = transitions(previous, following)
+    first, second = voice_pairs(previous.shape[-1])
+    both = (intervals(previous) % 12 == interval_class) & (intervals(following) % 12 == interval_class)
+    moved = (previous[..., first] % 12 != following[..., first] % 12) & (
+        previous[..., second] % 12 != following[..., second] % 12
+    )
+    before = np.sign(previous[..., first] - previous[..., second])
+    after = np.sign(following[..., first] - following[..., second])
+    return np.any(both & moved & (before * after >= 0), axis=-1)
+
+
+def parallel_fifths(previous, following):
+    """(previous, next) matrix of whether the transition has consecutive perfect fifths."""
+    return consecutive(previous, following, PERFECT_FIFTH)
+
+
+def parallel_octaves(previous, following):
+    """(previous, next) matrix of whether the transition has consecutive octaves or unisons."""
+    return consecutive(previous, following, OCTAVE)
+
+
+def hidden(previous, following, interval_class):
+    """Whether some pair of voices moves in similar motion into interval_class from another interval."""
+    previous, following = transitions(previous, following)
+    first, second = voice_pairs(previous.shape[-1])
+    moves = np.sign(motion(previous, following))
+    similar = (moves[..., first] == moves[..., second]) & (moves[..., first] != 0)
+    into = (intervals(following) % 12 == interval_class) & (intervals(previous) % 12 != interval_class)
+    return np.any(similar & into, axis=-1)
+
+
+def hidden_fifths(previous, following):
+    """(previous, next) matrix of whether the transition approaches a perfect fifth in similar motion."""
+    return hidden(previous, following, PERFECT_FIFTH)
+
+
+def hidden_octaves(previous, following):
+    """(previous, next) matrix of whether the transition approaches an octave in similar motion."""
+    return hidden(previous, following, OCTAVE)
+
+
+def voice_crossing(previous, following):
+    """(previous, next) matrix of whether two voices swap places."""
+    previous, following = transitions(previous, following)
+    first, second = voice_pairs(previous.shape[-1])
+    before = np.sign(previous[..., first] - previous[..., second])
+    after = np.sign(following[..., first] - following[..., second])
+    return np.any(before * after < 0, axis=-1)
+
+
+def leap_size(previous, following):
+    """(previous, next) matrix of the largest motion of a voice in semitones."""
+    previous, following = transitions(previous, following)
+    return np.abs(motion(previous, following)).max(axis=-1, initial=0)
+
+
+def large_leaps(previous, following, limit=7):
+    """(previous, next) matrix of the number of voices leaping by more than limit semitones."""
+    previous, following = transitions(previous, following)
+    return np.sum(np.abs(motion(previous, following)) > limit, axis=-1)
+
+
+def transition_costs(previous, following, weights):
+    """
+    The weighted sum of the rules in weights, a mapping from the rule functions above to their cost, for every
+    transition from a possibility in previous to one in following.
+    """
+    costs = np.zeros((len(previous), len(following)))
+    for rule, cost in weights.items():
+        costs += cost * rule(previous, following)
+    return costs
+
+
+def optimal_path(local_costs, transition_matrices):
+    """
+    Returns the index of the chosen possibility of every segment and the total cost of the cheapest path, given the
+    cost of every possibility of every segment and the (previous, next) transition cost matrices between consecutive
+    segments.
+    """
+    total = np.asarray(local_costs[0], dtype=float)
+    back_pointers = []
+    for local, transition in zip(local_costs[1:], transition_matrices):
+        candidates = total[:, None] + transition
+        best = np.argmin(candidates, axis=0)
+        back_pointers.append(best)
+        total = candidates[best, np.arange(len(best))] + local
+
+    path = [int(np.argmin(total))]
+    for best in reversed(back_pointers):
+        path.append(int(best[path[-1]]))
+    return path[::-1], float(total.min())